@@ -0,0 +1,164 @@
+import asyncio
+import fcntl
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List
+
+# Record = 4-byte big-endian length + zlib-compressed JSON document
+_HEADER = struct.Struct(">I")
+_SEGMENT_SUFFIX = ".seg"
+
+
+def _segment_name(day: datetime) -> str:
+    return f"conversations-{day:%Y%m%d}{_SEGMENT_SUFFIX}"
+
+
+class ConversationArchive:
+    """
+    Cold storage for idle conversations on local disk.
+
+    Conversations are appended, compressed, to one segment file per UTC
+    day and never rewritten; a SQLite index maps each sender to its latest
+    record. Old segments are dropped whole by ``purge``. All methods do
+    blocking I/O: call the ``*_async`` variants from the event loop.
+
+    Several replicas may share the directory (e.g. over NFS): appends
+    hold an exclusive ``flock`` on the segment, and the index uses
+    SQLite's rollback journal, which relies on file locks only, instead
+    of WAL's shared memory.
+    """
+
+    def __init__(self, directory: str | Path, compression_level: int = 6):
+        """
+        Args:
+            directory: Where segments and the index live (created if missing)
+            compression_level: zlib level for each record
+        """
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._level = compression_level
+        self._lock = threading.Lock()
+        # Wait for another replica's write transaction instead of failing with "database is locked"
+        self._db = sqlite3.connect(self._dir / "index.sqlite3", timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " sender TEXT PRIMARY KEY, segment TEXT NOT NULL, offset INTEGER NOT NULL,"
+            " length INTEGER NOT NULL, archived_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS conversations_segment ON conversations (segment)")
+        self._db.commit()
+
+    def store_many(self, conversations: Iterable[tuple[str, List[dict]]]) -> int:
+        """
+        Append conversations to today's segment and index them.
+
+        Records are fsynced before the index is committed, so an indexed
+        record is always readable. The segment stays locked until then, so
+        a replica appending to the same segment cannot interleave records.
+
+        Returns:
+            Number of conversations stored
+        """
+        now = time.time()
+        segment = _segment_name(datetime.fromtimestamp(now, timezone.utc))
+        with self._lock:
+            rows = []
+            with open(self._dir / segment, "ab") as handle:
+                # Offsets are only valid while no other process appends
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                offset = handle.seek(0, os.SEEK_END)
+                for sender, messages in conversations:
+                    document = json.dumps({"sender": sender, "archived_at": now, "messages": messages})
+                    record = zlib.compress(document.encode("utf-8"), self._level)
+                    handle.write(_HEADER.pack(len(record)) + record)
+                    rows.append((sender, segment, offset + _HEADER.size, len(record), now))
+                    offset += _HEADER.size + len(record)
+                handle.flush()
+                os.fsync(handle.fileno())
+                with self._db:
+                    self._db.executemany(
+                        "INSERT INTO conversations (sender, segment, offset, length, archived_at)"
+                        " VALUES (?, ?, ?, ?, ?) ON CONFLICT(sender) DO UPDATE SET"
+                        " segment=excluded.segment, offset=excluded.offset,"
+                        " length=excluded.length, archived_at=excluded.archived_at",
+                        rows,
+                    )
+        return len(rows)
+
+    def load(self, sender: str) -> List[dict] | None:
+        """Return the latest archived conversation of ``sender``, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT segment, offset, length FROM conversations WHERE sender = ?", (sender,)
+            ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length = row
+        try:
+            with open(self._dir / segment, "rb") as handle:
+                handle.seek(offset)
+                record = handle.read(length)
+        except FileNotFoundError:
+            return None
+        return json.loads(zlib.decompress(record))["messages"]
+
+    def delete(self, sender: str):
+        """Forget a sender; its record stays in the segment until the segment is purged."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM conversations WHERE sender = ?", (sender,))
+
+    def purge(self, retention_days: int) -> int:
+        """
+        Delete segments older than ``retention_days`` along with their index rows.
+
+        Returns:
+            Number of segment files removed
+        """
+        cutoff = _segment_name(datetime.now(timezone.utc) - timedelta(days=retention_days))
+        removed = 0
+        with self._lock:
+            for path in sorted(self._dir.glob(f"*{_SEGMENT_SUFFIX}")):
+                if path.name >= cutoff:
+                    break
+                with self._db:
+                    self._db.execute("DELETE FROM conversations WHERE segment = ?", (path.name,))
+                path.unlink()
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            (senders,) = self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()
+        segments = list(self._dir.glob(f"*{_SEGMENT_SUFFIX}"))
+        return {
+            "senders": senders,
+            "segments": len(segments),
+            "bytes": sum(path.stat().st_size for path in segments),
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    async def store_many_async(self, conversations: List[tuple[str, List[dict]]]) -> int:
+        return await asyncio.to_thread(self.store_many, conversations)
+
+    async def load_async(self, sender: str) -> List[dict] | None:
+        return await asyncio.to_thread(self.load, sender)
+
+    async def delete_async(self, sender: str):
+        await asyncio.to_thread(self.delete, sender)
+
+    async def purge_async(self, retention_days: int) -> int:
+        return await asyncio.to_thread(self.purge, retention_days)
+
+    async def stats_async(self) -> dict:
+        return await asyncio.to_thread(self.stats)
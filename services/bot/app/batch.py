@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import List
+
+from .llm import BATCH_FAILED, BATCH_FINAL_STATES, BatchRequest, ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+
+class BatchError(RuntimeError):
+    """Raised into a job's future when its batch request failed or returned no result."""
+
+
+class BatchCollector:
+    """
+    Runs non-urgent generation jobs through the provider batch API.
+
+    Jobs (summaries, evaluation replays, re-engagement drafts) queue here
+    instead of calling the LLM in real time. Queued jobs are submitted
+    in bulk, one batch per model, when ``max_batch_size`` is reached or the
+    oldest job has waited ``flush_interval``; a background task polls the
+    outstanding batches and resolves each job's future with its
+    ``ChatCompletion``. Batches cost half as much as real-time calls and
+    finish within 24 hours.
+
+    Jobs are kept in memory: after a restart the provider still finishes
+    (and bills) submitted batches, but their results are not dispatched.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        max_batch_size: int = 1000,
+        flush_interval: float = 60.0,
+        poll_interval: float = 30.0,
+    ):
+        """
+        Args:
+            llm_client: Client exposing ``submit_batch``, ``batch_status`` and ``batch_results``
+            max_batch_size: Jobs per submitted batch
+            flush_interval: Longest a queued job waits before its batch is submitted
+            poll_interval: Seconds between status checks of outstanding batches
+        """
+        self._llm = llm_client
+        self._max_batch_size = max_batch_size
+        self._flush_interval = flush_interval
+        self._poll_interval = poll_interval
+        self._pending: List[tuple[BatchRequest, asyncio.Future]] = []
+        self._oldest_pending: float | None = None
+        # batch id -> custom_id -> future
+        self._outstanding: dict[str, dict[str, asyncio.Future]] = {}
+        # Flushes awaiting the provider; their batches are not outstanding yet
+        self._flushing = 0
+        self._task: asyncio.Task | None = None
+        self._counts = {"submitted_jobs": 0, "submitted_batches": 0, "completed_jobs": 0, "failed_jobs": 0}
+
+    async def submit(
+        self,
+        messages: List[dict],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] = (),
+    ) -> asyncio.Future:
+        """
+        Queue a generation job.
+
+        Returns:
+            Future resolved with a ``ChatCompletion``, or failed with ``BatchError``
+        """
+        future = asyncio.get_running_loop().create_future()
+        request = BatchRequest(
+            custom_id=uuid.uuid4().hex, messages=messages, model=model, max_tokens=max_tokens,
+            temperature=temperature, stop=tuple(stop or ()),
+        )
+        self._pending.append((request, future))
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        if len(self._pending) >= self._max_batch_size:
+            await self.flush()
+        return future
+
+    async def flush(self) -> List[str]:
+        """Submit every queued job now; returns the new batch ids."""
+        pending, self._pending, self._oldest_pending = self._pending, [], None
+        by_model: dict[str | None, list] = defaultdict(list)
+        for request, future in pending:
+            by_model[request.model].append((request, future))
+
+        batch_ids = []
+        self._flushing += 1
+        try:
+            await self._submit_groups(by_model.values(), batch_ids)
+        finally:
+            self._flushing -= 1
+        return batch_ids
+
+    async def _submit_groups(self, groups, batch_ids: List[str]):
+        for jobs in groups:
+            for start in range(0, len(jobs), self._max_batch_size):
+                chunk = jobs[start:start + self._max_batch_size]
+                try:
+                    batch_id = await self._llm.submit_batch([request for request, _ in chunk])
+                except Exception as exc:
+                    logger.warning("Batch submission of %s jobs failed: %s", len(chunk), exc.__class__.__name__)
+                    self._fail([future for _, future in chunk], f"submission failed: {exc.__class__.__name__}")
+                    continue
+                self._outstanding[batch_id] = {request.custom_id: future for request, future in chunk}
+                self._counts["submitted_jobs"] += len(chunk)
+                self._counts["submitted_batches"] += 1
+                batch_ids.append(batch_id)
+                logger.info("Submitted batch %s with %s jobs", batch_id, len(chunk))
+
+    async def poll(self) -> int:
+        """Check outstanding batches once and dispatch finished ones; returns jobs dispatched."""
+        dispatched = 0
+        for batch_id in list(self._outstanding):
+            try:
+                status = await self._llm.batch_status(batch_id)
+                if status not in BATCH_FINAL_STATES:
+                    continue
+                results = await self._llm.batch_results(batch_id)
+            except Exception as exc:
+                # Transient API errors: try again on the next poll
+                logger.warning("Polling batch %s failed: %s", batch_id, exc.__class__.__name__)
+                continue
+
+            futures = self._outstanding.pop(batch_id)
+            for result in results:
+                future = futures.pop(result.custom_id, None)
+                if future is None or future.done():
+                    continue
+                if result.completion is not None:
+                    future.set_result(result.completion)
+                    self._counts["completed_jobs"] += 1
+                else:
+                    self._fail([future], result.error or "unknown error")
+                dispatched += 1
+            reason = "batch failed" if status == BATCH_FAILED else "no result returned"
+            dispatched += len(futures)
+            self._fail(list(futures.values()), reason)
+            logger.info("Batch %s finished (%s)", batch_id, status)
+        return dispatched
+
+    async def drain(self):
+        """Submit everything queued and wait until every outstanding batch is dispatched."""
+        await self.flush()
+        while self._outstanding or self._flushing:
+            await asyncio.sleep(self._poll_interval)
+            if self._pending:
+                await self.flush()
+            await self.poll()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self._poll_interval, self._flush_interval))
+            try:
+                if self._oldest_pending is not None and time.monotonic() - self._oldest_pending >= self._flush_interval:
+                    await self.flush()
+                await self.poll()
+            except Exception:
+                logger.exception("Batch collector iteration failed")
+
+    def _fail(self, futures: List[asyncio.Future], reason: str):
+        for future in futures:
+            if not future.done():
+                future.set_exception(BatchError(reason))
+                self._counts["failed_jobs"] += 1
+
+    def stats(self) -> dict:
+        return {
+            **self._counts,
+            "queued_jobs": len(self._pending),
+            "outstanding_batches": len(self._outstanding),
+        }
+
+
+async def complete_in_batch(collector: BatchCollector, messages: List[dict], model: str | None = None,
+                            max_tokens: int | None = None, temperature: float | None = None,
+                            stop: tuple[str, ...] = ()) -> ChatCompletion:
+    """Queue a job and wait for its result (may take hours)."""
+    future = await collector.submit(messages, model=model, max_tokens=max_tokens, temperature=temperature, stop=stop)
+    return await future
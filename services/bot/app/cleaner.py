@@ -1,11 +1,118 @@
 import re
+import unicodedata
 
+TRUNCATE_HEAD = "head"
+TRUNCATE_TAIL = "tail"
+TRUNCATE_MIDDLE = "middle"
+TRUNCATION_POLICIES = (TRUNCATE_HEAD, TRUNCATE_TAIL, TRUNCATE_MIDDLE)
+TRUNCATION_MARKER = "…"
 
-def clean_text(text: str) -> str:
+# Raw input scanned per output char allowed; whitespace runs rarely exceed it
+_SCAN_FACTOR = 4
+
+_ZWJ = "\u200d"
+# Invisible characters that only hide or reorder text: zero-width space,
+# word joiner, BOM, soft hyphen, Mongolian vowel separator, LRM/RLM and
+# bidi embeddings/isolates. ZWJ and ZWNJ stay: emoji sequences and
+# several scripts need them.
+_INVISIBLE = "\u200b\u2060\ufeff\u00ad\u180e\u200e\u200f\u202a\u202b\u202c\u202d\u202e\u2066\u2067\u2068\u2069"
+# C0/C1 control characters become spaces so they cannot glue words together
+_CONTROLS = [*range(0x00, 0x20), *range(0x7F, 0xA0)]
+_TRANSLATION = str.maketrans({**dict.fromkeys(map(ord, _INVISIBLE)), **dict.fromkeys(_CONTROLS, " ")})
+# Anything split() alone would not handle; absent from almost every message
+_SPECIAL_RE = re.compile(f"[\\x00-\\x1f\\x7f-\\x9f{_INVISIBLE}]")
+
+# Code points that attach to the previous one; never cut right before them
+_EXTENDERS = frozenset(
+    [_ZWJ, "\ufe0e", "\ufe0f", "\u20e3"]  # joiner, variation selectors, keycap
+    + [chr(c) for c in range(0x1F3FB, 0x1F400)]  # skin tone modifiers
+    + [chr(c) for c in range(0xE0020, 0xE0080)]  # emoji tag sequences
+)
+
+
+def _is_regional_indicator(char: str) -> bool:
+    return "\U0001F1E6" <= char <= "\U0001F1FF"
+
+
+def _safe_cut(text: str, index: int) -> int:
+    """Move ``index`` left until it does not split a grapheme (accent, emoji sequence, flag)."""
+    while 0 < index < len(text) and (
+        text[index] in _EXTENDERS or text[index - 1] == _ZWJ or unicodedata.combining(text[index])
+    ):
+        index -= 1
+    if 0 < index < len(text) and _is_regional_indicator(text[index]):
+        # Flags are pairs of regional indicators: keep an even run before the cut
+        start = index
+        while start > 0 and _is_regional_indicator(text[start - 1]):
+            start -= 1
+        if (index - start) % 2:
+            index -= 1
+    return index
+
+
+def _head(text: str, length: int) -> str:
+    """First ``length`` chars of ``text``, shortened to a grapheme boundary."""
+    return text if len(text) <= length else text[:_safe_cut(text, length)]
+
+
+def _tail(text: str, length: int) -> str:
+    """Last ``length`` chars of ``text``, shortened to a grapheme boundary."""
+    if len(text) <= length:
+        return text
+    start = len(text) - length
+    while start < len(text) and _safe_cut(text, start) != start:
+        start += 1
+    return text[start:]
+
+
+def _normalize(text: str) -> str:
+    if not text.isascii() and not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    if _SPECIAL_RE.search(text):
+        text = text.translate(_TRANSLATION)
+    # str.split() collapses every Unicode whitespace run and trims in C
+    return " ".join(text.split())
+
+
+def clean_text(text: str, max_chars: int | None = None, truncation: str = TRUNCATE_HEAD) -> str:
+    """
+    Normalize user text before intents, memory and the LLM see it.
+
+    Text is NFC-normalized, invisible formatting characters are dropped,
+    control characters and any whitespace run collapse to one space, and
+    the result is trimmed. Emoji, including ZWJ sequences, are preserved.
+
+    Args:
+        text: Raw message text
+        max_chars: Longest result; ``None`` disables the limit. Only about
+            ``_SCAN_FACTOR`` times this much raw input is processed, so huge
+            pastes cost the same as a long message.
+        truncation: Part kept when over the limit: 'head', 'tail' or
+            'middle' (start and end); the cut is marked with an ellipsis
+
+    Returns:
+        Cleaned text, at most ``max_chars`` characters
+    """
     if not text:
         return ""
-    # Normalize whitespace
-    s = re.sub(r"\s+", " ", text).strip()
-    # Remove control characters
-    s = re.sub(r"[\x00-\x1F\x7F]+", "", s)
-    return s
+    if truncation not in TRUNCATION_POLICIES:
+        raise ValueError(f"truncation must be one of {TRUNCATION_POLICIES}, got {truncation!r}")
+    if max_chars is None:
+        return _normalize(text)
+
+    budget = max(max_chars, 1) * _SCAN_FACTOR
+    oversized = len(text) > budget
+    if not oversized:
+        text = _normalize(text)
+        if len(text) <= max_chars:
+            return text
+
+    room = max(0, max_chars - len(TRUNCATION_MARKER))
+    head_room = room if truncation == TRUNCATE_HEAD else room - room // 2 if truncation == TRUNCATE_MIDDLE else 0
+    tail_room = room - head_room
+    head = tail = ""
+    if head_room:
+        head = _head(_normalize(_head(text, budget)) if oversized else text, head_room)
+    if tail_room:
+        tail = _tail(_normalize(_tail(text, budget)) if oversized else text, tail_room)
+    return (head.rstrip() + TRUNCATION_MARKER + tail.lstrip()).strip()
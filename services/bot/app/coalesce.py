@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable, List, TypeVar
+
+from redis.asyncio import Redis
+
+from .redis_backend import sender_key
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The leader stores its result before releasing the flight lock, so a
+# waiter that sees the lock gone and no result knows the leader failed.
+_FINISH_SCRIPT = """
+redis.call('set', KEYS[2], ARGV[2], 'PX', ARGV[3])
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', KEYS[1])
+end
+return 1
+"""
+
+_ABANDON_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def request_key(
+    messages: List[dict],
+    model: str,
+    max_tokens: int | None,
+    temperature: float | None = None,
+    stop: tuple[str, ...] = (),
+) -> str:
+    """Stable hash of everything that determines an LLM response."""
+    payload = json.dumps(
+        {"model": model, "max_tokens": max_tokens, "temperature": temperature, "stop": list(stop or ()),
+         "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one upstream call.
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight await the same result (or exception) instead of issuing their
+    own. Nothing is cached once the call finishes. With ``redis``, the
+    first replica to claim a key (SET NX) runs the call and publishes the
+    result under a short-lived key that waiters on other replicas poll;
+    when the leader fails, dies or is too slow, waiters fall back to their
+    own call. Redis errors also fall back, so coalescing never blocks a reply.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        encode: Callable[[object], str] = json.dumps,
+        decode: Callable[[str], object] = json.loads,
+        lock_ttl_ms: int = 60_000,
+        result_ttl_ms: int = 5_000,
+        wait_timeout: float = 30.0,
+        poll_interval: float = 0.05,
+    ):
+        """
+        Args:
+            redis: Shared Redis client for cross-replica coalescing; None keeps it in-process
+            encode: Serializes a result for other replicas
+            decode: Inverse of ``encode``
+            lock_ttl_ms: Lease of a replica's claim on a key; must exceed the slowest call
+            result_ttl_ms: How long a published result stays readable for waiters
+            wait_timeout: Longest a waiter on another replica polls before calling itself
+            poll_interval: Polling interval of waiters on other replicas
+        """
+        self._redis = redis
+        self._encode = encode
+        self._decode = decode
+        self._lock_ttl_ms = lock_ttl_ms
+        self._result_ttl_ms = result_ttl_ms
+        self._wait_timeout = wait_timeout
+        self._poll_interval = poll_interval
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._counts: Counter = Counter()
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """
+        Run ``call`` once per concurrent ``key``.
+
+        Returns:
+            (result, shared): ``shared`` is True when another caller's upstream
+            call produced the result, so this caller incurred no upstream cost
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                # Shield: a cancelled waiter must not cancel the leader's call
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader itself was cancelled (client gone): make our own call
+                self._counts["fallbacks"] += 1
+                return await call(), False
+            self._counts["shared_local"] += 1
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self._redis is None:
+                result, shared = await call(), False
+            else:
+                result, shared = await self._run_across_replicas(key, call)
+            future.set_result(result)
+            self._counts["shared_remote" if shared else "upstream_calls"] += 1
+            return result, shared
+        except Exception as exc:
+            future.set_exception(exc)
+            # Local waiters receive the error; mark it retrieved for the leader's own raise
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_across_replicas(self, key: str, call: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        lock, result_key = sender_key("flight", key), sender_key("flightresult", key)
+        owner = uuid.uuid4().hex
+        try:
+            claimed = await self._redis.set(lock, owner, nx=True, px=self._lock_ttl_ms)
+        except Exception as exc:
+            logger.warning("Single-flight claim failed: %s", exc.__class__.__name__)
+            self._counts["redis_errors"] += 1
+            return await call(), False
+
+        if not claimed:
+            raw = await self._wait_for_result(lock, result_key)
+            if raw is not None:
+                return self._decode(raw), True
+            self._counts["fallbacks"] += 1
+            return await call(), False
+
+        try:
+            result = await call()
+        except BaseException:
+            await self._quietly(self._redis.eval(_ABANDON_SCRIPT, 1, lock, owner))
+            raise
+        await self._quietly(self._redis.eval(
+            _FINISH_SCRIPT, 2, lock, result_key, owner, self._encode(result), self._result_ttl_ms
+        ))
+        return result, False
+
+    async def _wait_for_result(self, lock: str, result_key: str) -> str | None:
+        deadline = time.monotonic() + self._wait_timeout
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self._poll_interval)
+                raw = await self._redis.get(result_key)
+                if raw is not None:
+                    return raw.decode() if isinstance(raw, bytes) else raw
+                if not await self._redis.exists(lock):
+                    # Leader gave up (error) without a result; re-check once for a race
+                    raw = await self._redis.get(result_key)
+                    return raw.decode() if isinstance(raw, bytes) else raw
+        except Exception as exc:
+            logger.warning("Single-flight wait failed: %s", exc.__class__.__name__)
+            self._counts["redis_errors"] += 1
+        return None
+
+    async def _quietly(self, awaitable):
+        try:
+            await awaitable
+        except Exception as exc:
+            logger.warning("Single-flight publish failed: %s", exc.__class__.__name__)
+            self._counts["redis_errors"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "cross_replica": self._redis is not None,
+            "in_flight": len(self._inflight),
+            "upstream_calls": self._counts["upstream_calls"],
+            "shared_local": self._counts["shared_local"],
+            "shared_remote": self._counts["shared_remote"],
+            "fallbacks": self._counts["fallbacks"],
+            "redis_errors": self._counts["redis_errors"],
+        }
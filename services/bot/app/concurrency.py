@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter driven by measured LLM latency.
+
+    The limit grows by roughly one slot per "round" of fast, successful calls
+    while the limiter is actually being used, and shrinks multiplicatively
+    when a call fails or exceeds the target latency. Callers over the limit
+    wait in a short priority queue (ongoing conversations first) and are shed
+    when the queue is full or the wait times out.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 2,
+        max_limit: int = 128,
+        target_latency: float = 8.0,
+        backoff: float = 0.75,
+        queue_timeout: float = 2.0,
+        max_queue: int = 64,
+    ):
+        """
+        Args:
+            initial_limit: Concurrent calls allowed before any measurement
+            min_limit: Floor for the adaptive limit
+            max_limit: Ceiling for the adaptive limit
+            target_latency: Latency (seconds) above which a call counts as congestion
+            backoff: Multiplicative decrease factor applied on congestion
+            queue_timeout: Maximum seconds a request waits for a slot
+            max_queue: Maximum number of waiting requests before shedding
+        """
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._target_latency = target_latency
+        self._backoff = backoff
+        self._queue_timeout = queue_timeout
+        self._max_queue = max_queue
+        self._in_flight = 0
+        # Heap of [rank, seq, future]; rank 0 = ongoing conversation, 1 = new sender
+        self._waiters: list[list] = []
+        self._seq = itertools.count()
+        self._last_decrease = float("-inf")
+        self._shed = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "shed_total": self._shed,
+        }
+
+    async def acquire(self, priority: bool = False, timeout: float | None = None) -> bool:
+        """
+        Wait for a processing slot.
+
+        Args:
+            priority: True for senders with an ongoing conversation
+            timeout: Override for the configured queue timeout (seconds)
+
+        Returns:
+            True if a slot was granted (caller must ``release``), False if shed
+        """
+        if self._in_flight < self.limit and self.queue_depth == 0:
+            self._in_flight += 1
+            return True
+
+        if self.queue_depth >= self._max_queue and not (priority and self._evict_new_sender()):
+            self._shed += 1
+            return False
+
+        if len(self._waiters) > 2 * self._max_queue:
+            self._waiters = [entry for entry in self._waiters if not entry[2].done()]
+            heapq.heapify(self._waiters)
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [0 if priority else 1, next(self._seq), fut])
+        wait = self._queue_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait({fut}, timeout=wait)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.result():
+                self.release(success=True)
+            else:
+                fut.cancel()
+            raise
+
+        if not fut.done():
+            fut.cancel()
+            self._shed += 1
+            return False
+        if not fut.result():
+            self._shed += 1
+            return False
+        return True
+
+    def release(self, latency: float | None = None, success: bool = True):
+        """
+        Return a slot and feed the call outcome into the AIMD controller.
+
+        Args:
+            latency: Measured LLM latency in seconds (None skips adaptation)
+            success: False if the call failed (treated as congestion)
+        """
+        if latency is not None or not success:
+            self._adapt(latency, success)
+        self._in_flight = max(0, self._in_flight - 1)
+        self._wake()
+
+    def _adapt(self, latency: float | None, success: bool):
+        congested = not success or (latency is not None and latency > self._target_latency)
+        if congested:
+            # Many in-flight calls see the same slowdown; decrease once per window
+            now = time.monotonic()
+            if now - self._last_decrease >= self._target_latency:
+                self._limit = max(self._min_limit, self._limit * self._backoff)
+                self._last_decrease = now
+        elif self._in_flight * 2 >= self._limit:
+            self._limit = min(self._max_limit, self._limit + 1 / self._limit)
+
+    def _wake(self):
+        while self._waiters and self._in_flight < self.limit:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._in_flight += 1
+            fut.set_result(True)
+
+    def _evict_new_sender(self) -> bool:
+        """Shed the most recent waiting new sender to make room for a priority one."""
+        candidates = [entry for entry in self._waiters if entry[0] == 1 and not entry[2].done()]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda entry: entry[1])
+        victim[2].set_result(False)
+        return True
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List
+
+from redis.exceptions import ClusterDownError, ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean Redis is unreachable, as opposed to a bad command or script
+REDIS_DOWN_ERRORS = (RedisConnectionError, RedisTimeoutError, ClusterDownError, OSError, asyncio.TimeoutError)
+
+
+class RedisHealth:
+    """
+    Tracks whether Redis is reachable, for components with a local fallback.
+
+    A background task pings Redis every ``interval`` seconds; ``failures``
+    consecutive failed pings mark it down. Components also call
+    ``report_failure`` when a command fails with a connection error, which
+    marks it down at once instead of waiting for the next ping. The first
+    successful ping after that marks it up again and runs the recovery
+    callbacks (write-back of buffered state) in their own task, so a long
+    write-back does not delay the next pings.
+    """
+
+    def __init__(self, redis, interval: float = 1.0, timeout: float = 0.5, failures: int = 2):
+        """
+        Args:
+            redis: Shared Redis client (single node, cluster or sharded)
+            interval: Seconds between pings
+            timeout: Seconds a ping may take before it counts as failed
+            failures: Consecutive failed pings that mark Redis down
+        """
+        self._redis = redis
+        self._interval = interval
+        self._timeout = timeout
+        self._failures = failures
+        self._consecutive = 0
+        self._available = True
+        self._down_since: float | None = None
+        self._outages = 0
+        self._recovery: List[Callable[[], Awaitable[None]]] = []
+        self._task: asyncio.Task | None = None
+        self._recovering: asyncio.Task | None = None
+
+    @property
+    def available(self) -> bool:
+        return self._available
+
+    def on_recovery(self, callback: Callable[[], Awaitable[None]]):
+        """Run ``callback`` (a coroutine function) each time Redis comes back."""
+        self._recovery.append(callback)
+
+    def report_failure(self, exc: BaseException | None = None):
+        if self._available:
+            self._mark_down(exc.__class__.__name__ if exc is not None else "reported")
+
+    def _mark_down(self, reason: str):
+        self._available = False
+        self._down_since = time.monotonic()
+        self._outages += 1
+        logger.warning("Redis unavailable (%s): using local fallback", reason)
+
+    async def check(self) -> bool:
+        """Ping once and update the state; returns whether Redis answered."""
+        try:
+            ok = bool(await asyncio.wait_for(self._redis.ping(), timeout=self._timeout))
+        except Exception:
+            ok = False
+        if ok:
+            self._consecutive = 0
+            if not self._available:
+                self._available = True
+                logger.info("Redis available again after %.1fs", time.monotonic() - self._down_since)
+                # Skipped while a previous recovery still runs; the periodic write-back retry covers the rest
+                if self._recovery and (self._recovering is None or self._recovering.done()):
+                    self._recovering = asyncio.get_running_loop().create_task(self._run_recovery())
+        else:
+            self._consecutive += 1
+            if self._available and self._consecutive >= self._failures:
+                self._mark_down("ping failed")
+        return ok
+
+    async def _run_recovery(self):
+        for callback in self._recovery:
+            try:
+                await callback()
+            except Exception:
+                logger.exception("Redis recovery callback failed")
+
+    async def wait_recovered(self):
+        """Wait for the recovery callbacks started by the last recovery, if any are running."""
+        if self._recovering is not None:
+            await asyncio.shield(self._recovering)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._recovering):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._recovering = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.check()
+
+    def stats(self) -> dict:
+        return {
+            "available": self._available,
+            "down_for_seconds": None if self._available else round(time.monotonic() - self._down_since, 1),
+            "outages": self._outages,
+        }
+
+
+class LocalConversationStore:
+    """
+    Conversations kept in process while Redis is down.
+
+    An LRU bounded by entries, with a TTL per conversation. Besides the
+    current history, each entry remembers the messages appended during the
+    outage (``pending``) so they can be written back to Redis. Evicting or
+    expiring an entry with pending messages loses them; that is counted.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries: Conversations kept; the least recently used is evicted
+            ttl: Seconds a conversation is kept after its last write
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        # conv_id -> (messages, pending messages, expires at)
+        self._entries: OrderedDict[str, tuple[list, list, float]] = OrderedDict()
+        self.lost_pending = 0
+
+    def _live(self, conv_id: str) -> tuple[list, list, float] | None:
+        entry = self._entries.get(conv_id)
+        if entry is None:
+            return None
+        if entry[2] <= time.monotonic():
+            self._drop(conv_id)
+            return None
+        self._entries.move_to_end(conv_id)
+        return entry
+
+    def _drop(self, conv_id: str):
+        entry = self._entries.pop(conv_id, None)
+        if entry is not None and entry[1]:
+            self.lost_pending += len(entry[1])
+            logger.warning("Local fallback dropped %d unsaved messages", len(entry[1]))
+
+    def get(self, conv_id: str) -> list | None:
+        entry = self._live(conv_id)
+        return list(entry[0]) if entry is not None else None
+
+    def seed(self, conv_id: str, messages: list):
+        """Start a conversation from a known history (e.g. the memory cache) with nothing pending."""
+        if self._live(conv_id) is None:
+            self._put(conv_id, list(messages), [])
+
+    def append(self, conv_id: str, message: dict, max_messages: int) -> list:
+        """Append ``message``, keep the last ``max_messages`` and mark it for write-back."""
+        entry = self._live(conv_id)
+        messages, pending = (entry[0], entry[1]) if entry is not None else ([], [])
+        messages = (messages + [message])[-max_messages:]
+        pending = pending + [message]
+        self._put(conv_id, messages, pending)
+        return messages
+
+    def _put(self, conv_id: str, messages: list, pending: list):
+        self._entries[conv_id] = (messages, pending, time.monotonic() + self._ttl)
+        self._entries.move_to_end(conv_id)
+        while len(self._entries) > self._max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def has_pending(self, conv_id: str) -> bool:
+        entry = self._entries.get(conv_id)
+        return entry is not None and bool(entry[1])
+
+    def pending(self, conv_id: str) -> list:
+        entry = self._entries.get(conv_id)
+        return list(entry[1]) if entry is not None else []
+
+    def pending_ids(self) -> List[str]:
+        return [conv_id for conv_id, entry in self._entries.items() if entry[1]]
+
+    def discard(self, conv_id: str):
+        """Forget a conversation once its pending messages are in Redis."""
+        self._entries.pop(conv_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._entries),
+            "pending_conversations": len(self.pending_ids()),
+            "lost_pending_messages": self.lost_pending,
+        }
+
+
+class LocalRateLimiter:
+    """Per-replica fixed-window counter with the same contract as ``RateLimiter.check_rate_limit``."""
+
+    def __init__(self, max_requests: int = 10, window_seconds: int = 60, max_entries: int = 100_000):
+        """
+        Args:
+            max_requests: Maximum requests per sender in the window
+            window_seconds: Window length in seconds
+            max_entries: Senders tracked; the oldest windows are dropped first
+        """
+        self._max_requests = max_requests
+        self._window_seconds = window_seconds
+        self._max_entries = max_entries
+        # sender -> (window start, count), oldest window first
+        self._windows: OrderedDict[str, tuple[float, int]] = OrderedDict()
+
+    def check_rate_limit(self, user_id: str) -> tuple[bool, int, int]:
+        now = time.monotonic()
+        started, count = self._windows.get(user_id, (now, 0))
+        if now - started >= self._window_seconds:
+            started, count = now, 0
+        count += 1
+        self._windows[user_id] = (started, count)
+        if count == 1:
+            self._windows.move_to_end(user_id)
+            while len(self._windows) > self._max_entries:
+                self._windows.popitem(last=False)
+        return count <= self._max_requests, count, self._max_requests
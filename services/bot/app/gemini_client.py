@@ -4,9 +4,48 @@ from typing import List
 
 import httpx
 
+from .logs import Truncated
+from .llm import (
+    BATCH_COMPLETED,
+    BATCH_FAILED,
+    BATCH_PENDING,
+    BATCH_RUNNING,
+    BatchRequest,
+    BatchResult,
+    ChatCompletion,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TEMPERATURE,
+    FINISH_LENGTH,
+    FINISH_STOP,
+)
+
+# generateContent accepts at most this many stop sequences
+MAX_STOP_SEQUENCES = 5
+
+# Gemini finishReason values mapped to the normalized ones
+_FINISH_REASONS = {"STOP": FINISH_STOP, "MAX_TOKENS": FINISH_LENGTH}
+
 logger = logging.getLogger(__name__)
 
 
+def _to_gemini_parts(content) -> list[dict]:
+    """Map a message content (text or OpenAI-style content parts) to Gemini parts."""
+    if isinstance(content, str) or content is None:
+        text = (content or "").strip()
+        return [{"text": text}] if text else []
+
+    parts = []
+    for part in content:
+        if part.get("type") == "text" and (part.get("text") or "").strip():
+            parts.append({"text": part["text"].strip()})
+        elif part.get("type") == "image_url":
+            url = part.get("image_url", {}).get("url", "")
+            if url.startswith("data:") and ";base64," in url:
+                header, data = url.split(";base64,", 1)
+                parts.append({"inline_data": {"mime_type": header[len("data:"):], "data": data}})
+    return parts
+
+
 class GeminiClient:
     def __init__(self, api_key: str | None = None, model: str | None = None, base_url: str | None = None):
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
@@ -14,54 +53,197 @@ class GeminiClient:
         self.base_url = base_url or os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY is required for Gemini provider")
+        self._http: httpx.AsyncClient | None = None
+        # Batch name -> model, to label results
+        self._batch_models: dict[str, str] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        # One pooled client per LLM client: building one costs ~30 ms of CPU
+        # (SSL context) and a fresh connection for every call
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=30.0)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def chat(
+        self,
+        messages: List[dict],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> str:
+        return (await self.complete(messages, model=model, max_tokens=max_tokens, temperature=temperature, stop=stop)).text
+
+    async def complete(
+        self,
+        messages: List[dict],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> ChatCompletion:
+        """Like ``chat`` but also returns the model used, token usage and finish reason."""
+        model = model or self.model
+        payload = self._build_payload(messages, max_tokens, temperature, stop)
+        url = f"{self.base_url}/models/{model}:generateContent"
+        response = await self._client().post(url, json=payload, headers=self._headers())
+        response.raise_for_status()
+        return self._parse_response(response.json(), model)
+
+    async def list_models(self) -> List[str]:
+        """Model names visible to the API key (first page); a cheap authenticated call used by the readiness check."""
+        response = await self._client().get(f"{self.base_url}/models", params={"pageSize": 50}, headers=self._headers())
+        response.raise_for_status()
+        return [item["name"] for item in response.json().get("models", [])]
+
+    def _headers(self) -> dict:
+        # Pass key as header to avoid exposing it in URLs/logs
+        return {
+            "x-goog-api-key": self.api_key,
+            "Content-Type": "application/json",
+        }
 
-    async def chat(self, messages: List[dict]) -> str:
+    @staticmethod
+    def _build_payload(
+        messages: List[dict],
+        max_tokens: int | None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> dict:
         system_parts: list[str] = []
         contents: list[dict] = []
 
         for message in messages:
-            text = (message.get("content") or "").strip()
-            if not text:
-                continue
-
             role = message.get("role", "user")
             if role == "system":
-                system_parts.append(text)
+                text = (message.get("content") or "").strip()
+                if text:
+                    system_parts.append(text)
                 continue
 
+            parts = _to_gemini_parts(message.get("content"))
+            if not parts:
+                continue
             gemini_role = "user" if role == "user" else "model"
-            contents.append({"role": gemini_role, "parts": [{"text": text}]})
+            contents.append({"role": gemini_role, "parts": parts})
 
         payload: dict = {
             "contents": contents,
             "generationConfig": {
-                "temperature": 0.2,
-                "maxOutputTokens": 800,
+                "temperature": DEFAULT_TEMPERATURE if temperature is None else temperature,
+                "maxOutputTokens": max_tokens or DEFAULT_MAX_TOKENS,
             },
         }
+        if stop:
+            payload["generationConfig"]["stopSequences"] = list(stop)[:MAX_STOP_SEQUENCES]
 
         if system_parts:
             payload["system_instruction"] = {"parts": [{"text": "\n".join(system_parts)}]}
+        return payload
 
-        # Pass key as header to avoid exposing it in URLs/logs
-        url = f"{self.base_url}/models/{self.model}:generateContent"
-        headers = {
-            "x-goog-api-key": self.api_key,
-            "Content-Type": "application/json",
-        }
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
+    @staticmethod
+    def _parse_response(data, model: str) -> ChatCompletion:
         candidates = data.get("candidates") if isinstance(data, dict) else None
+        usage = (data.get("usageMetadata") if isinstance(data, dict) else None) or {}
+        result = ""
+        finish_reason = None
         if candidates and len(candidates) > 0:
+            raw_reason = candidates[0].get("finishReason")
+            finish_reason = _FINISH_REASONS.get(raw_reason, raw_reason)
+            if finish_reason == FINISH_LENGTH:
+                logger.info("Gemini reply cut off at max_tokens")
             parts = candidates[0].get("content", {}).get("parts", [])
             texts = [part.get("text", "") for part in parts if isinstance(part, dict)]
             result = "".join(texts).strip()
             if not result:
                 logger.warning("Gemini returned empty response")
-            return result
+        else:
+            logger.warning("Gemini unexpected response structure: %s", Truncated(data))
+        return ChatCompletion(
+            text=result,
+            model=model,
+            prompt_tokens=usage.get("promptTokenCount"),
+            completion_tokens=usage.get("candidatesTokenCount"),
+            finish_reason=finish_reason,
+        )
+
+    # ── Batch mode (half price, results within 24 h) ──
+
+    async def submit_batch(self, requests: List[BatchRequest], display_name: str = "wa-gpt-bridge") -> str:
+        """
+        Submit requests as one inline batch job.
+
+        Gemini batches target a single model, so every request must share it.
+
+        Returns:
+            Batch name (``batches/...``) to poll with ``batch_status``
+        """
+        models = {request.model or self.model for request in requests}
+        if len(models) != 1:
+            raise ValueError(f"a Gemini batch targets one model, got {sorted(models)}")
+        (model,) = models
+        body = {
+            "batch": {
+                "display_name": display_name,
+                "input_config": {
+                    "requests": {
+                        "requests": [
+                            {
+                                "request": self._build_payload(
+                                    request.messages, request.max_tokens, request.temperature, request.stop
+                                ),
+                                "metadata": {"key": request.custom_id},
+                            }
+                            for request in requests
+                        ]
+                    }
+                },
+            }
+        }
+        response = await self._client().post(
+            f"{self.base_url}/models/{model}:batchGenerateContent", json=body, headers=self._headers()
+        )
+        response.raise_for_status()
+        name = response.json()["name"]
+        self._batch_models[name] = model
+        return name
+
+    async def _get_batch(self, batch_id: str) -> dict:
+        response = await self._client().get(f"{self.base_url}/{batch_id}", headers=self._headers())
+        response.raise_for_status()
+        return response.json()
+
+    async def batch_status(self, batch_id: str) -> str:
+        """Normalized state of a batch: pending, running, completed or failed."""
+        data = await self._get_batch(batch_id)
+        state = (data.get("metadata") or {}).get("state") or data.get("state") or ""
+        if state.endswith("SUCCEEDED"):
+            return BATCH_COMPLETED
+        if state.endswith(("FAILED", "CANCELLED", "EXPIRED")):
+            return BATCH_FAILED
+        if state.endswith("RUNNING"):
+            return BATCH_RUNNING
+        return BATCH_PENDING
 
-        logger.warning(f"Gemini unexpected response structure: {data}")
-        return ""
\ No newline at end of file
+    async def batch_results(self, batch_id: str) -> List[BatchResult]:
+        """Per-request results of a completed batch, keyed by ``custom_id``."""
+        data = await self._get_batch(batch_id)
+        model = self._batch_models.pop(batch_id, None) or (data.get("metadata") or {}).get("model", self.model)
+        model = model.removeprefix("models/")
+        output = data.get("response") or (data.get("metadata") or {}).get("output") or {}
+        inlined = output.get("inlinedResponses") or {}
+        if isinstance(inlined, dict):
+            inlined = inlined.get("inlinedResponses") or []
+        results = []
+        for item in inlined:
+            key = (item.get("metadata") or {}).get("key", "")
+            if item.get("error"):
+                results.append(BatchResult(key, error=str(item["error"].get("message") or item["error"])))
+            else:
+                results.append(BatchResult(key, completion=self._parse_response(item.get("response") or {}, model)))
+        return results
@@ -0,0 +1,180 @@
+import json
+import re
+import unicodedata
+from collections import Counter, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+from .router import assistant_asked_question
+
+# Canned replies are for short messages; longer ones skip the scan entirely
+MAX_MATCH_CHARS = 120
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    response: str
+    # Skip when the assistant's last turn was a question ("ok" then means "yes")
+    unless_pending_question: bool = False
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents, and reduce punctuation/emoji to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_WORD_RE.sub(" ", stripped).strip()
+
+
+class _Automaton:
+    """Aho-Corasick automaton over normalized phrases."""
+
+    def __init__(self, phrases: dict[str, int]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Per node: (phrase length, payload) for every phrase ending there
+        self._out: list[list[tuple[int, int]]] = [[]]
+        for phrase, payload in phrases.items():
+            node = 0
+            for char in phrase:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(phrase), payload))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> List[tuple[int, int, int]]:
+        """Return (start, end, payload) for every phrase occurrence; ``end`` is exclusive."""
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, payload in self._out[node]:
+                matches.append((index + 1 - length, index + 1, payload))
+        return matches
+
+
+class IntentMatcher:
+    """
+    Answers messages made *entirely* of known intent phrases with a template.
+
+    Phrases are compiled once into an Aho-Corasick automaton. A message
+    matches when whole-word phrase occurrences of a single intent tile every
+    word of the normalized text, so "hola" matches the greeting but
+    "hola, quiero una cotización" still goes to the LLM.
+    """
+
+    def __init__(self, intents: List[Intent], phrases: dict[str, List[str]]):
+        """
+        Args:
+            intents: Intents with their canned response
+            phrases: Intent name -> trigger phrases
+        """
+        self._intents = intents
+        index_by_name = {intent.name: i for i, intent in enumerate(intents)}
+        table: dict[str, int] = {}
+        for name, intent_phrases in phrases.items():
+            for phrase in intent_phrases:
+                normalized = normalize(phrase)
+                if normalized:
+                    table[normalized] = index_by_name[name]
+        self._automaton = _Automaton(table) if table else None
+        self._hits: Counter = Counter()
+
+    @classmethod
+    def from_file(cls, path: Path) -> "IntentMatcher":
+        """
+        Load the intent table; a missing file yields a matcher that never matches.
+
+        Expected format::
+
+            {"intents": [{"name": "...", "phrases": ["..."], "response": "...",
+                          "unless_pending_question": false}]}
+        """
+        if not path.exists():
+            return cls([], {})
+        data = json.loads(path.read_text(encoding="utf-8"))
+        intents, phrases = [], {}
+        for entry in data.get("intents", []):
+            intents.append(Intent(
+                name=entry["name"],
+                response=entry["response"],
+                unless_pending_question=bool(entry.get("unless_pending_question", False)),
+            ))
+            phrases[entry["name"]] = list(entry.get("phrases", []))
+        return cls(intents, phrases)
+
+    def __len__(self) -> int:
+        return len(self._intents)
+
+    def match(self, text: str, history: List[dict] | None = None) -> Intent | None:
+        """
+        Return the intent fully covering ``text`` (clean_text output), if any.
+
+        Args:
+            text: Cleaned user message
+            history: Conversation so far, used for ``unless_pending_question``
+        """
+        if self._automaton is None or len(text) > MAX_MATCH_CHARS * 2:
+            return None
+        normalized = normalize(text)
+        if not normalized or len(normalized) > MAX_MATCH_CHARS:
+            return None
+
+        # Keep whole-word occurrences only, indexed by start position
+        by_start: dict[int, list[tuple[int, int]]] = {}
+        size = len(normalized)
+        for start, end, payload in self._automaton.find(normalized):
+            if (start == 0 or normalized[start - 1] == " ") and (end == size or normalized[end] == " "):
+                by_start.setdefault(start, []).append((end, payload))
+
+        intent_index = self._tile(normalized, by_start)
+        if intent_index is None:
+            return None
+        intent = self._intents[intent_index]
+        if intent.unless_pending_question and assistant_asked_question(history or []):
+            return None
+        self._hits[intent.name] += 1
+        return intent
+
+    def stats(self) -> dict:
+        return {"intents": len(self._intents), "hits": dict(self._hits)}
+
+    @staticmethod
+    def _tile(text: str, by_start: dict[int, list[tuple[int, int]]]) -> int | None:
+        """Find an intent whose phrases cover the text word by word."""
+        for payload in sorted({payload for matches in by_start.values() for _, payload in matches}):
+            reachable = {0}
+            frontier = [0]
+            while frontier:
+                position = frontier.pop()
+                for end, match_payload in by_start.get(position, ()):
+                    if match_payload != payload:
+                        continue
+                    if end == len(text):
+                        return payload
+                    if end + 1 not in reachable:
+                        reachable.add(end + 1)
+                        frontier.append(end + 1)
+        return None
+
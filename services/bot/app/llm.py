@@ -0,0 +1,119 @@
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import List
+
+
+SUPPORTED_PROVIDERS = ("openai", "gemini")
+
+# Generation defaults when a caller passes no parameters
+DEFAULT_MAX_TOKENS = 800
+DEFAULT_TEMPERATURE = 0.2
+
+# Normalized finish reasons
+FINISH_STOP = "stop"
+FINISH_LENGTH = "length"
+
+# End of a sentence, list item or line: where a cut-off reply can be closed
+_SENTENCE_END_RE = re.compile(r"[.!?…)\]\n](?=\s|$)|[\U0001F300-\U0001FAFF\u2600-\u27BF](?=\s|$)")
+
+
+@dataclass(frozen=True)
+class ChatCompletion:
+    text: str
+    model: str
+    # Token usage as reported by the provider; None when it is not returned
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    # FINISH_STOP, FINISH_LENGTH (hit max_tokens) or the provider's own value
+    finish_reason: str | None = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "ChatCompletion":
+        return cls(**json.loads(raw))
+
+
+@dataclass(frozen=True)
+class BatchRequest:
+    custom_id: str
+    messages: List[dict]
+    model: str | None = None
+    max_tokens: int | None = None
+    temperature: float | None = None
+    stop: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    custom_id: str
+    completion: ChatCompletion | None = None
+    error: str | None = None
+
+
+# Provider batch states, normalized
+BATCH_PENDING = "pending"
+BATCH_RUNNING = "running"
+BATCH_COMPLETED = "completed"
+BATCH_FAILED = "failed"
+BATCH_FINAL_STATES = frozenset({BATCH_COMPLETED, BATCH_FAILED})
+
+
+def build_messages(system_prompt: str, history: List[dict], user_content) -> List[dict]:
+    """
+    Assemble the LLM payload for one turn: system prompt, history, new user message.
+
+    Shared by the webhook and the offline replay so both send exactly the same prompt.
+    """
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.extend(history)
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+def trim_to_sentence(text: str, min_ratio: float = 0.3) -> str:
+    """
+    Drop the unfinished tail of a reply cut off by ``max_tokens``.
+
+    The text is cut after its last sentence end (punctuation, closing
+    bracket, line break or emoji) as long as that keeps at least
+    ``min_ratio`` of it; otherwise it is returned with an ellipsis.
+    """
+    text = text.rstrip()
+    ends = [match.end() for match in _SENTENCE_END_RE.finditer(text)]
+    if ends and ends[-1] == len(text):
+        return text
+    if ends and ends[-1] >= len(text) * min_ratio:
+        return text[:ends[-1]].rstrip()
+    return text + "…" if text else text
+
+
+def create_llm_client(provider: str, model: str | None = None, base_url: str | None = None):
+    """
+    Build the LLM client for the configured provider.
+
+    Provider modules are imported lazily so only the selected client is
+    loaded at startup.
+
+    Args:
+        provider: 'openai' or 'gemini'
+        model: Optional model override (falls back to the provider env var)
+        base_url: Optional API base URL (e.g. a local fake server)
+
+    Returns:
+        An object exposing ``async chat(messages) -> str`` and
+        ``async complete(messages) -> ChatCompletion``
+    """
+    provider = (provider or "").lower()
+    if provider == "gemini":
+        from .gemini_client import GeminiClient
+        return GeminiClient(api_key=os.getenv("GOOGLE_API_KEY"), model=model, base_url=base_url)
+    if provider == "openai":
+        from .openai_client import OpenAIClient
+        return OpenAIClient(api_key=os.getenv("OPENAI_API_KEY"), model=model, base_url=base_url)
+    raise ValueError("Unsupported LLM_PROVIDER; use 'openai' or 'gemini'")
@@ -0,0 +1,249 @@
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+JSON = "json"
+TEXT = "text"
+LOG_FORMATS = (JSON, TEXT)
+
+# Tracebacks keep their last lines (where the error is) up to this size
+_MAX_TRACEBACK_CHARS = 8000
+# Incoming x-request-id values are reused only if they look like an id
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+_REQUEST_ID_HEADER = b"x-request-id"
+
+correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_correlation_id(value: str | None) -> Token:
+    return correlation_id.set(value)
+
+
+def _bounded(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}… [{len(text) - limit} chars truncated]"
+    return text
+
+
+class Truncated:
+    """
+    Log argument rendered as at most ``limit`` characters.
+
+    Rendering is deferred to the logging thread, so wrapping a large payload
+    (an unexpected API response) costs nothing on the event loop.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = 500):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return _bounded(str(self.value), self.limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, correlation_id, exc."""
+
+    def __init__(self, max_chars: int = 2000):
+        super().__init__()
+        self._max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _bounded(record.getMessage(), self._max_chars),
+        }
+        cid = getattr(record, "correlation_id", None)
+        if cid:
+            payload["correlation_id"] = cid
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)[-_MAX_TRACEBACK_CHARS:]
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic ``asctime - name - level - message`` line, with correlation id and size bound."""
+
+    def __init__(self, max_chars: int = 2000):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        self._max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _bounded(record.message, self._max_chars)
+        cid = getattr(record, "correlation_id", None)
+        if cid:
+            record.message = f"[{cid}] {record.message}"
+        return super().formatMessage(record)
+
+    def formatException(self, ei) -> str:
+        return super().formatException(ei)[-_MAX_TRACEBACK_CHARS:]
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps the caller's correlation id; runs on the logging call's thread/task."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """
+    Keeps ``rate`` of the requests' INFO/DEBUG lines.
+
+    The decision hashes the correlation id, so a sampled request keeps all
+    its lines and a dropped one loses them all. Warnings and errors, and
+    lines outside a request, are always kept.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self._threshold = int(rate * 10_000)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        cid = getattr(record, "correlation_id", None)
+        if record.levelno >= logging.WARNING or not cid:
+            return True
+        return zlib.crc32(cid.encode()) % 10_000 < self._threshold
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues records unformatted and never blocks.
+
+    The stock ``prepare`` formats the message on the caller's thread; here
+    the record keeps its ``msg``/``args`` and the listener thread formats
+    it. Arguments are therefore rendered shortly after the call, so pass
+    values rather than objects mutated right after logging. A full queue
+    drops the record and counts it instead of stalling the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.listener: QueueListener | None = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state: dict = {}
+
+
+def _stop(listener: QueueListener):
+    """Flush and stop ``listener`` unless it is already stopped."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def configure_logging(
+    level: str | int = "INFO",
+    fmt: str = JSON,
+    sample_rate: float = 1.0,
+    max_chars: int = 2000,
+    queue_size: int = 10_000,
+    stream=None,
+    logger: logging.Logger | None = None,
+) -> QueueListener:
+    """
+    Route logging through a queue so handler I/O runs on a background thread.
+
+    Args:
+        level: Minimum level of ``logger``
+        fmt: 'json' (one object per line) or 'text'
+        sample_rate: Share of requests whose INFO/DEBUG lines are kept (0-1)
+        max_chars: Longest rendered message; longer ones are truncated
+        queue_size: Records buffered before new ones are dropped
+        stream: Output stream (default stderr)
+        logger: Logger to configure (default root, which also takes over uvicorn's loggers)
+
+    Returns:
+        The running listener; it is stopped (and flushed) at interpreter exit
+    """
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"log format must be one of {LOG_FORMATS}, got {fmt!r}")
+    target = logger or logging.getLogger()
+    previous = _state.pop(target.name, None)
+    if previous is not None:
+        _stop(previous[1])
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = _DeferredQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+    if sample_rate < 1:
+        handler.addFilter(_SamplingFilter(sample_rate))
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(max_chars) if fmt == JSON else TextFormatter(max_chars))
+    listener = QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(_stop, listener)
+    handler.listener = listener
+
+    target.handlers = [handler]
+    target.setLevel(level)
+    if logger is None:
+        # uvicorn installs its own synchronous handlers; send its lines through the queue too
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            logging.getLogger(name).handlers = []
+            logging.getLogger(name).propagate = True
+    _state[target.name] = (handler, listener)
+    return listener
+
+
+def log_stats() -> dict:
+    """Records dropped because the logging queue was full, per configured logger."""
+    return {name or "root": {"dropped": handler.dropped, "queued": handler.queue.qsize()}
+            for name, (handler, _) in _state.items()}
+
+
+class CorrelationIdMiddleware:
+    """
+    ASGI middleware giving each HTTP request a correlation id.
+
+    A well-formed incoming ``x-request-id`` (e.g. from n8n or a load
+    balancer) is reused, otherwise a new id is generated; it is stamped on
+    every log line of the request and echoed in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = next((value for key, value in scope["headers"] if key == _REQUEST_ID_HEADER), b"").decode("latin-1")
+        cid = incoming if _REQUEST_ID_RE.match(incoming) else new_correlation_id()
+        token = correlation_id.set(cid)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (_REQUEST_ID_HEADER, cid.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
@@ -1,54 +1,365 @@
+import asyncio
+import hmac
+import json
 import os
+import time
+import uuid
 import logging
+from collections import Counter
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, Request, Header, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi import BackgroundTasks, FastAPI, Request, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from redis.asyncio import Redis
+from redis.asyncio.cluster import RedisCluster
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+from .logs import CorrelationIdMiddleware, configure_logging, correlation_id, log_stats
+
+# Configure logging: records are queued and written by a background thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))
+configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, sample_rate=LOG_SAMPLE_RATE, max_chars=LOG_MAX_CHARS)
 logger = logging.getLogger(__name__)
 # Prevent httpx from logging full URLs (which may contain credentials)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 from .validation import IncomingWhatsApp
-from .cleaner import clean_text
+from .cleaner import TRUNCATION_POLICIES, clean_text
 from .memory import ConversationMemory
-from .openai_client import OpenAIClient
-from .gemini_client import GeminiClient
+from .archive import ConversationArchive
 from .whatsapp_client import WhatsAppClient
 from .rate_limiter import RateLimiter
+from .llm import (
+    FINISH_LENGTH,
+    SUPPORTED_PROVIDERS,
+    ChatCompletion,
+    build_messages,
+    create_llm_client,
+    trim_to_sentence,
+)
+from .coalesce import SingleFlight, request_key
+from .concurrency import AdaptiveConcurrencyLimiter
+from .sender_lock import LockTimeout, SenderLock
+from .router import FAST, FULL, ModelRouter, ModelTier, check_stop_sequences, load_generation_overrides
+from .intents import IntentMatcher
+from .media import SUPPORTED_MEDIA_TYPES, MediaError, MediaInput, MediaProcessor, MediaUnsupported
+from .redis_backend import ShardedRedis, create_redis
+from .quota import ALLOW, REJECT, TokenQuota
+from .fallback import RedisHealth
+from .profiling import LoopLagMonitor, SamplingProfiler, SlowRequestRecorder, record_stage, stage
+from .probes import DEGRADED, OK, PENDING, DependencyProbe, parse_required
+from .meta_webhook import MessageDeduplicator, MetaMessage, MetaStatus, is_meta_payload, parse_events, verify_signature
 
+# A comma-separated list shards senders across several Redis nodes
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() in {"1", "true", "yes", "on"}
+# Conversations written before hash-tagged keys are moved on their first read; disable once they expired
+MEMORY_LEGACY_KEYS = os.getenv("MEMORY_LEGACY_KEYS", "true").lower() in {"1", "true", "yes", "on"}
+# While Redis is unreachable, memory, rate limiting and sender locks fall back to in-process state
+REDIS_FALLBACK = os.getenv("REDIS_FALLBACK", "true").lower() in {"1", "true", "yes", "on"}
+REDIS_FALLBACK_MAX_CONVERSATIONS = int(os.getenv("REDIS_FALLBACK_MAX_CONVERSATIONS", "10000"))
+REDIS_FALLBACK_TTL = float(os.getenv("REDIS_FALLBACK_TTL", "3600"))
+REDIS_HEALTH_INTERVAL = float(os.getenv("REDIS_HEALTH_INTERVAL", "1.0"))
+# Seconds between retries of write-backs that failed on recovery
+REDIS_WRITE_BACK_INTERVAL = float(os.getenv("REDIS_WRITE_BACK_INTERVAL", "30"))
+# Messages kept per conversation (Redis, cache and fallback) and sent to the LLM as history
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "20"))
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "5000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "300"))
+# Cold storage for idle conversations; empty keeps everything in Redis until the TTL
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_IDLE_SECONDS = float(os.getenv("ARCHIVE_IDLE_SECONDS", "7200"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "300"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "200"))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+ARCHIVE_LEADER_KEY = "archive:leader"
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
 BOT_SECRET = os.getenv("BOT_SECRET")
 WEBHOOK_VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN")
 ALLOW_DIRECT_META_WEBHOOK = os.getenv("ALLOW_DIRECT_META_WEBHOOK", "false").lower() in {"1", "true", "yes", "on"}
+# App secret of the Meta app: enables direct Meta deliveries signed with X-Hub-Signature-256
+META_APP_SECRET = os.getenv("META_APP_SECRET")
+META_DEDUP_TTL = int(os.getenv("META_DEDUP_TTL", "86400"))
+CONCURRENCY_INITIAL_LIMIT = int(os.getenv("CONCURRENCY_INITIAL_LIMIT", "16"))
+CONCURRENCY_MAX_LIMIT = int(os.getenv("CONCURRENCY_MAX_LIMIT", "128"))
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "2.0"))
+CONCURRENCY_MAX_QUEUE = int(os.getenv("CONCURRENCY_MAX_QUEUE", "64"))
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "8.0"))
+MODEL_TIERING = os.getenv("MODEL_TIERING", "true").lower() in {"1", "true", "yes", "on"}
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash-lite")
+FAST_MAX_TOKENS = int(os.getenv("FAST_MAX_TOKENS", "200"))
+FULL_MAX_TOKENS = int(os.getenv("FULL_MAX_TOKENS", "800"))
+# Unset or empty keeps the client default (0.2)
+FAST_TEMPERATURE = float(os.getenv("FAST_TEMPERATURE")) if os.getenv("FAST_TEMPERATURE") else None
+FULL_TEMPERATURE = float(os.getenv("FULL_TEMPERATURE")) if os.getenv("FULL_TEMPERATURE") else None
+# JSON list of strings that end generation on both tiers, e.g. ["\n\n\n"]
+LLM_STOP_SEQUENCES = check_stop_sequences(json.loads(os.getenv("LLM_STOP_SEQUENCES") or "[]"), "LLM_STOP_SEQUENCES")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "1024"))
+# Voice notes are off unless a transcriber is set (e.g. app.media:faster_whisper_engine)
+TRANSCRIBER = os.getenv("TRANSCRIBER") or None
+SENDER_LOCK_TTL_MS = int(os.getenv("SENDER_LOCK_TTL_MS", "60000"))
+SENDER_LOCK_TIMEOUT = float(os.getenv("SENDER_LOCK_TIMEOUT", "30.0"))
+# Longer messages (pasted documents) are cut before intents, memory and the LLM
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "4000"))
+INPUT_TRUNCATION = os.getenv("INPUT_TRUNCATION", "head").lower()
+# Per-sender daily LLM budget (0 disables); near it turns use the fast tier
+QUOTA_DAILY_TOKENS = int(os.getenv("QUOTA_DAILY_TOKENS", "0"))
+QUOTA_DAILY_USD = float(os.getenv("QUOTA_DAILY_USD", "0"))
+QUOTA_DOWNGRADE_RATIO = float(os.getenv("QUOTA_DOWNGRADE_RATIO", "0.8"))
+QUOTA_ON_EXCEEDED = os.getenv("QUOTA_ON_EXCEEDED", "reject").lower()
+# Identical concurrent prompts (broadcast replies) share one upstream call
+LLM_COALESCING = os.getenv("LLM_COALESCING", "true").lower() in {"1", "true", "yes", "on"}
+LLM_COALESCING_REDIS = os.getenv("LLM_COALESCING_REDIS", "false").lower() in {"1", "true", "yes", "on"}
+# JSON {"model": [usd_per_1m_prompt, usd_per_1m_completion]} on top of quota.DEFAULT_PRICES
+MODEL_PRICES = {model: tuple(price) for model, price in json.loads(os.getenv("MODEL_PRICES") or "{}").items()}
+# Webhook requests slower than this (ms) keep their stage breakdown; 0 disables
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "100"))
+# Seconds between event-loop lag measurements; 0 disables
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# /readyz serves dependency checks run in the background; the remote ones (LLM, WhatsApp) run less often
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "5"))
+PROBE_REMOTE_INTERVAL = float(os.getenv("PROBE_REMOTE_INTERVAL", "60"))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "2"))
+# Checks whose failure takes the replica out of rotation; the rest are only reported
+# (LLM and WhatsApp are shared by every replica: failing them takes all replicas out at once)
+READYZ_REQUIRED_CHECKS = parse_required(os.getenv("READYZ_REQUIRED_CHECKS", "redis"), ("redis", "llm", "whatsapp"))
+# Saturation limits for /readyz; 0 disables each
+READYZ_MAX_LOOP_LAG_MS = float(os.getenv("READYZ_MAX_LOOP_LAG_MS", "500"))
+READYZ_LAG_WINDOW = float(os.getenv("READYZ_LAG_WINDOW", "5"))
+READYZ_MAX_QUEUE_DEPTH = int(os.getenv("READYZ_MAX_QUEUE_DEPTH", str(CONCURRENCY_MAX_QUEUE // 2)))
+
+MEDIA_FAILED_MESSAGE = (
+    "No pude procesar tu archivo. "
+    "¿Podrías escribir tu mensaje en texto?"
+)
+VOICE_UNSUPPORTED_MESSAGE = (
+    "Por ahora no puedo escuchar notas de voz. "
+    "¿Podrías escribir tu mensaje en texto?"
+)
+QUOTA_MESSAGE = (
+    "Has alcanzado el límite diario de consultas. "
+    "Podrás seguir conversando mañana."
+)
+BUSY_MESSAGE = (
+    "Estamos ocupados en este momento. "
+    "Por favor intenta de nuevo en unos minutos."
+)
+
+if LLM_PROVIDER not in SUPPORTED_PROVIDERS:
+    raise ValueError("Unsupported LLM_PROVIDER; use 'openai' or 'gemini'")
+if INPUT_TRUNCATION not in TRUNCATION_POLICIES:
+    raise ValueError(f"Unsupported INPUT_TRUNCATION; use one of {', '.join(TRUNCATION_POLICIES)}")
 
-# Load system prompt
 PROMPT_PATH = Path(__file__).parent.parent / "prompts" / "system_prompt.txt"
-SYSTEM_PROMPT = PROMPT_PATH.read_text(encoding="utf-8").strip() if PROMPT_PATH.exists() else ""
+INTENTS_PATH = Path(os.getenv("INTENTS_PATH", str(PROMPT_PATH.parent / "intents.json")))
+GENERATION_PATH = Path(os.getenv("GENERATION_PATH", str(PROMPT_PATH.parent / "generation.json")))
+SYSTEM_PROMPT = ""
 
-app = FastAPI(title="wa-gpt-bridge-bot")
+# Runtime dependencies, built once per process by the lifespan handler
+redis_client: Redis | RedisCluster | ShardedRedis | None = None
+redis_health: RedisHealth | None = None
+memory: ConversationMemory | None = None
+archive: ConversationArchive | None = None
+rate_limiter: RateLimiter | None = None
+whatsapp_client: WhatsAppClient | None = None
+llm_client = None
+concurrency_limiter: AdaptiveConcurrencyLimiter | None = None
+sender_lock: SenderLock | None = None
+model_router: ModelRouter | None = None
+intent_matcher: IntentMatcher | None = None
+media_processor: MediaProcessor | None = None
+quota: TokenQuota | None = None
+single_flight: SingleFlight | None = None
+meta_dedup: MessageDeduplicator | None = None
+# Meta webhook events by kind (message:<type>, status:<status>)
+webhook_events: Counter = Counter()
+# In-process diagnostics; the lag monitor runs while the app is up
+loop_lag = LoopLagMonitor(interval=LOOP_LAG_INTERVAL)
+slow_requests = SlowRequestRecorder(threshold_ms=SLOW_REQUEST_MS, capacity=SLOW_REQUEST_BUFFER, lag_monitor=loop_lag)
+profiler = SamplingProfiler()
 
-memory = ConversationMemory(REDIS_URL)
-rate_limiter = RateLimiter(REDIS_URL, max_requests=10, window_seconds=60)
-whatsapp_client = WhatsAppClient(token=os.getenv("WHATSAPP_TOKEN"), phone_id=os.getenv("WHATSAPP_PHONE_ID"))
 
-if LLM_PROVIDER == "gemini":
-    llm_client = GeminiClient(api_key=os.getenv("GOOGLE_API_KEY"), model=GEMINI_MODEL)
-elif LLM_PROVIDER == "openai":
-    llm_client = OpenAIClient(api_key=os.getenv("OPENAI_API_KEY"), model=OPENAI_MODEL)
-else:
-    raise ValueError("Unsupported LLM_PROVIDER; use 'openai' or 'gemini'")
+def load_system_prompt(path: Path = PROMPT_PATH) -> str:
+    return path.read_text(encoding="utf-8").strip() if path.exists() else ""
+
+
+async def _archive_loop():
+    """Periodically move idle conversations to cold storage; one replica per cycle."""
+    owner = uuid.uuid4().hex
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        try:
+            if not await redis_client.set(ARCHIVE_LEADER_KEY, owner, nx=True, px=int(ARCHIVE_INTERVAL * 1000 * 0.9)):
+                continue
+            moved = await memory.archive_idle(ARCHIVE_IDLE_SECONDS, ARCHIVE_BATCH)
+            purged = await archive.purge_async(ARCHIVE_RETENTION_DAYS)
+            if moved or purged:
+                logger.info("Archived %d idle conversations, purged %d segments", moved, purged)
+        except Exception:
+            logger.exception("Conversation archiving failed")
+
+
+async def _write_back_sender(sender: str, fence: int | None) -> int:
+    """Write back one sender's buffered turns; the caller holds the sender lock."""
+    try:
+        return await memory.write_back(sender, fence=fence)
+    except Exception as e:
+        # Still pending: served locally and retried on the sender's next turn or the next retry cycle
+        logger.warning("Write-back failed for %s: %s", _mask_sender(sender), e.__class__.__name__)
+        return 0
+
+
+async def _write_back_fallback():
+    """Copy turns buffered during a Redis outage back to Redis, each under its sender's lock."""
+    pending = memory.pending_write_back()
+    written = 0
+    for sender in pending:
+        try:
+            async with sender_lock.hold(sender) as fence:
+                written += await _write_back_sender(sender, fence)
+        except Exception as e:
+            logger.warning("Write-back of %s postponed: %s", _mask_sender(sender), e.__class__.__name__)
+    if pending:
+        logger.info("Wrote back %d messages of %d conversations to Redis", written, len(pending))
+
+
+async def _write_back_loop():
+    """Retry write-backs that failed when Redis came back, while it stays up."""
+    while True:
+        await asyncio.sleep(REDIS_WRITE_BACK_INTERVAL)
+        if redis_health.available and memory.pending_write_back():
+            try:
+                await _write_back_fallback()
+            except Exception:
+                logger.exception("Write-back retry failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build shared dependencies at startup and release them on shutdown.
+
+    Memory and rate limiting share a single Redis client so each replica
+    opens one connection pool instead of one per component. That client is
+    a Redis Cluster or a client-side sharded set of nodes when configured.
+    """
+    global SYSTEM_PROMPT, redis_client, memory, rate_limiter, whatsapp_client, llm_client, concurrency_limiter
+    global sender_lock, model_router, intent_matcher, media_processor, archive, quota, single_flight, meta_dedup
+    global redis_health
+    started = time.perf_counter()
+
+    SYSTEM_PROMPT = load_system_prompt()
+    intent_matcher = IntentMatcher.from_file(INTENTS_PATH)
+    redis_client = create_redis(REDIS_URL, cluster=REDIS_CLUSTER)
+    redis_health = RedisHealth(redis_client, interval=REDIS_HEALTH_INTERVAL) if REDIS_FALLBACK else None
+    archive = ConversationArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+    memory = ConversationMemory(
+        redis=redis_client,
+        cache_max_entries=MEMORY_CACHE_MAX_ENTRIES,
+        cache_max_bytes=MEMORY_CACHE_MAX_BYTES,
+        cache_ttl=MEMORY_CACHE_TTL,
+        archive=archive,
+        health=redis_health,
+        fallback_max_entries=REDIS_FALLBACK_MAX_CONVERSATIONS,
+        fallback_ttl=REDIS_FALLBACK_TTL,
+        legacy_keys=MEMORY_LEGACY_KEYS,
+        max_messages=MEMORY_MAX_MESSAGES,
+    )
+    rate_limiter = RateLimiter(redis=redis_client, max_requests=10, window_seconds=60, health=redis_health)
+    sender_lock = SenderLock(
+        redis=redis_client, ttl_ms=SENDER_LOCK_TTL_MS, acquire_timeout=SENDER_LOCK_TIMEOUT, health=redis_health
+    )
+    quota = TokenQuota(
+        redis=redis_client,
+        daily_tokens=QUOTA_DAILY_TOKENS,
+        daily_cost=QUOTA_DAILY_USD,
+        downgrade_ratio=QUOTA_DOWNGRADE_RATIO,
+        on_exceeded=QUOTA_ON_EXCEEDED,
+        prices=MODEL_PRICES,
+    )
+    meta_dedup = MessageDeduplicator(redis=redis_client, ttl_seconds=META_DEDUP_TTL)
+    whatsapp_client = WhatsAppClient(token=os.getenv("WHATSAPP_TOKEN"), phone_id=os.getenv("WHATSAPP_PHONE_ID"))
+    media_processor = MediaProcessor(
+        whatsapp_client,
+        max_bytes=MEDIA_MAX_BYTES,
+        transcriber=TRANSCRIBER,
+        image_max_side=MEDIA_IMAGE_MAX_SIDE,
+        workers=MEDIA_WORKERS,
+    )
+    single_flight = SingleFlight(
+        redis=redis_client if LLM_COALESCING_REDIS else None,
+        encode=ChatCompletion.to_json,
+        decode=ChatCompletion.from_json,
+    ) if LLM_COALESCING else None
+    model = GEMINI_MODEL if LLM_PROVIDER == "gemini" else OPENAI_MODEL
+    fast_model = GEMINI_FAST_MODEL if LLM_PROVIDER == "gemini" else OPENAI_FAST_MODEL
+    llm_client = create_llm_client(LLM_PROVIDER, model=model)
+    model_router = ModelRouter(
+        fast=ModelTier(FAST, fast_model, FAST_MAX_TOKENS, FAST_TEMPERATURE, LLM_STOP_SEQUENCES),
+        full=ModelTier(FULL, model, FULL_MAX_TOKENS, FULL_TEMPERATURE, LLM_STOP_SEQUENCES),
+        enabled=MODEL_TIERING,
+        overrides=load_generation_overrides(GENERATION_PATH),
+    )
+    concurrency_limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=CONCURRENCY_INITIAL_LIMIT,
+        max_limit=CONCURRENCY_MAX_LIMIT,
+        target_latency=LLM_TARGET_LATENCY,
+        queue_timeout=CONCURRENCY_QUEUE_TIMEOUT,
+        max_queue=CONCURRENCY_MAX_QUEUE,
+    )
+
+    logger.info("Startup completed in %.1f ms (provider=%s)", (time.perf_counter() - started) * 1000, LLM_PROVIDER)
+    archiver = asyncio.create_task(_archive_loop()) if archive is not None else None
+    loop_lag.start()
+    dependency_probe.start()
+    write_back = None
+    if redis_health is not None:
+        redis_health.on_recovery(_write_back_fallback)
+        redis_health.start()
+        write_back = asyncio.create_task(_write_back_loop())
+    try:
+        yield
+    finally:
+        await dependency_probe.stop()
+        if write_back is not None:
+            write_back.cancel()
+            try:
+                await write_back
+            except asyncio.CancelledError:
+                pass
+        if redis_health is not None:
+            await redis_health.stop()
+        profiler.stop()
+        await loop_lag.stop()
+        if archiver is not None:
+            archiver.cancel()
+            try:
+                await archiver
+            except asyncio.CancelledError:
+                pass
+            archive.close()
+        media_processor.shutdown()
+        await whatsapp_client.aclose()
+        await llm_client.aclose()
+        await redis_client.aclose()
+
+
+app = FastAPI(title="wa-gpt-bridge-bot", lifespan=lifespan)
+app.add_middleware(CorrelationIdMiddleware)
 
 
 class WebhookResponse(BaseModel):
@@ -63,11 +374,96 @@ def _mask_sender(sender: str) -> str:
     return f"***{digits[-4:]}"
 
 
+def _whatsapp_configured() -> bool:
+    wa_token = whatsapp_client.token or ""
+    wa_phone = whatsapp_client.phone_id or ""
+    return (
+        bool(wa_token) and
+        bool(wa_phone) and
+        not wa_token.startswith("EAA_PEGA") and
+        not wa_phone.startswith("TU_PHONE")
+    )
+
+
+async def _check_redis() -> str:
+    if await memory.ping():
+        return OK
+    if redis_health is not None:
+        # Still answering from the local fallback
+        return DEGRADED
+    raise ConnectionError("Redis did not answer PING")
+
+
+async def _check_llm() -> str:
+    await llm_client.list_models()
+    return OK
+
+
+async def _check_whatsapp() -> str:
+    if not _whatsapp_configured():
+        raise RuntimeError("WhatsApp credentials not configured")
+    await whatsapp_client.check_credentials()
+    return OK
+
+
+dependency_probe = DependencyProbe(timeout=PROBE_TIMEOUT)
+dependency_probe.add("redis", _check_redis, interval=PROBE_INTERVAL, required="redis" in READYZ_REQUIRED_CHECKS)
+dependency_probe.add("llm", _check_llm, interval=PROBE_REMOTE_INTERVAL, required="llm" in READYZ_REQUIRED_CHECKS)
+dependency_probe.add(
+    "whatsapp", _check_whatsapp, interval=PROBE_REMOTE_INTERVAL, required="whatsapp" in READYZ_REQUIRED_CHECKS
+)
+
+
+def _load() -> tuple[dict, list[str]]:
+    """Current saturation of this replica and the limits it exceeds."""
+    now = time.perf_counter()
+    lag = loop_lag.max_lag_between(now - READYZ_LAG_WINDOW, now)
+    queue_depth = concurrency_limiter.queue_depth
+    load = {
+        "loop_lag_ms": lag,
+        "queue_depth": queue_depth,
+        "in_flight": concurrency_limiter.in_flight,
+        "log_queue": sum(entry["queued"] for entry in log_stats().values()),
+    }
+    exceeded = []
+    if READYZ_MAX_LOOP_LAG_MS > 0 and lag is not None and lag > READYZ_MAX_LOOP_LAG_MS:
+        exceeded.append("loop_lag")
+    if READYZ_MAX_QUEUE_DEPTH > 0 and queue_depth >= READYZ_MAX_QUEUE_DEPTH:
+        exceeded.append("queue_depth")
+    return load, exceeded
+
+
+@app.get("/livez")
+async def livez():
+    """Liveness: the process and its event loop answer. Never touches dependencies."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness for the load balancer, from cached dependency results and in-process load.
+
+    503 while a required check has not passed yet or failed on its last
+    run, or while event-loop lag or the LLM queue is over its limit.
+    """
+    load, exceeded = _load()
+    reasons = dependency_probe.blocking() + exceeded
+    body = {
+        "status": "not_ready" if reasons else "ready",
+        "reasons": reasons,
+        "checks": dependency_probe.results(),
+        "load": load,
+    }
+    return JSONResponse(body, status_code=503 if reasons else 200)
+
+
 @app.get("/health")
 async def health():
     """
     Health check endpoint with dependency verification.
-    Returns detailed status of critical components.
+    Returns detailed status of critical components; Redis comes from the
+    cached background check, so calling it never touches Redis.
     """
     status = {
         "status": "ok",
@@ -75,20 +471,16 @@ async def health():
         "checks": {}
     }
     
-    # Check Redis connectivity
-    redis_ok = await memory.ping()
-    status["checks"]["redis"] = "ok" if redis_ok else "failed"
+    # Redis connectivity, from the last background check
+    redis_status = dependency_probe.results()["redis"]["status"]
+    redis_ok = redis_status == OK
+    status["checks"]["redis"] = redis_status if redis_status in (OK, PENDING) else "failed"
+    if redis_health is not None:
+        # Conversations keep being answered from in-process state while Redis is down
+        status["checks"]["redis_fallback"] = "standby" if redis_health.available else "active"
     
     # Check WhatsApp credentials configuration using already-loaded client
-    wa_token = whatsapp_client.token or ""
-    wa_phone = whatsapp_client.phone_id or ""
-    whatsapp_configured = (
-        bool(wa_token) and
-        bool(wa_phone) and
-        not wa_token.startswith("EAA_PEGA") and
-        not wa_phone.startswith("TU_PHONE")
-    )
-    status["checks"]["whatsapp_credentials"] = "ok" if whatsapp_configured else "not_configured"
+    status["checks"]["whatsapp_credentials"] = "ok" if _whatsapp_configured() else "not_configured"
     
     # Overall health status
     if not redis_ok:
@@ -97,6 +489,67 @@ async def health():
     return status
 
 
+def _require_bot_secret(x_bot_secret: str | None):
+    if not BOT_SECRET:
+        logger.error("BOT_SECRET is not configured")
+        raise HTTPException(status_code=503, detail="service misconfigured")
+    if x_bot_secret != BOT_SECRET:
+        logger.warning("Unauthorized admin access attempt")
+        raise HTTPException(status_code=401, detail="invalid secret")
+
+
+@app.get("/stats")
+async def stats(x_bot_secret: str | None = Header(None)):
+    """Runtime counters: routing, intents, load shedding, cache, archive, LLM spend, coalescing, webhook, logging, latency."""
+    _require_bot_secret(x_bot_secret)
+    return {
+        "routing": model_router.stats(),
+        "intents": intent_matcher.stats(),
+        "concurrency": concurrency_limiter.stats(),
+        "memory_cache": memory.cache_stats(),
+        "archive": memory.archive_stats(),
+        "spend": await quota.spend(),
+        "coalescing": single_flight.stats() if single_flight is not None else {"enabled": False},
+        "webhook": dict(webhook_events),
+        "logging": log_stats(),
+        "slow_requests": slow_requests.stats(),
+        "loop_lag": loop_lag.stats(),
+        "redis_fallback": {
+            "health": redis_health.stats() if redis_health is not None else None,
+            **memory.fallback_stats(),
+        },
+    }
+
+
+@app.post("/admin/profile")
+async def profile(
+    seconds: float = Query(10, gt=0),
+    x_bot_secret: str | None = Header(None),
+):
+    """
+    Sample the event loop's stacks for ``seconds`` and return them collapsed for a flamegraph.
+
+    Feed the output to flamegraph.pl, speedscope or inferno. Only one
+    profile runs at a time per replica.
+    """
+    _require_bot_secret(x_bot_secret)
+    if seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=422, detail=f"seconds must be at most {PROFILE_MAX_SECONDS}")
+    try:
+        collapsed, samples = await profiler.profile(seconds)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="a profile is already running")
+    logger.info("Profiled event loop for %.1fs: %s samples", seconds, samples)
+    return PlainTextResponse(collapsed + "\n", headers={"x-profile-samples": str(samples)})
+
+
+@app.get("/admin/slow-requests")
+async def slow_request_log(limit: int = Query(50, ge=1), x_bot_secret: str | None = Header(None)):
+    """Recent webhook requests over SLOW_REQUEST_MS with their stage timings and event-loop lag, newest first."""
+    _require_bot_secret(x_bot_secret)
+    return {**slow_requests.stats(), "loop_lag": loop_lag.stats(), "requests": slow_requests.recent(limit)}
+
+
 @app.get("/webhook/whatsapp")
 async def whatsapp_verify(request: Request):
     """Meta webhook verification (hub.challenge handshake)."""
@@ -104,7 +557,7 @@ async def whatsapp_verify(request: Request):
     mode = params.get("hub.mode")
     challenge = params.get("hub.challenge")
     token = params.get("hub.verify_token")
-    logger.info(f"Webhook verification attempt: mode={mode}")
+    logger.info("Webhook verification attempt: mode=%s", mode)
     if mode == "subscribe" and challenge:
         if WEBHOOK_VERIFY_TOKEN and token != WEBHOOK_VERIFY_TOKEN:
             logger.warning("Webhook verification rejected: invalid verify token")
@@ -114,53 +567,144 @@ async def whatsapp_verify(request: Request):
 
 
 @app.post("/webhook/whatsapp", response_model=WebhookResponse)
-async def whatsapp_webhook(request: Request, x_bot_secret: str | None = Header(None)):
-    if not BOT_SECRET:
-        logger.error("BOT_SECRET is not configured")
+async def whatsapp_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_bot_secret: str | None = Header(None),
+    x_hub_signature_256: str | None = Header(None),
+):
+    """
+    Incoming messages, either straight from Meta or forwarded by n8n.
+
+    Meta deliveries are authenticated by their ``X-Hub-Signature-256`` HMAC
+    (``META_APP_SECRET``), acknowledged immediately and processed in the
+    background so Meta never times out and redelivers. Internal callers
+    (n8n, tests) authenticate with ``x-bot-secret`` and get the turn result.
+    """
+    with slow_requests.track("whatsapp_webhook"):
+        return await _receive(request, background_tasks, x_bot_secret, x_hub_signature_256)
+
+
+async def _receive(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_bot_secret: str | None,
+    x_hub_signature_256: str | None,
+) -> WebhookResponse:
+    """Authenticate, parse and dispatch one webhook delivery."""
+    if not BOT_SECRET and not META_APP_SECRET:
+        logger.error("Neither BOT_SECRET nor META_APP_SECRET is configured")
         raise HTTPException(status_code=503, detail="service misconfigured")
 
-    if x_bot_secret != BOT_SECRET:
-        logger.warning("Unauthorized webhook access attempt")
-        raise HTTPException(status_code=401, detail="invalid secret")
+    with stage("read_body"):
+        raw = await request.body()
+    with stage("auth"):
+        signed = bool(META_APP_SECRET) and x_hub_signature_256 is not None
+        if signed:
+            if not verify_signature(META_APP_SECRET, raw, x_hub_signature_256):
+                logger.warning("Webhook delivery with invalid Meta signature")
+                raise HTTPException(status_code=401, detail="invalid signature")
+        elif not BOT_SECRET or not hmac.compare_digest((x_bot_secret or "").encode(), BOT_SECRET.encode()):
+            logger.warning("Unauthorized webhook access attempt")
+            raise HTTPException(status_code=401, detail="invalid secret")
 
-    # Parse raw body — Meta sends nested payload, internal callers send simple one
-    try:
-        body = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail="invalid JSON")
+    with stage("parse"):
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid JSON")
 
-    # Detect Meta's native payload format
-    if "object" in body and "entry" in body:
-        if not ALLOW_DIRECT_META_WEBHOOK:
+    if is_meta_payload(body):
+        if not signed and not ALLOW_DIRECT_META_WEBHOOK:
             logger.warning("Direct Meta webhook payload rejected by policy")
             raise HTTPException(status_code=403, detail="direct webhook disabled")
-        try:
-            msg = body["entry"][0]["changes"][0]["value"]["messages"][0]
-            sender = msg["from"]
-            msg_type = msg.get("type", "")
-            if msg_type != "text":
-                logger.info(f"Ignoring non-text message type: {msg_type}")
-                return WebhookResponse(delivered=False, detail=f"unsupported type: {msg_type}")
-            text_body = msg["text"]["body"]
-        except (KeyError, IndexError, TypeError) as e:
-            # Could be a status update (delivery receipt, etc.) — ignore silently
-            logger.debug(f"Non-message webhook event ignored: {e}")
+        with stage("parse"):
+            messages, statuses = parse_events(body)
+        _record_statuses(statuses)
+        if meta_dedup is not None:
+            with stage("dedup"):
+                messages = [m for m in messages if await meta_dedup.first_delivery(m.message_id)]
+        if not messages:
             return WebhookResponse(delivered=False, detail="not a message event")
-    else:
-        # Internal format from n8n or tests: {"from": "...", "text": "..."}
-        try:
-            payload = IncomingWhatsApp(**body)
-            sender = payload.from_number
-            text_body = payload.text
-        except Exception:
-            raise HTTPException(status_code=422, detail="invalid payload")
+        if signed:
+            background_tasks.add_task(_handle_meta_messages, messages)
+            return WebhookResponse(delivered=False, detail=f"accepted {len(messages)} message(s)")
+        results = await _handle_meta_messages(messages)
+        failed = next((r for r in results if not r.delivered), None)
+        return failed or WebhookResponse(delivered=True)
+
+    # Internal format from n8n or tests: {"from": "...", "text": "..."}
+    try:
+        payload = IncomingWhatsApp(**body)
+    except Exception:
+        raise HTTPException(status_code=422, detail="invalid payload")
+    media = None
+    if payload.type in SUPPORTED_MEDIA_TYPES:
+        media = MediaInput(
+            type=payload.type,
+            media_id=payload.media_id,
+            mime_type=payload.mime_type,
+            caption=payload.caption,
+        )
+    elif payload.type != "text":
+        logger.info("Ignoring unsupported message type: %s", payload.type)
+        return WebhookResponse(delivered=False, detail=f"unsupported type: {payload.type}")
+    return await _handle_message(payload.from_number, payload.text or "", media)
+
+
+def _record_statuses(statuses: list[MetaStatus]):
+    """Count delivery receipts; failed sends are logged with Meta's error codes."""
+    for status in statuses:
+        webhook_events[f"status:{status.status}"] += 1
+        if status.status == "failed":
+            codes = [error.get("code") for error in status.errors]
+            logger.warning("WhatsApp could not deliver to %s: codes=%s", _mask_sender(status.recipient), codes)
+
+
+async def _handle_meta_messages(messages: list[MetaMessage]) -> list[WebhookResponse]:
+    """Process a delivery's messages: senders in parallel, each sender's messages in order."""
+    by_sender: dict[str, list[MetaMessage]] = {}
+    for message in messages:
+        by_sender.setdefault(message.sender, []).append(message)
 
-    text = clean_text(text_body)
+    delivery_id = correlation_id.get()
+
+    async def run(sender_messages: list[MetaMessage]) -> list[WebhookResponse]:
+        results = []
+        for message in sender_messages:
+            # Each message gets its own id (delivery id + wamid suffix) so its lines can be followed
+            correlation_id.set(f"{delivery_id}.{message.message_id[-8:]}" if delivery_id else message.message_id)
+            webhook_events[f"message:{message.type}"] += 1
+            if message.type != "text" and message.media is None:
+                logger.info("Ignoring unsupported message type: %s", message.type)
+                results.append(WebhookResponse(delivered=False, detail=f"unsupported type: {message.type}"))
+                continue
+            try:
+                # Background messages outlive the webhook request, so each is tracked on its own
+                with slow_requests.track("meta_message"):
+                    results.append(await _handle_message(message.sender, message.text, message.media))
+            except Exception as e:
+                # Background deliveries have no caller to report to
+                logger.error("Error handling message for %s: %s", _mask_sender(message.sender), e, exc_info=True)
+                results.append(WebhookResponse(delivered=False, detail="processing failed"))
+        return results
+
+    grouped = await asyncio.gather(*(run(group) for group in by_sender.values()))
+    return [result for results in grouped for result in results]
+
+
+async def _handle_message(sender: str, text_body: str, media: MediaInput | None = None) -> WebhookResponse:
+    """Clean, rate limit and run one incoming message under its sender's lock."""
+    with stage("clean"):
+        text = clean_text(text_body, max_chars=MAX_INPUT_CHARS, truncation=INPUT_TRUNCATION)
+    if len(text_body) > MAX_INPUT_CHARS:
+        logger.info("Long message from %s: %s chars, kept %s", _mask_sender(sender), len(text_body), len(text))
 
     # Rate limiting check
-    is_allowed, current_count, limit = await rate_limiter.check_rate_limit(sender)
+    with stage("rate_limit"):
+        is_allowed, current_count, limit = await rate_limiter.check_rate_limit(sender)
     if not is_allowed:
-        logger.warning(f"Rate limit exceeded for {_mask_sender(sender)}: {current_count}/{limit}")
+        logger.warning("Rate limit exceeded for %s: %s/%s", _mask_sender(sender), current_count, limit)
         rate_limit_msg = (
             "Has alcanzado el límite de mensajes. "
             f"Por favor espera un momento antes de enviar más mensajes. (Límite: {limit} mensajes por minuto)"
@@ -171,41 +715,155 @@ async def whatsapp_webhook(request: Request, x_bot_secret: str | None = Header(N
             pass  # Best effort notification
         return WebhookResponse(delivered=False, detail="rate limit exceeded")
 
-    logger.info(f"Processing message from {_mask_sender(sender)}. Provider: {LLM_PROVIDER}")
+    logger.info("Processing message from %s. Provider: %s", _mask_sender(sender), LLM_PROVIDER)
+
+    # Voice notes and images become text (and image parts) before the sender
+    # lock is taken: a long download or transcription must not outlive its lease
+    user_content = text
+    if media is not None:
+        try:
+            with stage("media"):
+                converted = await media_processor.process(media)
+        except MediaError as e:
+            logger.warning("Media from %s not processed: %s", _mask_sender(sender), e)
+            notice = VOICE_UNSUPPORTED_MESSAGE if isinstance(e, MediaUnsupported) else MEDIA_FAILED_MESSAGE
+            try:
+                await whatsapp_client.send_text_message(sender, notice)
+            except Exception:
+                pass  # Best effort notification
+            return WebhookResponse(delivered=False, detail="media processing failed")
+        text = clean_text(converted.text, max_chars=MAX_INPUT_CHARS, truncation=INPUT_TRUNCATION)
+        user_content = converted.llm_content
 
     try:
-        # 1. Assemble context
-        history = await memory.get_conversation(sender)
+        # Turns of the same sender run one at a time across replicas
+        lock_started = time.perf_counter()
+        async with sender_lock.hold(sender) as fence:
+            record_stage("sender_lock", lock_started)
+            return await _process_turn(sender, text, fence, user_content)
+    except LockTimeout:
+        logger.warning("Timed out waiting for sender lock of %s", _mask_sender(sender))
+        return WebhookResponse(delivered=False, detail="sender busy")
+    except Exception as e:
+        logger.error("Error processing message for %s: %s", _mask_sender(sender), e, exc_info=True)
+        return WebhookResponse(delivered=False, detail="processing failed")
 
-        # 2. Save user message to Redis
-        await memory.append_message(sender, "user", text)
 
-        # 3. Build messages payload
-        messages = []
-        if SYSTEM_PROMPT:
-            messages.append({"role": "system", "content": SYSTEM_PROMPT})
-        
-        messages.extend(history)
-        messages.append({"role": "user", "content": text})
+async def _complete(messages: list[dict], tier: ModelTier) -> tuple[ChatCompletion, bool]:
+    """Call the LLM, sharing the call with identical in-flight requests when coalescing is on."""
+    def call():
+        return llm_client.complete(
+            messages, model=tier.model, max_tokens=tier.max_tokens, temperature=tier.temperature, stop=tier.stop
+        )
 
-        # 4. Call LLM
-        logger.debug(f"Sending {len(messages)} messages to {LLM_PROVIDER}...")
-        resp = await llm_client.chat(messages)
-        assistant_text = resp.strip()
-        logger.info(f"Generated response for {_mask_sender(sender)} ({len(assistant_text)} chars)")
+    if single_flight is None:
+        return await call(), False
+    key = request_key(messages, tier.model, tier.max_tokens, temperature=tier.temperature, stop=tier.stop)
+    return await single_flight.run(key, call)
 
-        # 5. Save assistant response
-        await memory.append_message(sender, "assistant", assistant_text)
 
-        # 6. Send directly via WhatsApp
+async def _process_turn(
+    sender: str, text: str, fence: int, user_content: str | list | None = None
+) -> WebhookResponse:
+    """
+    Run one conversation turn; the caller holds the sender lock.
+
+    ``text`` is what memory and routing see; ``user_content`` is what the LLM
+    receives (image parts for media messages) and defaults to ``text``.
+    """
+    if user_content is None:
+        user_content = text
+
+    # 1. Assemble context; turns buffered in a past Redis outage go back to Redis first
+    with stage("history"):
+        if memory.needs_write_back(sender):
+            await _write_back_sender(sender, fence)
+        history = await memory.get_conversation(sender)
+
+    # 2. Greetings and keyword intents are answered from templates
+    with stage("intents"):
+        intent = intent_matcher.match(text, history)
+    if intent is not None:
+        logger.info("Canned reply for %s (intent=%s)", _mask_sender(sender), intent.name)
+        await memory.append_message(sender, "user", text, fence=fence)
+        await memory.append_message(sender, "assistant", intent.response, fence=fence)
         try:
-            await whatsapp_client.send_text_message(sender, assistant_text)
+            await whatsapp_client.send_text_message(sender, intent.response)
         except Exception as send_err:
-            logger.warning(f"Failed to send WhatsApp message to {_mask_sender(sender)}: {send_err}")
-            return WebhookResponse(delivered=False, detail="LLM OK, WhatsApp send failed")
-        
+            logger.warning("Failed to send WhatsApp message to %s: %s", _mask_sender(sender), send_err)
+            return WebhookResponse(delivered=False, detail="canned reply, WhatsApp send failed")
         return WebhookResponse(delivered=True)
 
-    except Exception as e:
-        logger.error(f"Error processing message for {_mask_sender(sender)}: {str(e)}", exc_info=True)
-        return WebhookResponse(delivered=False, detail="processing failed")
+    # 3. Senders over their daily LLM budget are stopped (or downgraded) before any work
+    with stage("quota"):
+        budget = await quota.check(sender)
+    if budget.action == REJECT:
+        logger.warning("Daily quota exhausted for %s: %s tokens", _mask_sender(sender), budget.tokens_used)
+        try:
+            await whatsapp_client.send_text_message(sender, QUOTA_MESSAGE)
+        except Exception:
+            pass  # Best effort notification
+        return WebhookResponse(delivered=False, detail="quota exceeded")
+
+    # 4. Wait for a processing slot; ongoing conversations are served first
+    with stage("concurrency_slot"):
+        acquired = await concurrency_limiter.acquire(priority=bool(history))
+    if not acquired:
+        logger.warning("Load shed for %s: %s", _mask_sender(sender), concurrency_limiter.stats())
+        try:
+            await whatsapp_client.send_text_message(sender, BUSY_MESSAGE)
+        except Exception:
+            pass  # Best effort notification
+        return WebhookResponse(delivered=False, detail="server busy")
+
+    llm_started = llm_latency = None
+    try:
+        # 5. Save user message to Redis
+        with stage("memory_write"):
+            await memory.append_message(sender, "user", text, fence=fence)
+
+        # 6. Build messages payload
+        messages = build_messages(SYSTEM_PROMPT, history, user_content)
+
+        # 7. Pick a model tier and call the LLM
+        route = model_router.route(text, history, downgrade=budget.action != ALLOW)
+        logger.info(
+            "Routing %s to %s tier (%s, reason=%s)",
+            _mask_sender(sender), route.tier.name, route.tier.model, route.reason,
+        )
+        logger.debug("Sending %s messages to %s...", len(messages), LLM_PROVIDER)
+        llm_started = time.perf_counter()
+        completion, shared = await _complete(messages, route.tier)
+        llm_latency = time.perf_counter() - llm_started
+        record_stage("llm", llm_started)
+        model_router.record_latency(route.tier, llm_latency)
+    finally:
+        # Only the LLM call outcome drives the adaptive limit
+        concurrency_limiter.release(llm_latency, success=llm_started is None or llm_latency is not None)
+
+    if not shared:
+        # A coalesced reply cost nothing extra; the leader's sender was charged
+        with stage("quota"):
+            await quota.record(sender, completion.model, completion.prompt_tokens, completion.completion_tokens)
+    assistant_text = completion.text.strip()
+    if completion.finish_reason == FINISH_LENGTH:
+        # Cut off at max_tokens: end on a complete sentence rather than mid-word
+        assistant_text = trim_to_sentence(assistant_text)
+    logger.info(
+        "Generated response for %s (%s chars, finish=%s)",
+        _mask_sender(sender), len(assistant_text), completion.finish_reason,
+    )
+
+    # 8. Save assistant response
+    with stage("memory_write"):
+        await memory.append_message(sender, "assistant", assistant_text, fence=fence)
+
+    # 9. Send directly via WhatsApp
+    try:
+        with stage("whatsapp_send"):
+            await whatsapp_client.send_text_message(sender, assistant_text)
+    except Exception as send_err:
+        logger.warning("Failed to send WhatsApp message to %s: %s", _mask_sender(sender), send_err)
+        return WebhookResponse(delivered=False, detail="LLM OK, WhatsApp send failed")
+    
+    return WebhookResponse(delivered=True)
@@ -0,0 +1,198 @@
+import asyncio
+import base64
+import functools
+import importlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+
+from .whatsapp_client import MediaTooLargeError
+
+logger = logging.getLogger(__name__)
+
+AUDIO_TYPES = {"audio", "voice"}
+IMAGE_TYPES = {"image"}
+SUPPORTED_MEDIA_TYPES = AUDIO_TYPES | IMAGE_TYPES
+
+
+class MediaError(Exception):
+    """Raised when an incoming media message cannot be turned into LLM input."""
+
+
+class MediaUnsupported(MediaError):
+    """Raised when a media type is not enabled in this deployment."""
+
+
+@dataclass(frozen=True)
+class MediaInput:
+    type: str
+    media_id: str
+    mime_type: str | None = None
+    caption: str | None = None
+
+
+@dataclass(frozen=True)
+class MediaContent:
+    # Plain-text form stored in conversation memory and used for routing
+    text: str
+    # Message content for the LLM: a string, or OpenAI-style content parts for images
+    llm_content: str | list
+
+
+# ── Worker-side functions (run in the process pool, must stay picklable) ──
+
+
+def _load_engine(spec: str):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def transcribe_file(path: str, engine_spec: str) -> str:
+    """Transcribe an audio file with the engine named by ``module:function``."""
+    return _load_engine(engine_spec)(path).strip()
+
+
+def downscale_image(path: str, max_side: int, quality: int = 85) -> bytes:
+    """Downscale an image so its longest side is ``max_side`` and re-encode it as JPEG."""
+    try:
+        from PIL import Image
+    except ImportError as exc:
+        raise MediaError("Pillow is required for image messages") from exc
+    with Image.open(path) as image:
+        image.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+
+@functools.lru_cache(maxsize=1)
+def _whisper_model(size: str):
+    from faster_whisper import WhisperModel
+    return WhisperModel(size, device="cpu", compute_type="int8")
+
+
+def faster_whisper_engine(path: str) -> str:
+    """
+    Local transcription engine (optional ``faster-whisper`` dependency).
+
+    The model is loaded once per worker process; ``WHISPER_MODEL`` picks its size.
+    """
+    try:
+        model = _whisper_model(os.getenv("WHISPER_MODEL", "small"))
+    except ImportError as exc:
+        raise MediaUnsupported("faster-whisper is not installed; voice notes are unavailable") from exc
+    segments, _ = model.transcribe(path, language=os.getenv("WHISPER_LANGUAGE", "es"), vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+# ── Event-loop side ──
+
+
+class MediaProcessor:
+    """
+    Turns WhatsApp voice notes and images into LLM input.
+
+    Media is streamed from the Graph API into a size-capped temp file, and
+    the CPU-bound work (transcription, image downscaling) runs in a process
+    pool so the event loop keeps serving other senders.
+    """
+
+    def __init__(
+        self,
+        whatsapp_client,
+        max_bytes: int = 16 * 1024 * 1024,
+        transcriber: str | None = None,
+        image_max_side: int = 1024,
+        workers: int = 2,
+        executor: Executor | None = None,
+    ):
+        """
+        Args:
+            whatsapp_client: Client used to resolve and download media
+            max_bytes: Largest media file accepted
+            transcriber: ``module:function`` taking a file path and returning text;
+                None disables voice notes
+            image_max_side: Longest side (px) of images sent to the LLM
+            workers: Process pool size, created lazily on first media message
+            executor: Optional executor to use instead of the process pool
+        """
+        self._whatsapp = whatsapp_client
+        self._max_bytes = max_bytes
+        self._transcriber = transcriber
+        self._image_max_side = image_max_side
+        self._workers = workers
+        self._executor = executor
+        self._owns_executor = executor is None
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            # spawn: never fork a process that is running an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def process(self, media: MediaInput) -> MediaContent:
+        """
+        Download and convert a media message.
+
+        Raises:
+            MediaUnsupported: voice note while no transcriber is configured
+            MediaError: unsupported type, oversized file, or conversion failure
+        """
+        if media.type not in SUPPORTED_MEDIA_TYPES:
+            raise MediaError(f"unsupported media type: {media.type}")
+        if media.type in AUDIO_TYPES and self._transcriber is None:
+            # Checked before the download so disabled voice notes cost nothing
+            raise MediaUnsupported("voice notes are disabled (no TRANSCRIBER configured)")
+
+        try:
+            info = await self._whatsapp.get_media_info(media.media_id)
+        except Exception as exc:
+            raise MediaError(f"media lookup failed: {exc.__class__.__name__}") from exc
+        if int(info.get("file_size") or 0) > self._max_bytes:
+            raise MediaError(f"media is {info['file_size']} bytes (limit {self._max_bytes})")
+
+        fd, path = tempfile.mkstemp(prefix="wa-media-")
+        try:
+            with os.fdopen(fd, "wb") as dest:
+                try:
+                    size = await self._whatsapp.download_media(info["url"], dest, self._max_bytes)
+                except MediaTooLargeError as exc:
+                    raise MediaError(str(exc)) from exc
+            logger.info("Downloaded %s media (%s bytes)", media.type, size)
+
+            loop = asyncio.get_running_loop()
+            if media.type in AUDIO_TYPES:
+                transcript = await loop.run_in_executor(self._pool(), transcribe_file, path, self._transcriber)
+                if not transcript:
+                    raise MediaError("empty transcription")
+                text = f"[Nota de voz] {transcript}"
+                return MediaContent(text=text, llm_content=text)
+
+            jpeg = await loop.run_in_executor(self._pool(), downscale_image, path, self._image_max_side)
+            caption = (media.caption or "").strip()
+            text = f"[Imagen] {caption}" if caption else "[Imagen]"
+            parts = [
+                {"type": "text", "text": caption or "El usuario envió esta imagen."},
+                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()}},
+            ]
+            return MediaContent(text=text, llm_content=parts)
+        except MediaError:
+            raise
+        except Exception as exc:
+            raise MediaError(f"{media.type} processing failed: {exc.__class__.__name__}") from exc
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
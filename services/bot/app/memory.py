@@ -1,27 +1,222 @@
 import json
+import time
+from collections import OrderedDict
 from typing import List
 import asyncio
 from redis.asyncio import Redis
 
+from .archive import ConversationArchive
+from .fallback import REDIS_DOWN_ERRORS, LocalConversationStore, RedisHealth
+from .redis_backend import sender_key
+from .sender_lock import fence_key
 
-class ConversationMemory:
-    def __init__(self, redis_url: str = "redis://redis:6379/0", ttl: int = 3600 * 24):
-        self._redis = Redis.from_url(redis_url)
+# Sorted set of conversations by last write time, scanned by the archiver
+IDLE_KEY = "conv:idle"
+
+# Write only if no newer lock holder exists for this conversation, and bump
+# the conversation version so other replicas drop their cached copy
+_FENCED_SET_SCRIPT = """
+local current = redis.call('get', KEYS[2])
+if current and tonumber(current) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+local version = redis.call('incr', KEYS[3])
+redis.call('expire', KEYS[3], ARGV[3])
+return version
+"""
+
+_SET_SCRIPT = """
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+local version = redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[2])
+return version
+"""
+
+# Recreate an archived conversation unless a write got there first
+_REHYDRATE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+local version = redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[2])
+return version
+"""
+
+# Drop an archived conversation only if nobody wrote it since it was read
+_EVICT_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Remove members from the idle set unless they were written again meanwhile
+_ZREM_IF_IDLE_SCRIPT = """
+local removed = 0
+for i = 2, #ARGV do
+    local score = redis.call('zscore', KEYS[1], ARGV[i])
+    if score and tonumber(score) <= tonumber(ARGV[1]) then
+        removed = removed + redis.call('zrem', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+# The version is bumped, never deleted: restarting it at 1 could match a stale cached copy
+_CLEAR_SCRIPT = """
+redis.call('del', KEYS[1])
+local version = redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[1])
+return version
+"""
+
+
+class StaleFenceError(RuntimeError):
+    """Raised when a write carries a fencing token older than the current lock holder's."""
+
+
+def conversation_key(conv_id: str) -> str:
+    return sender_key("conv", conv_id)
+
+
+def version_key(conv_id: str) -> str:
+    return sender_key("convver", conv_id)
+
+
+def legacy_conversation_key(conv_id: str) -> str:
+    """Key used before hash tags (``conv:<id>``); read once and migrated on a miss."""
+    return f"conv:{conv_id}"
+
+
+class _ConversationCache:
+    """In-process LRU of parsed conversations, bounded by entries and bytes, with a TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
         self._ttl = ttl
+        # conv_id -> (version, messages, size in bytes, expires at)
+        self._entries: OrderedDict[str, tuple[int, list, int, float]] = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, conv_id: str) -> tuple[int, list] | None:
+        entry = self._entries.get(conv_id)
+        if entry is None:
+            return None
+        if entry[3] <= time.monotonic():
+            self.discard(conv_id)
+            return None
+        self._entries.move_to_end(conv_id)
+        return entry[0], entry[1]
+
+    def peek(self, conv_id: str) -> list | None:
+        """Cached messages even if expired, without touching the LRU order."""
+        entry = self._entries.get(conv_id)
+        return entry[1] if entry is not None else None
+
+    def put(self, conv_id: str, version: int, messages: list, size: int):
+        self.discard(conv_id)
+        if size > self._max_bytes:
+            return
+        self._entries[conv_id] = (version, messages, size, time.monotonic() + self._ttl)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2]
+            self.evictions += 1
+
+    def discard(self, conv_id: str):
+        entry = self._entries.pop(conv_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
 
-    async def get_conversation(self, conv_id: str, max_messages: int = 20) -> List[dict]:
+
+class ConversationMemory:
+    """
+    Conversation history in Redis, optionally fronted by an in-process cache
+    and backed by a cold-storage archive.
+
+    With the cache enabled, a replica that served the previous turn of a
+    sender answers from memory after a single small ``GET`` of the
+    conversation's version counter. Every write bumps that counter
+    atomically with the data, so a copy cached on any replica is dropped
+    as soon as another replica writes the conversation.
+
+    With an archive, ``archive_idle`` moves conversations nobody wrote for
+    a while out of Redis, and the sender's next read brings them back.
+    A conversation still stored under its pre-hash-tag key is moved to the
+    new key the same way on its first read.
+
+    With a ``health`` monitor, reads and writes go to a bounded in-process
+    store while Redis is down. A conversation missing there starts from
+    its cached copy, if any. Messages written during the outage stay
+    pending until ``write_back`` copies them to Redis; until then the
+    conversation keeps being served from the local store.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = "redis://redis:6379/0",
+        ttl: int = 3600 * 24,
+        redis: Redis | None = None,
+        cache_max_entries: int = 0,
+        cache_max_bytes: int = 32 * 1024 * 1024,
+        cache_ttl: float = 300.0,
+        archive: ConversationArchive | None = None,
+        health: RedisHealth | None = None,
+        fallback_max_entries: int = 10_000,
+        fallback_ttl: float = 3600.0,
+        legacy_keys: bool = True,
+        max_messages: int = 20,
+    ):
         """
-        Retrieve conversation history for a given conversation ID.
-        
         Args:
-            conv_id: Unique conversation identifier (typically phone number)
-            max_messages: Maximum number of messages to return (default 20).
-                         Returns the most recent messages to avoid context overflow.
-        
-        Returns:
-            List of message dictionaries with 'role' and 'content' keys
+            redis_url: Redis connection URL (ignored when ``redis`` is given)
+            ttl: Conversation lifetime in Redis, refreshed on every write
+            redis: Shared Redis client to reuse instead of opening a new pool
+            cache_max_entries: Conversations kept in process; 0 disables the cache
+            cache_max_bytes: Upper bound on the serialized size of cached conversations
+            cache_ttl: Seconds a cached conversation may be served before re-fetching
+            archive: Cold storage for idle conversations; None keeps everything in Redis
+            health: Redis health monitor; enables the local fallback store
+            fallback_max_entries: Conversations the fallback store keeps
+            fallback_ttl: Seconds the fallback store keeps a conversation after its last write
+            legacy_keys: On a miss, look for the conversation under its pre-hash-tag key
+            max_messages: Messages kept per conversation and returned by reads
         """
-        raw = await self._redis.get(f"conv:{conv_id}")
+        # Reuse a shared client (and its connection pool) when one is provided
+        self._redis = redis if redis is not None else Redis.from_url(redis_url)
+        self._ttl = ttl
+        self._cache = _ConversationCache(cache_max_entries, cache_max_bytes, cache_ttl) if cache_max_entries > 0 else None
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_stale = 0
+        self._archive = archive
+        self._archived = 0
+        self._rehydrated = 0
+        self._legacy_keys = legacy_keys
+        self._max_messages = max_messages
+        self._health = health
+        self._fallback = LocalConversationStore(fallback_max_entries, fallback_ttl) if health is not None else None
+        self._fallback_reads = 0
+        self._fallback_writes = 0
+        self._written_back = 0
+
+    @staticmethod
+    def _parse(raw) -> List[dict]:
         if not raw:
             return []
         try:
@@ -31,22 +226,316 @@ class ConversationMemory:
 
         if not isinstance(messages, list):
             raise TypeError("Conversation payload must be a JSON list")
+        return messages
+
+    async def get_conversation(self, conv_id: str, max_messages: int | None = None) -> List[dict]:
+        """
+        Retrieve conversation history for a given conversation ID.
+        
+        Args:
+            conv_id: Unique conversation identifier (typically phone number)
+            max_messages: Maximum number of messages to return (default: the
+                         instance's ``max_messages``). Returns the most recent
+                         messages to avoid context overflow.
+        
+        Returns:
+            List of message dictionaries with 'role' and 'content' keys
+        """
+        if self._use_fallback(conv_id):
+            self._fallback_reads += 1
+            messages = self._fallback_get(conv_id)
+        else:
+            try:
+                messages = await self._get_from_redis(conv_id)
+            except REDIS_DOWN_ERRORS as exc:
+                if self._fallback is None:
+                    raise
+                self._health.report_failure(exc)
+                self._fallback_reads += 1
+                messages = self._fallback_get(conv_id)
 
         # Return only the last N messages to prevent context overflow and reduce costs
-        if len(messages) > max_messages:
-            return messages[-max_messages:]
+        return messages[-(max_messages or self._max_messages):]
+
+    async def _get_from_redis(self, conv_id: str) -> List[dict]:
+        if self._cache is None:
+            raw = await self._redis.get(conversation_key(conv_id))
+            if raw is None and (self._legacy_keys or self._archive is not None):
+                messages, _ = await self._rehydrate(conv_id)
+                return messages
+            return self._parse(raw)
+        return await self._get_cached(conv_id)
+
+    def _use_fallback(self, conv_id: str) -> bool:
+        return self._fallback is not None and (not self._health.available or self._fallback.has_pending(conv_id))
+
+    def _fallback_get(self, conv_id: str) -> List[dict]:
+        messages = self._fallback.get(conv_id)
+        if messages is None:
+            # Best known history: the copy cached before the outage, even if expired
+            cached = self._cache.peek(conv_id) if self._cache is not None else None
+            messages = list(cached) if cached else []
+            self._fallback.seed(conv_id, messages)
+        return messages
+
+    async def _get_cached(self, conv_id: str) -> List[dict]:
+        cached = self._cache.get(conv_id)
+        if cached is not None:
+            version = await self._redis.get(version_key(conv_id))
+            if version is not None and int(version) == cached[0]:
+                self._cache_hits += 1
+                return cached[1]
+            self._cache_stale += 1
+        else:
+            self._cache_misses += 1
+
+        # Same hash tag, so both keys live on the same node/slot
+        raw, version = await self._redis.mget(conversation_key(conv_id), version_key(conv_id))
+        if raw is None and (self._legacy_keys or self._archive is not None):
+            messages, version = await self._rehydrate(conv_id)
+            raw = json.dumps(messages)
+        else:
+            messages = self._parse(raw)
+        if version is None:
+            # Written before versioning existed; cache it after the next write
+            self._cache.discard(conv_id)
+        else:
+            self._cache.put(conv_id, int(version), messages, len(raw or b""))
         return messages
 
-    async def append_message(self, conv_id: str, role: str, content: str, max_messages: int = 20):
-        conv = await self.get_conversation(conv_id)
-        conv.append({"role": role, "content": content})
-        # Cap stored history to avoid unbounded Redis growth
-        if len(conv) > max_messages:
-            conv = conv[-max_messages:]
-        await self._redis.set(f"conv:{conv_id}", json.dumps(conv), ex=self._ttl)
+    async def _rehydrate(self, conv_id: str) -> tuple[List[dict], int | None]:
+        """
+        Bring a conversation missing from Redis back under its key; returns (messages, version).
+
+        The pre-hash-tag key is tried first (it may live on another slot,
+        so it is read and deleted outside the script), then the archive.
+        """
+        legacy = None
+        if self._legacy_keys:
+            legacy = await self._redis.get(legacy_conversation_key(conv_id))
+        if legacy is not None:
+            messages = self._parse(legacy)
+        elif self._archive is not None:
+            messages = await self._archive.load_async(conv_id)
+        else:
+            messages = None
+        if not messages:
+            return [], None
+        version = await self._redis.eval(
+            _REHYDRATE_SCRIPT, 2, conversation_key(conv_id), version_key(conv_id), json.dumps(messages), self._ttl
+        )
+        if legacy is not None:
+            await self._redis.delete(legacy_conversation_key(conv_id))
+        if not version:
+            # A concurrent write recreated the conversation; Redis wins
+            raw, version = await self._redis.mget(conversation_key(conv_id), version_key(conv_id))
+            return self._parse(raw), int(version) if version is not None else None
+        await self._touch(conv_id)
+        if legacy is None:
+            self._rehydrated += 1
+        return messages, int(version)
+
+    async def _touch(self, conv_id: str):
+        if self._archive is not None:
+            await self._redis.zadd(IDLE_KEY, {conv_id: time.time()})
+
+    async def append_message(
+        self,
+        conv_id: str,
+        role: str,
+        content: str,
+        max_messages: int | None = None,
+        fence: int | None = None,
+    ):
+        """
+        Append a message to the stored conversation.
+
+        Args:
+            conv_id: Unique conversation identifier
+            role: 'user' or 'assistant'
+            content: Message text
+            max_messages: Maximum number of messages kept (default: the instance's)
+            fence: Fencing token from ``SenderLock.hold``; when given, the write
+                   is rejected if a newer lock holder exists
+
+        Raises:
+            StaleFenceError: if ``fence`` is older than the current lock holder's
+        """
+        message = {"role": role, "content": content}
+        max_messages = max_messages or self._max_messages
+        if self._use_fallback(conv_id):
+            self._fallback_append(conv_id, message, max_messages)
+            return
+        try:
+            conv = await self._get_from_redis(conv_id) + [message]
+            # Cap stored history to avoid unbounded Redis growth
+            await self._store(conv_id, conv[-max_messages:], fence)
+        except REDIS_DOWN_ERRORS as exc:
+            if self._fallback is None:
+                raise
+            self._health.report_failure(exc)
+            self._fallback_append(conv_id, message, max_messages)
+            return
+        await self._touch_after_write(conv_id)
+
+    def _fallback_append(self, conv_id: str, message: dict, max_messages: int):
+        self._fallback_get(conv_id)
+        self._fallback.append(conv_id, message, max_messages)
+        self._fallback_writes += 1
+
+    async def _touch_after_write(self, conv_id: str):
+        # The write already landed; losing the idle-set update only delays archiving
+        try:
+            await self._touch(conv_id)
+        except REDIS_DOWN_ERRORS as exc:
+            if self._fallback is None:
+                raise
+            self._health.report_failure(exc)
+
+    async def _store(self, conv_id: str, conv: List[dict], fence: int | None):
+        """Write the whole conversation (fenced when ``fence`` is given) and refresh the cache."""
+        payload = json.dumps(conv)
+        if fence is None:
+            version = await self._redis.eval(
+                _SET_SCRIPT, 2, conversation_key(conv_id), version_key(conv_id), payload, self._ttl
+            )
+        else:
+            version = await self._redis.eval(
+                _FENCED_SET_SCRIPT, 3, conversation_key(conv_id), fence_key(conv_id), version_key(conv_id),
+                fence, payload, self._ttl,
+            )
+            if not version:
+                if self._cache is not None:
+                    self._cache.discard(conv_id)
+                raise StaleFenceError(f"stale fencing token {fence}")
+        if self._cache is not None:
+            # Write-through: the script wrote exactly this payload at this version
+            self._cache.put(conv_id, int(version), conv, len(payload))
+
+    def needs_write_back(self, conv_id: str) -> bool:
+        """Whether Redis is up and ``conv_id`` still has turns buffered from an outage."""
+        return self._fallback is not None and self._health.available and self._fallback.has_pending(conv_id)
+
+    def pending_write_back(self) -> List[str]:
+        """Conversations with messages written while Redis was down."""
+        return self._fallback.pending_ids() if self._fallback is not None else []
+
+    async def write_back(self, conv_id: str, max_messages: int | None = None, fence: int | None = None) -> int:
+        """
+        Append the messages buffered during an outage to the conversation in Redis.
+
+        Call it under the sender lock. On success the conversation leaves the
+        fallback store and is read from Redis again.
+
+        Args:
+            conv_id: Conversation with pending messages
+            max_messages: Maximum number of messages kept (default: the instance's)
+            fence: Fencing token from ``SenderLock.hold``
+
+        Returns:
+            Number of messages written back
+
+        Raises:
+            StaleFenceError: if ``fence`` is older than the current lock holder's
+        """
+        pending = self._fallback.pending(conv_id) if self._fallback is not None else []
+        if not pending:
+            return 0
+        conv = await self._get_from_redis(conv_id)
+        await self._store(conv_id, (conv + pending)[-(max_messages or self._max_messages):], fence)
+        self._fallback.discard(conv_id)
+        self._written_back += len(pending)
+        await self._touch_after_write(conv_id)
+        return len(pending)
 
     async def clear(self, conv_id: str):
-        await self._redis.delete(f"conv:{conv_id}")
+        await self._redis.eval(_CLEAR_SCRIPT, 2, conversation_key(conv_id), version_key(conv_id), self._ttl)
+        if self._cache is not None:
+            self._cache.discard(conv_id)
+        if self._fallback is not None:
+            self._fallback.discard(conv_id)
+        if self._archive is not None:
+            await self._redis.zrem(IDLE_KEY, conv_id)
+            await self._archive.delete_async(conv_id)
+
+    async def archive_idle(self, idle_seconds: float, limit: int = 200) -> int:
+        """
+        Move conversations not written for ``idle_seconds`` to the archive.
+
+        A conversation is deleted from Redis only after it is durably
+        archived, and only if it was not written in the meantime.
+
+        Args:
+            idle_seconds: Minimum time since the last write
+            limit: Maximum conversations moved in this call
+
+        Returns:
+            Number of conversations removed from Redis
+        """
+        if self._archive is None:
+            return 0
+        idle = await self._redis.zrangebyscore(IDLE_KEY, "-inf", time.time() - idle_seconds, start=0, num=limit)
+        if not idle:
+            return 0
+
+        snapshots, gone = [], []
+        for member in idle:
+            conv_id = member.decode() if isinstance(member, bytes) else member
+            raw, version = await self._redis.mget(conversation_key(conv_id), version_key(conv_id))
+            messages = self._parse(raw) if raw is not None else []
+            if messages:
+                snapshots.append((conv_id, messages, version or b""))
+            else:
+                gone.append(conv_id)
+
+        if snapshots:
+            await self._archive.store_many_async([(conv_id, messages) for conv_id, messages, _ in snapshots])
+
+        moved = 0
+        for conv_id, _, version in snapshots:
+            evicted = await self._redis.eval(
+                _EVICT_SCRIPT, 2, conversation_key(conv_id), version_key(conv_id), version, self._ttl
+            )
+            if evicted:
+                moved += 1
+                if self._cache is not None:
+                    self._cache.discard(conv_id)
+                gone.append(conv_id)
+        if gone:
+            # Written-again conversations keep the newer score set by their write
+            await self._redis.eval(_ZREM_IF_IDLE_SCRIPT, 1, IDLE_KEY, time.time() - idle_seconds, *gone)
+        self._archived += moved
+        return moved
+
+    def archive_stats(self) -> dict:
+        if self._archive is None:
+            return {"enabled": False}
+        return {"enabled": True, "archived": self._archived, "rehydrated": self._rehydrated}
+
+    def fallback_stats(self) -> dict:
+        if self._fallback is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "active": not self._health.available,
+            **self._fallback.stats(),
+            "reads": self._fallback_reads,
+            "writes": self._fallback_writes,
+            "written_back": self._written_back,
+        }
+
+    def cache_stats(self) -> dict:
+        if self._cache is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "entries": len(self._cache),
+            "bytes": self._cache.bytes,
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "stale": self._cache_stale,
+            "evictions": self._cache.evictions,
+        }
 
     async def ping(self) -> bool:
         """
@@ -0,0 +1,131 @@
+import hashlib
+import hmac
+import logging
+from dataclasses import dataclass, field
+from typing import List
+
+from redis.asyncio import Redis
+
+from .media import SUPPORTED_MEDIA_TYPES, MediaInput
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_PREFIX = "sha256="
+
+
+@dataclass(frozen=True)
+class MetaMessage:
+    message_id: str
+    sender: str
+    type: str
+    text: str = ""
+    media: MediaInput | None = None
+
+
+@dataclass(frozen=True)
+class MetaStatus:
+    message_id: str
+    recipient: str
+    status: str
+    errors: List[dict] = field(default_factory=list)
+
+
+def is_meta_payload(body) -> bool:
+    """True for Meta's native webhook envelope (``object`` + ``entry``)."""
+    return isinstance(body, dict) and "object" in body and "entry" in body
+
+
+def verify_signature(app_secret: str, body: bytes, signature: str | None) -> bool:
+    """
+    Check Meta's ``X-Hub-Signature-256`` header against the raw request body.
+
+    Args:
+        app_secret: App secret from the Meta app dashboard
+        body: Raw body bytes, exactly as received (before any JSON parsing)
+        signature: Header value, ``sha256=<hex digest>``
+
+    Returns:
+        True if the HMAC-SHA256 of ``body`` matches, compared in constant time
+    """
+    if not app_secret or not signature or not signature.startswith(SIGNATURE_PREFIX):
+        return False
+    expected = hmac.new(app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len(SIGNATURE_PREFIX):].strip().lower())
+
+
+def sign(app_secret: str, body: bytes) -> str:
+    """``X-Hub-Signature-256`` value Meta would send for ``body`` (tests, benchmarks)."""
+    return SIGNATURE_PREFIX + hmac.new(app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _parse_message(msg: dict) -> MetaMessage:
+    msg_type = msg.get("type", "")
+    text, media = "", None
+    if msg_type == "text":
+        text = msg["text"]["body"]
+    elif msg_type in SUPPORTED_MEDIA_TYPES:
+        media = MediaInput(
+            type=msg_type,
+            media_id=msg[msg_type]["id"],
+            mime_type=msg[msg_type].get("mime_type"),
+            caption=msg[msg_type].get("caption"),
+        )
+    return MetaMessage(message_id=msg.get("id", ""), sender=msg["from"], type=msg_type, text=text, media=media)
+
+
+def parse_events(body: dict) -> tuple[List[MetaMessage], List[MetaStatus]]:
+    """
+    Flatten a Meta webhook payload into its messages and status updates.
+
+    One delivery can carry several entries, changes, messages and statuses
+    (Meta batches events under load); all of them are returned in payload
+    order. Malformed items are skipped and logged instead of failing the
+    whole delivery.
+    """
+    messages: List[MetaMessage] = []
+    statuses: List[MetaStatus] = []
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            for msg in value.get("messages") or []:
+                try:
+                    messages.append(_parse_message(msg))
+                except (KeyError, TypeError) as exc:
+                    logger.warning("Malformed Meta message skipped: %s", exc.__class__.__name__)
+            for status in value.get("statuses") or []:
+                statuses.append(MetaStatus(
+                    message_id=status.get("id", ""),
+                    recipient=status.get("recipient_id", ""),
+                    status=status.get("status", "unknown"),
+                    errors=list(status.get("errors") or []),
+                ))
+    return messages, statuses
+
+
+class MessageDeduplicator:
+    """
+    Drops webhook messages that were already accepted.
+
+    Meta redelivers a message when the previous delivery was not
+    acknowledged in time, so the same ``wamid`` can arrive twice. The first
+    delivery claims the id with SET NX; later ones are skipped. Redis
+    errors let the message through, so a Redis outage never drops messages.
+    """
+
+    def __init__(self, redis: Redis, ttl_seconds: int = 86400):
+        """
+        Args:
+            redis: Shared Redis client
+            ttl_seconds: How long an accepted id is remembered; Meta retries for up to a day
+        """
+        self._redis = redis
+        self._ttl = ttl_seconds
+
+    async def first_delivery(self, message_id: str) -> bool:
+        if not message_id:
+            return True
+        try:
+            return bool(await self._redis.set(f"wamid:{message_id}", 1, nx=True, ex=self._ttl))
+        except Exception as exc:
+            logger.warning("Message dedup check failed: %s", exc.__class__.__name__)
+            return True
@@ -1,35 +1,216 @@
+import json
 import os
 import logging
 import httpx
 from typing import List
 
+from .logs import Truncated
+from .llm import (
+    BATCH_COMPLETED,
+    BATCH_FAILED,
+    BATCH_PENDING,
+    BATCH_RUNNING,
+    BatchRequest,
+    BatchResult,
+    ChatCompletion,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TEMPERATURE,
+    FINISH_LENGTH,
+)
+
+# Chat Completions accepts at most this many stop sequences
+MAX_STOP_SEQUENCES = 4
+
 logger = logging.getLogger(__name__)
 
 
 class OpenAIClient:
-    def __init__(self, api_key: str | None = None, model: str = "gpt-4o"):
+    def __init__(self, api_key: str | None = None, model: str = "gpt-4o", base_url: str | None = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-4o")
-        self.base = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+        self.base = base_url or os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+        self._http: httpx.AsyncClient | None = None
+        # Batch id -> model, to label results
+        self._batch_models: dict[str, str] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        # One pooled client per LLM client: building one costs ~30 ms of CPU
+        # (SSL context) and a fresh connection for every call
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=30.0)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
-    async def chat(self, messages: List[dict]) -> str:
+    async def chat(
+        self,
+        messages: List[dict],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> str:
+        return (await self.complete(messages, model=model, max_tokens=max_tokens, temperature=temperature, stop=stop)).text
+
+    async def complete(
+        self,
+        messages: List[dict],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> ChatCompletion:
+        """Like ``chat`` but also returns the model used, token usage and finish reason."""
+        model = model or self.model
         url = f"{self.base}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = self._build_payload(messages, model, max_tokens, temperature, stop)
+        r = await self._client().post(url, json=payload, headers=self._headers())
+        r.raise_for_status()
+        return self._parse_response(r.json(), model)
+
+    async def list_models(self) -> List[str]:
+        """Model ids visible to the API key; a cheap authenticated call used by the readiness check."""
+        r = await self._client().get(f"{self.base}/models", headers=self._headers(json_body=False))
+        r.raise_for_status()
+        return [item["id"] for item in r.json().get("data", [])]
+
+    def _headers(self, json_body: bool = True) -> dict:
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if json_body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    @staticmethod
+    def _build_payload(
+        messages: List[dict],
+        model: str,
+        max_tokens: int | None,
+        temperature: float | None = None,
+        stop: tuple[str, ...] | None = None,
+    ) -> dict:
         payload = {
-            "model": self.model,
+            "model": model,
             "messages": messages,
-            "max_tokens": 800,
-            "temperature": 0.2,
+            "max_tokens": max_tokens or DEFAULT_MAX_TOKENS,
+            "temperature": DEFAULT_TEMPERATURE if temperature is None else temperature,
         }
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(url, json=payload, headers=headers)
+        if stop:
+            payload["stop"] = list(stop)[:MAX_STOP_SEQUENCES]
+        return payload
+
+    @staticmethod
+    def _parse_response(data: dict, model: str) -> ChatCompletion:
+        usage = data.get("usage") or {}
+        text = ""
+        finish_reason = None
+        # best-effort extraction
+        if "choices" in data and len(data["choices"]) > 0:
+            finish_reason = data["choices"][0].get("finish_reason")
+            if finish_reason == FINISH_LENGTH:
+                logger.info("OpenAI reply cut off at max_tokens")
+            content = data["choices"][0]["message"]["content"]
+            if not content:
+                logger.warning("OpenAI returned empty content")
+            text = content or ""
+        else:
+            logger.warning("OpenAI unexpected response structure: %s", Truncated(data))
+        return ChatCompletion(
+            text=text,
+            model=data.get("model") or model,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            finish_reason=finish_reason,
+        )
+
+    # ── Batch API (half price, results within 24 h) ──
+
+    async def submit_batch(self, requests: List[BatchRequest]) -> str:
+        """
+        Upload requests as a JSONL file and create a batch job for it.
+
+        OpenAI batches target a single model, so every request must share it.
+
+        Returns:
+            Batch id to poll with ``batch_status``
+        """
+        models = {request.model or self.model for request in requests}
+        if len(models) != 1:
+            raise ValueError(f"an OpenAI batch targets one model, got {sorted(models)}")
+        (model,) = models
+        lines = [
+            json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._build_payload(
+                    request.messages, model, request.max_tokens, request.temperature, request.stop
+                ),
+            })
+            for request in requests
+        ]
+        upload = await self._client().post(
+            f"{self.base}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+            headers=self._headers(json_body=False),
+        )
+        upload.raise_for_status()
+        created = await self._client().post(
+            f"{self.base}/batches",
+            json={
+                "input_file_id": upload.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+                # Lets a process that did not submit the batch label its results
+                "metadata": {"model": model},
+            },
+            headers=self._headers(),
+        )
+        created.raise_for_status()
+        batch_id = created.json()["id"]
+        self._batch_models[batch_id] = model
+        return batch_id
+
+    async def _get_batch(self, batch_id: str) -> dict:
+        r = await self._client().get(f"{self.base}/batches/{batch_id}", headers=self._headers())
+        r.raise_for_status()
+        return r.json()
+
+    async def batch_status(self, batch_id: str) -> str:
+        """Normalized state of a batch: pending, running, completed or failed."""
+        status = (await self._get_batch(batch_id)).get("status")
+        if status == "completed":
+            return BATCH_COMPLETED
+        if status in {"failed", "expired", "cancelling", "cancelled"}:
+            return BATCH_FAILED
+        if status in {"in_progress", "finalizing"}:
+            return BATCH_RUNNING
+        return BATCH_PENDING
+
+    async def batch_results(self, batch_id: str) -> List[BatchResult]:
+        """Per-request results of a finished batch, from its output and error files."""
+        batch = await self._get_batch(batch_id)
+        # Fallback label when a result body lacks its model
+        model = self._batch_models.pop(batch_id, None) or (batch.get("metadata") or {}).get("model", self.model)
+        results = []
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            r = await self._client().get(f"{self.base}/files/{file_id}/content", headers=self._headers(json_body=False))
             r.raise_for_status()
-            data = r.json()
-            # best-effort extraction
-            if "choices" in data and len(data["choices"]) > 0:
-                content = data["choices"][0]["message"]["content"]
-                if not content:
-                    logger.warning("OpenAI returned empty content")
-                return content or ""
-            logger.warning(f"OpenAI unexpected response structure: {data}")
-            return ""
+            for line in r.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                error = item.get("error") or (
+                    None if response.get("status_code") == 200 else {"message": f"HTTP {response.get('status_code')}"}
+                )
+                if error:
+                    results.append(BatchResult(item["custom_id"], error=str(error.get("message") or error)))
+                else:
+                    results.append(BatchResult(item["custom_id"], completion=self._parse_response(response["body"], model)))
+        return results
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Check statuses; only FAILED gates readiness
+OK = "ok"
+DEGRADED = "degraded"
+FAILED = "failed"
+PENDING = "pending"
+
+
+class _Check:
+    __slots__ = ("name", "fn", "interval", "required", "status", "error", "latency_ms", "checked_at", "checked", "task")
+
+    def __init__(self, name: str, fn: Callable[[], Awaitable[str | None]], interval: float, required: bool):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.required = required
+        self.status = PENDING
+        self.error: str | None = None
+        self.latency_ms: float | None = None
+        self.checked_at: str | None = None
+        self.checked: float | None = None
+        self.task: asyncio.Task | None = None
+
+
+class DependencyProbe:
+    """
+    Dependency checks run on a schedule, served from their last result.
+
+    Each check is a coroutine function that returns ``"ok"`` (or None) or
+    ``"degraded"``, and raises when the dependency is unusable. It runs in
+    its own background task every ``interval`` seconds under ``timeout``,
+    so a probe request never waits on the network and a hung dependency
+    only shows up as a failed result. Readiness fails while a required
+    check has not passed yet or its last run failed.
+    """
+
+    def __init__(self, timeout: float = 2.0):
+        """
+        Args:
+            timeout: Seconds a single check may take before it counts as failed
+        """
+        self._timeout = timeout
+        self._checks: dict[str, _Check] = {}
+
+    def add(self, name: str, fn: Callable[[], Awaitable[str | None]], interval: float = 10.0, required: bool = True):
+        """
+        Register a check.
+
+        Args:
+            name: Key in the results
+            fn: Coroutine function performing the check
+            interval: Seconds between runs
+            required: Whether a failure makes the replica not ready
+        """
+        self._checks[name] = _Check(name, fn, interval, required)
+
+    async def run(self, name: str) -> str:
+        """Run one check now and store its result; returns the new status."""
+        check = self._checks[name]
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(check.fn(), timeout=self._timeout) or OK
+            error = None
+        except asyncio.TimeoutError:
+            status, error = FAILED, f"timeout after {self._timeout:g}s"
+        except Exception as exc:
+            status, error = FAILED, exc.__class__.__name__
+        if status != check.status and check.status != PENDING:
+            log = logger.warning if status == FAILED else logger.info
+            log("Dependency check %s: %s -> %s", name, check.status, status)
+        check.status = status
+        check.error = error
+        check.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        check.checked = time.monotonic()
+        check.checked_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        return status
+
+    async def _loop(self, check: _Check):
+        while True:
+            await self.run(check.name)
+            await asyncio.sleep(check.interval)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        for check in self._checks.values():
+            if check.task is None:
+                check.task = loop.create_task(self._loop(check))
+
+    async def stop(self):
+        tasks = [check.task for check in self._checks.values() if check.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for check in self._checks.values():
+            check.task = None
+
+    def blocking(self) -> list[str]:
+        """Required checks that keep the replica out of rotation (failed or not run yet)."""
+        return [c.name for c in self._checks.values() if c.required and c.status in (FAILED, PENDING)]
+
+    def results(self) -> dict:
+        now = time.monotonic()
+        return {
+            c.name: {
+                "status": c.status,
+                "required": c.required,
+                "error": c.error,
+                "latency_ms": c.latency_ms,
+                "checked_at": c.checked_at,
+                "age_seconds": round(now - c.checked, 1) if c.checked is not None else None,
+            }
+            for c in self._checks.values()
+        }
+
+
+def parse_required(raw: str, known: Iterable[str]) -> set[str]:
+    """
+    Names of the checks listed in a comma-separated setting.
+
+    Raises:
+        ValueError: A name does not match any known check
+    """
+    names = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = names - set(known)
+    if unknown:
+        raise ValueError(f"Unknown readiness checks: {', '.join(sorted(unknown))}")
+    return names
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Iterator
+
+from .logs import correlation_id
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTrace:
+    """Per-stage wall time of one request; a stage entered twice accumulates."""
+
+    __slots__ = ("name", "correlation_id", "started", "stages")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.correlation_id = correlation_id.get()
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage_name: str, elapsed_ms: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + elapsed_ms
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+
+
+def record_stage(name: str, started: float):
+    """Add the time since ``started`` (a ``perf_counter`` value) to the current request's ``name`` stage."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage ``name`` of the current request; a no-op outside a tracked request."""
+    if _current_trace.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, started)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a short sleep.
+
+    Lag is time the loop spent running callbacks (or blocked) instead of
+    resuming the monitor on schedule, so it is the delay every other
+    coroutine saw at that moment. The last ``window`` samples are kept.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        """
+        Args:
+            interval: Seconds between measurements
+            window: Samples kept (``interval * window`` seconds of history)
+        """
+        self._interval = interval
+        self._samples: deque[tuple[float, float]] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.perf_counter()
+            self._samples.append((now, max(0.0, now - expected) * 1000))
+
+    def max_lag_between(self, start: float, end: float) -> float | None:
+        """
+        Worst lag (ms) measured while [start, end] (``perf_counter`` values) was running.
+
+        A sample taken at ``t`` covers the sleep that ended at ``t``, so
+        samples up to one interval after ``end`` still overlap the window.
+        None when no sample overlaps (monitor off or request shorter than an interval).
+        """
+        lags = [lag for at, lag in self._samples if start <= at <= end + self._interval]
+        return round(max(lags), 2) if lags else None
+
+    def stats(self) -> dict:
+        lags = sorted(lag for _, lag in self._samples)
+        if not lags:
+            return {"enabled": self._task is not None, "samples": 0}
+        return {
+            "enabled": self._task is not None,
+            "samples": len(lags),
+            "last_ms": round(self._samples[-1][1], 2),
+            "p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 2),
+            "max_ms": round(lags[-1], 2),
+        }
+
+
+class SlowRequestRecorder:
+    """
+    Keeps the stage breakdown of requests slower than a threshold.
+
+    ``track`` opens a trace for the request; code on its path marks stages
+    with ``stage``/``record_stage``. Requests over ``threshold_ms`` are
+    stored, newest last, in a ring buffer of ``capacity`` entries together
+    with the worst event-loop lag seen while they ran.
+    """
+
+    def __init__(self, threshold_ms: float = 2000, capacity: int = 100, lag_monitor: LoopLagMonitor | None = None):
+        """
+        Args:
+            threshold_ms: Requests at or above this total time are recorded; 0 disables tracking
+            capacity: Records kept; older ones are dropped
+            lag_monitor: Source of event-loop lag for each record
+        """
+        self.threshold_ms = threshold_ms
+        self._records: deque[dict] = deque(maxlen=capacity)
+        self._lag_monitor = lag_monitor
+        self._tracked = 0
+        self._slow = 0
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """
+        Trace the block as request ``name``.
+
+        Inside an already tracked request the block adds its stages to that
+        request, so nested handlers are not reported twice.
+        """
+        if self.threshold_ms <= 0 or _current_trace.get() is not None:
+            yield
+            return
+        trace = RequestTrace(name)
+        token = _current_trace.set(trace)
+        outcome = "ok"
+        try:
+            yield
+        except BaseException as exc:
+            outcome = exc.__class__.__name__
+            raise
+        finally:
+            _current_trace.reset(token)
+            self._finish(trace, outcome)
+
+    def _finish(self, trace: RequestTrace, outcome: str):
+        ended = time.perf_counter()
+        total_ms = (ended - trace.started) * 1000
+        self._tracked += 1
+        if total_ms < self.threshold_ms:
+            return
+        self._slow += 1
+        record = {
+            "name": trace.name,
+            "correlation_id": trace.correlation_id,
+            "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "total_ms": round(total_ms, 2),
+            "stages": {name: round(ms, 2) for name, ms in trace.stages.items()},
+            "unaccounted_ms": round(max(0.0, total_ms - sum(trace.stages.values())), 2),
+            "loop_lag_max_ms": self._lag_monitor.max_lag_between(trace.started, ended) if self._lag_monitor else None,
+            "outcome": outcome,
+        }
+        self._records.append(record)
+        slowest = max(trace.stages, key=trace.stages.get, default=None)
+        logger.warning("Slow request %s: %.0f ms (slowest stage: %s)", trace.name, total_ms, slowest)
+
+    def recent(self, limit: int | None = None) -> list[dict]:
+        """Recorded requests, newest first."""
+        records = list(reversed(self._records))
+        return records[:limit] if limit else records
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "tracked": self._tracked,
+            "slow": self._slow,
+            "buffered": len(self._records),
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of one thread (the event loop), for flamegraphs.
+
+    A worker thread snapshots the target thread's Python stack every
+    ``interval`` seconds with ``sys._current_frames``; the profiled code is
+    never instrumented, so the overhead is the sampling thread's own work.
+    Output is the collapsed-stack format (``root;...;leaf count`` per line)
+    read by flamegraph.pl, speedscope and inferno. Time the loop spends
+    idle shows up under the selector's ``select``.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Args:
+            interval: Seconds between samples
+        """
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def stop(self):
+        """End the running profile early; it returns what was sampled so far."""
+        self._stopped.set()
+
+    def sample(self, seconds: float, thread_id: int) -> tuple[Counter, int]:
+        """
+        Sample ``thread_id`` for ``seconds`` (or until ``stop``) from the calling (non-target) thread.
+
+        Returns:
+            Counts per collapsed stack (root first) and the number of samples taken
+
+        Raises:
+            RuntimeError: A profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        self._running = True
+        self._stopped.clear()
+        try:
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline and not self._stopped.is_set():
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stacks[";".join(reversed(labels))] += 1
+                    samples += 1
+                self._stopped.wait(self._interval)
+            return stacks, samples
+        finally:
+            self._running = False
+            self._lock.release()
+
+    async def profile(self, seconds: float) -> tuple[str, int]:
+        """
+        Profile the running event loop's thread for ``seconds``.
+
+        Returns:
+            Collapsed stacks, most frequent first, and the number of samples
+
+        Raises:
+            RuntimeError: A profile is already running
+        """
+        if self._running:
+            raise RuntimeError("a profile is already running")
+        loop_thread = threading.get_ident()
+        try:
+            stacks, samples = await asyncio.to_thread(self.sample, seconds, loop_thread)
+        except asyncio.CancelledError:
+            # The sampling thread cannot be cancelled; tell it to finish
+            self.stop()
+            raise
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()), samples
@@ -0,0 +1,196 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from redis.asyncio import Redis
+
+from .redis_backend import sender_key
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+DOWNGRADE = "downgrade"
+REJECT = "reject"
+
+# USD per million (prompt, completion) tokens; MODEL_PRICES overrides or extends it
+DEFAULT_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+# Sender usage is needed for today only; spend is kept for monthly reports
+_SENDER_TTL = 2 * 86400
+_SPEND_TTL = 35 * 86400
+# Costs are stored as integer micro-dollars so HINCRBY stays exact
+_MICRO = 1_000_000
+
+_RECORD_SENDER_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], 'tokens', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'cost', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+_RECORD_SPEND_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1] .. '|requests', 1)
+redis.call('HINCRBY', KEYS[1], ARGV[1] .. '|prompt_tokens', ARGV[2])
+redis.call('HINCRBY', KEYS[1], ARGV[1] .. '|completion_tokens', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class QuotaDecision:
+    action: str
+    tokens_used: int = 0
+    cost_used: float = 0.0
+
+
+def _day(now: float) -> str:
+    return time.strftime("%Y%m%d", time.gmtime(now))
+
+
+class TokenQuota:
+    """
+    Per-sender daily token and cost budget, enforced before the LLM call.
+
+    Usage reported by the provider (prompt + completion tokens) is added
+    to a per-sender, per-UTC-day hash after each call, together with its
+    estimated cost. Before the next call the sender is downgraded to the
+    fast tier once ``downgrade_ratio`` of either budget is used, and over
+    the budget the request is rejected (or only downgraded, with
+    ``on_exceeded='downgrade'``). Usage is also aggregated per model per
+    day for spend reporting.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        daily_tokens: int = 0,
+        daily_cost: float = 0.0,
+        downgrade_ratio: float = 0.8,
+        on_exceeded: str = REJECT,
+        prices: dict[str, tuple[float, float]] | None = None,
+    ):
+        """
+        Args:
+            redis: Shared Redis client
+            daily_tokens: Tokens per sender per day; 0 disables the token budget
+            daily_cost: USD per sender per day; 0 disables the cost budget
+            downgrade_ratio: Fraction of a budget after which turns use the fast tier
+            on_exceeded: 'reject' or 'downgrade' once a budget is exhausted
+            prices: USD per million (prompt, completion) tokens by model
+        """
+        if on_exceeded not in {REJECT, DOWNGRADE}:
+            raise ValueError("on_exceeded must be 'reject' or 'downgrade'")
+        self._redis = redis
+        self._daily_tokens = daily_tokens
+        self._daily_cost = daily_cost
+        self._downgrade_ratio = downgrade_ratio
+        self._on_exceeded = on_exceeded
+        self._prices = {**DEFAULT_PRICES, **(prices or {})}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._daily_tokens or self._daily_cost)
+
+    def _price(self, model: str) -> tuple[float, float] | None:
+        """
+        Price of ``model``, matching versioned names to their base model.
+
+        Providers report pinned versions ("gpt-4o-2024-08-06",
+        "gemini-2.0-flash-001"); the longest priced name that the model
+        starts with, followed by "-", is used.
+        """
+        price = self._prices.get(model)
+        if price is None:
+            base = max((name for name in self._prices if model.startswith(name + "-")), key=len, default=None)
+            price = self._prices.get(base) if base is not None else None
+        return price
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float | None:
+        """Estimated USD cost of a call, or None for a model without a price."""
+        price = self._price(model)
+        if price is None:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def _usage_key(self, sender: str, now: float) -> str:
+        return f"{sender_key('quota', sender)}:{_day(now)}"
+
+    async def check(self, sender: str, now: float | None = None) -> QuotaDecision:
+        """Decide whether the sender's next LLM call is allowed, downgraded or rejected."""
+        if not self.enabled:
+            return QuotaDecision(ALLOW)
+        try:
+            tokens, cost = await self._redis.hmget(self._usage_key(sender, now or time.time()), "tokens", "cost")
+        except Exception as exc:
+            # Fail open like the rate limiter: Redis trouble must not block replies
+            logger.warning("Quota check failed: %s", exc.__class__.__name__)
+            return QuotaDecision(ALLOW)
+
+        tokens = int(tokens or 0)
+        cost = int(cost or 0) / _MICRO
+        usage = max(
+            tokens / self._daily_tokens if self._daily_tokens else 0.0,
+            cost / self._daily_cost if self._daily_cost else 0.0,
+        )
+        if usage >= 1:
+            action = self._on_exceeded
+        elif usage >= self._downgrade_ratio:
+            action = DOWNGRADE
+        else:
+            action = ALLOW
+        return QuotaDecision(action, tokens, cost)
+
+    async def record(
+        self, sender: str, model: str, prompt_tokens: int, completion_tokens: int, now: float | None = None
+    ):
+        """Add a call's usage to the sender's budget and to the per-model spend."""
+        now = now or time.time()
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        cost = self.cost(model, prompt_tokens, completion_tokens) or 0.0
+        try:
+            if self.enabled:
+                await self._redis.eval(
+                    _RECORD_SENDER_SCRIPT, 1, self._usage_key(sender, now),
+                    prompt_tokens + completion_tokens, round(cost * _MICRO), _SENDER_TTL,
+                )
+            await self._redis.eval(
+                _RECORD_SPEND_SCRIPT, 1, f"quota:spend:{_day(now)}",
+                model, prompt_tokens, completion_tokens, _SPEND_TTL,
+            )
+        except Exception as exc:
+            logger.warning("Quota usage not recorded: %s", exc.__class__.__name__)
+
+    async def spend(self, day: str | None = None) -> dict:
+        """
+        Aggregated usage per model for a UTC day (default today).
+
+        Returns:
+            ``{"day": ..., "models": {model: {requests, prompt_tokens,
+            completion_tokens, cost_usd}}, "total_cost_usd": ...}``
+        """
+        day = day or _day(time.time())
+        try:
+            raw = await self._redis.hgetall(f"quota:spend:{day}")
+        except Exception as exc:
+            logger.warning("Quota spend unavailable: %s", exc.__class__.__name__)
+            return {"day": day, "error": "unavailable"}
+
+        models: dict[str, dict] = {}
+        for field, value in raw.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            model, _, counter = field.rpartition("|")
+            models.setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})[counter] = int(value)
+        total = 0.0
+        for model, usage in models.items():
+            cost = self.cost(model, usage["prompt_tokens"], usage["completion_tokens"])
+            usage["cost_usd"] = round(cost, 6) if cost is not None else None
+            total += cost or 0.0
+        return {"day": day, "models": models, "total_cost_usd": round(total, 6)}
@@ -1,24 +1,43 @@
 from redis.asyncio import Redis
 
+from .fallback import REDIS_DOWN_ERRORS, LocalRateLimiter, RedisHealth
+from .redis_backend import sender_key
+
 
 class RateLimiter:
     """
     Token bucket rate limiter using Redis.
     Prevents spam and abuse by limiting messages per user per time window.
+
+    With a ``health`` monitor, a per-replica counter takes over while Redis
+    is down; without one, Redis errors let the request through.
     """
     
-    def __init__(self, redis_url: str, max_requests: int = 10, window_seconds: int = 60):
+    def __init__(
+        self,
+        redis_url: str | None = None,
+        max_requests: int = 10,
+        window_seconds: int = 60,
+        redis: Redis | None = None,
+        health: RedisHealth | None = None,
+    ):
         """
         Initialize rate limiter.
         
         Args:
-            redis_url: Redis connection URL
+            redis_url: Redis connection URL (ignored when ``redis`` is given)
             max_requests: Maximum number of requests allowed in the time window
             window_seconds: Time window in seconds
+            redis: Shared Redis client to reuse instead of opening a new pool
+            health: Redis health monitor; enables the local fallback limiter
         """
-        self._redis = Redis.from_url(redis_url)
+        if redis is None and not redis_url:
+            raise ValueError("RateLimiter requires redis_url or redis")
+        self._redis = redis if redis is not None else Redis.from_url(redis_url)
         self._max_requests = max_requests
         self._window_seconds = window_seconds
+        self._health = health
+        self._local = LocalRateLimiter(max_requests, window_seconds) if health is not None else None
     
     async def check_rate_limit(self, user_id: str) -> tuple[bool, int, int]:
         """
@@ -33,8 +52,10 @@ class RateLimiter:
             - current_count: Current number of requests in window
             - limit: Maximum allowed requests
         """
-        key = f"ratelimit:{user_id}"
-        
+        key = sender_key("ratelimit", user_id)
+        if self._local is not None and not self._health.available:
+            return self._local.check_rate_limit(user_id)
+
         try:
             # Increment counter
             count = await self._redis.incr(key)
@@ -46,11 +67,14 @@ class RateLimiter:
             is_allowed = count <= self._max_requests
             return (is_allowed, count, self._max_requests)
             
-        except Exception:
+        except Exception as exc:
+            if self._local is not None and isinstance(exc, REDIS_DOWN_ERRORS):
+                self._health.report_failure(exc)
+                return self._local.check_rate_limit(user_id)
             # On Redis errors, allow the request (fail open)
             return (True, 0, self._max_requests)
     
     async def reset(self, user_id: str):
         """Reset rate limit for a specific user."""
-        key = f"ratelimit:{user_id}"
+        key = sender_key("ratelimit", user_id)
         await self._redis.delete(key)
@@ -0,0 +1,136 @@
+import asyncio
+import bisect
+import hashlib
+from collections import defaultdict
+from typing import List
+
+from redis.asyncio import Redis
+from redis.asyncio.cluster import RedisCluster
+
+
+def sender_key(prefix: str, sender: str) -> str:
+    """
+    Build a per-sender key with a Redis Cluster hash tag.
+
+    Every key of a sender (``conv:{5211...}``, ``ratelimit:{5211...}``,
+    ``lock:{5211...}``...) hashes to the same slot/shard, so the Lua
+    scripts that touch several of them keep working when the data is split.
+    """
+    return f"{prefix}:{{{sender}}}"
+
+
+def hash_tag(key: str) -> str:
+    """Return the part of ``key`` that decides its shard, following Redis Cluster rules."""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ShardedRedis:
+    """
+    Client-side consistent hashing across several independent Redis nodes.
+
+    Exposes the subset of the ``redis.asyncio.Redis`` API the bot uses and
+    routes each command to the node owning the key's hash tag. Each node
+    gets ``vnodes`` points on the ring, so adding or removing a node only
+    moves roughly ``1/N`` of the senders.
+
+    Only single-key commands are routed generically; ``eval`` is routed by
+    its first key, which is why every script's keys must share a hash tag.
+    """
+
+    def __init__(self, nodes: dict[str, Redis], vnodes: int = 160):
+        """
+        Args:
+            nodes: Node name (normally its URL) -> client. The name places the
+                   node on the ring, so keep it stable across deployments.
+            vnodes: Ring points per node
+        """
+        if not nodes:
+            raise ValueError("ShardedRedis requires at least one node")
+        self._nodes = dict(nodes)
+        points = sorted(
+            (_ring_hash(f"{name}#{i}"), name) for name in self._nodes for i in range(vnodes)
+        )
+        self._ring = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    @classmethod
+    def from_urls(cls, urls: List[str], **kwargs) -> "ShardedRedis":
+        return cls({url: Redis.from_url(url, **kwargs) for url in urls})
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    @property
+    def clients(self) -> List[Redis]:
+        return list(self._nodes.values())
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._ring, _ring_hash(hash_tag(key))) % len(self._ring)
+        return self._owners[index]
+
+    def client_for(self, key: str) -> Redis:
+        return self._nodes[self.node_for(key)]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def command(key, *args, **kwargs):
+            return await getattr(self.client_for(key), name)(key, *args, **kwargs)
+
+        command.__name__ = name
+        return command
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args):
+        if numkeys < 1:
+            raise ValueError("ShardedRedis.eval needs at least one key to pick a node")
+        return await self.client_for(keys_and_args[0]).eval(script, numkeys, *keys_and_args)
+
+    async def delete(self, *keys: str) -> int:
+        by_node = defaultdict(list)
+        for key in keys:
+            by_node[self.node_for(key)].append(key)
+        counts = await asyncio.gather(*(self._nodes[node].delete(*node_keys) for node, node_keys in by_node.items()))
+        return sum(counts)
+
+    async def ping(self) -> bool:
+        """True only if every node answers."""
+        results = await asyncio.gather(*(client.ping() for client in self._nodes.values()))
+        return all(results)
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self._nodes.values()))
+
+
+def create_redis(url: str, cluster: bool = False) -> Redis | RedisCluster | ShardedRedis:
+    """
+    Build the shared Redis client from ``REDIS_URL``.
+
+    Args:
+        url: A single URL, or a comma-separated list of URLs to shard across
+        cluster: Treat ``url`` as a Redis Cluster seed node
+
+    Returns:
+        ``Redis`` for a single node, ``RedisCluster`` in cluster mode, or a
+        ``ShardedRedis`` when several URLs are given
+    """
+    urls = [part.strip() for part in url.split(",") if part.strip()]
+    if not urls:
+        raise ValueError("REDIS_URL is empty")
+    if cluster:
+        if len(urls) > 1:
+            raise ValueError("Redis Cluster mode takes a single seed URL")
+        return RedisCluster.from_url(urls[0])
+    if len(urls) == 1:
+        return Redis.from_url(urls[0])
+    return ShardedRedis.from_urls(urls)
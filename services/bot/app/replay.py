@@ -0,0 +1,374 @@
+"""
+Offline replay of stored conversations for prompt and model evaluation.
+
+Each user turn is sent to the LLM with the history that preceded it, built
+by the same ``build_messages`` the webhook uses, so a new system prompt or
+model can be measured without touching production:
+
+    python -m app.replay --input conversations.jsonl --output results.jsonl
+    python -m app.replay --redis redis://localhost:6379/0 --output results.jsonl --concurrency 16
+    python -m app.replay --input conversations.jsonl --output results.jsonl --resume
+
+Input JSONL has one conversation per line: ``{"id": "...", "messages": [...]}``.
+Results are appended to the output as they complete, one JSON line per
+call with latency and token counts. ``--resume`` skips turns that already
+completed in the output, so an interrupted run continues where it stopped
+and failed calls are retried. Point ``--base-url`` at a local fake server
+(``python -m benchmarks.fake_llm``) to exercise the pipeline without API costs.
+
+``--batch`` submits the turns through the provider batch API instead
+(half the price, results within 24 hours); the command keeps polling until
+every batch finishes and ``latency_ms`` becomes the batch turnaround time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, List
+
+from .batch import BatchCollector, complete_in_batch
+from .llm import FINISH_LENGTH, SUPPORTED_PROVIDERS, build_messages, create_llm_client
+from .redis_backend import ShardedRedis, create_redis, hash_tag
+from .router import FAST, FULL, ModelRouter, ModelTier, check_stop_sequences, load_generation_overrides
+
+# Same window the webhook sends (ConversationMemory.get_conversation default)
+MAX_HISTORY = 20
+DEFAULT_PROMPT_PATH = Path(__file__).parent.parent / "prompts" / "system_prompt.txt"
+DEFAULT_GENERATION_PATH = DEFAULT_PROMPT_PATH.parent / "generation.json"
+
+
+@dataclass(frozen=True)
+class ReplayItem:
+    conversation_id: str
+    turn: int
+    history: List[dict]
+    user_text: str
+    # What the assistant actually answered in production, if stored
+    reference: str | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.conversation_id}#{self.turn}"
+
+
+def iter_turns(conversation_id: str, messages: List[dict], turns: str = "last", max_history: int = MAX_HISTORY):
+    """
+    Yield the user turns of a stored conversation as replay items.
+
+    Args:
+        conversation_id: Conversation (sender) identifier
+        messages: Stored messages, oldest first
+        turns: 'last' for the final user turn only, 'all' for every user turn
+        max_history: Messages of history sent with each turn
+    """
+    indexes = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+    if turns == "last":
+        indexes = indexes[-1:]
+    for index in indexes:
+        following = messages[index + 1] if index + 1 < len(messages) else None
+        reference = following.get("content") if following and following.get("role") == "assistant" else None
+        yield ReplayItem(
+            conversation_id=conversation_id,
+            turn=index,
+            history=messages[:index][-max_history:],
+            user_text=messages[index].get("content") or "",
+            reference=reference,
+        )
+
+
+async def iter_jsonl(path: Path) -> AsyncIterator[tuple[str, List[dict]]]:
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get("id") or number), record["messages"]
+
+
+async def iter_redis(client) -> AsyncIterator[tuple[str, List[dict]]]:
+    """Scan every ``conv:{sender}`` key on a single node, a sharded set or a cluster."""
+    nodes = client.clients if isinstance(client, ShardedRedis) else [client]
+    for node in nodes:
+        async for key in node.scan_iter(match="conv:{*}", count=500):
+            raw = await node.get(key)
+            if not raw:
+                continue
+            try:
+                messages = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(messages, list):
+                yield hash_tag(key.decode() if isinstance(key, bytes) else key), messages
+
+
+def load_checkpoint(output: Path) -> set[str]:
+    """Keys of turns already written to ``output``; a torn last line is ignored."""
+    done = set()
+    if not output.exists():
+        return done
+    with open(output, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if not row.get("error"):
+                done.add(f"{row['conversation_id']}#{row['turn']}")
+    return done
+
+
+def _open_output(output: Path):
+    handle = open(output, "a+", encoding="utf-8")
+    if handle.tell():
+        handle.seek(handle.tell() - 1)
+        if handle.read(1) != "\n":
+            # Finish a line torn by an interrupted run so the next row parses
+            handle.write("\n")
+    return handle
+
+
+def summarize(rows: List[dict], skipped: int, elapsed: float) -> dict:
+    latencies = sorted(row["latency_ms"] for row in rows if not row["error"])
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, round(p / 100 * (len(latencies) - 1)))], 1) if latencies else None
+
+    return {
+        "calls": len(rows),
+        "errors": sum(1 for row in rows if row["error"]),
+        # Replies that hit max_tokens: a budget set too low for the prompt
+        "cut_off": sum(1 for row in rows if row.get("finish_reason") == FINISH_LENGTH),
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 2),
+        "calls_per_s": round(len(rows) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 1) if latencies else None,
+            "p50": pct(50),
+            "p95": pct(95),
+        },
+        "prompt_tokens": sum(row["prompt_tokens"] or 0 for row in rows),
+        "completion_tokens": sum(row["completion_tokens"] or 0 for row in rows),
+    }
+
+
+async def replay(
+    conversations: AsyncIterator[tuple[str, List[dict]]],
+    llm_client,
+    output: Path,
+    router: ModelRouter,
+    system_prompt: str = "",
+    concurrency: int = 8,
+    turns: str = "last",
+    resume: bool = False,
+    collector: BatchCollector | None = None,
+) -> dict:
+    """
+    Replay conversations through ``llm_client`` and append one JSON row per call.
+
+    Args:
+        conversations: (conversation id, messages) pairs
+        llm_client: Client exposing ``complete(messages, model, max_tokens, temperature, stop)``
+        output: JSONL file the results are appended to
+        router: Picks the model tier per turn (disable it to force one model)
+        system_prompt: System prompt under evaluation
+        concurrency: Maximum LLM calls in flight
+        turns: 'last' or 'all' user turns per conversation
+        resume: Skip turns that already completed in ``output``
+        collector: Submit every turn through this batch collector instead of
+            real-time calls; ``concurrency`` is then ignored
+
+    Returns:
+        Summary with call counts, latency percentiles and token totals
+    """
+    done = load_checkpoint(output) if resume else set()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    rows: List[dict] = []
+    skipped = 0
+    started = time.perf_counter()
+
+    async def produce():
+        nonlocal skipped
+        async for conversation_id, messages in conversations:
+            for item in iter_turns(conversation_id, messages, turns=turns):
+                if item.key in done:
+                    skipped += 1
+                    continue
+                await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def run_item(item: ReplayItem, handle):
+        route = router.route(item.user_text, item.history)
+        messages = build_messages(system_prompt, item.history, item.user_text)
+        row = {
+            "conversation_id": item.conversation_id,
+            "turn": item.turn,
+            "tier": route.tier.name,
+            "model": route.tier.model,
+            "latency_ms": None,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "finish_reason": None,
+            "user": item.user_text,
+            "reference": item.reference,
+            "response": None,
+            "error": None,
+        }
+        generation = {
+            "model": route.tier.model,
+            "max_tokens": route.tier.max_tokens,
+            "temperature": route.tier.temperature,
+            "stop": route.tier.stop,
+        }
+        call_started = time.perf_counter()
+        try:
+            if collector is not None:
+                completion = await complete_in_batch(collector, messages, **generation)
+            else:
+                completion = await llm_client.complete(messages, **generation)
+            row.update(
+                model=completion.model,
+                response=completion.text,
+                prompt_tokens=completion.prompt_tokens,
+                completion_tokens=completion.completion_tokens,
+                finish_reason=completion.finish_reason,
+            )
+        except Exception as exc:
+            row["error"] = f"{exc.__class__.__name__}: {exc}"
+        row["latency_ms"] = round((time.perf_counter() - call_started) * 1000, 1)
+        if collector is None:
+            router.record_latency(route.tier, row["latency_ms"] / 1000)
+        rows.append(row)
+        handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+        handle.flush()
+
+    async def work(handle):
+        while (item := await queue.get()) is not None:
+            await run_item(item, handle)
+
+    async def run_batched(handle):
+        nonlocal skipped
+        tasks = []
+        async for conversation_id, messages in conversations:
+            for item in iter_turns(conversation_id, messages, turns=turns):
+                if item.key in done:
+                    skipped += 1
+                    continue
+                tasks.append(asyncio.create_task(run_item(item, handle)))
+                # Let the task queue its job before reading further
+                await asyncio.sleep(0)
+        await asyncio.gather(collector.drain(), *tasks)
+
+    with _open_output(output) as handle:
+        if collector is not None:
+            await run_batched(handle)
+        else:
+            await asyncio.gather(produce(), *(work(handle) for _ in range(concurrency)))
+
+    summary = summarize(rows, skipped, time.perf_counter() - started)
+    summary["routing"] = router.stats()
+    return summary
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.replay", description="Replay stored conversations against an LLM.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", type=Path, help="JSONL export: {\"id\": ..., \"messages\": [...]} per line")
+    source.add_argument("--redis", help="Redis URL(s) to scan conv:{sender} keys from (comma-separated to shard)")
+    parser.add_argument("--redis-cluster", action="store_true", help="Treat --redis as a Redis Cluster seed")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL file results are appended to")
+    parser.add_argument("--resume", action="store_true", help="Skip turns already present in --output")
+    parser.add_argument("--provider", default=os.getenv("LLM_PROVIDER", "openai").lower(), choices=SUPPORTED_PROVIDERS)
+    parser.add_argument("--model", help="Full-tier model (default: provider env var)")
+    parser.add_argument("--max-tokens", type=int, default=int(os.getenv("FULL_MAX_TOKENS", "800")))
+    parser.add_argument("--fast-model", help="Enable tiering with this fast-tier model")
+    parser.add_argument("--fast-max-tokens", type=int, default=int(os.getenv("FAST_MAX_TOKENS", "200")))
+    # Same generation settings as the webhook, so replays match live traffic
+    parser.add_argument(
+        "--temperature", type=float, default=_env_float("FULL_TEMPERATURE"), help="Full-tier temperature"
+    )
+    parser.add_argument(
+        "--fast-temperature", type=float, default=_env_float("FAST_TEMPERATURE"), help="Fast-tier temperature"
+    )
+    parser.add_argument(
+        "--stop", type=json.loads, default=json.loads(os.getenv("LLM_STOP_SEQUENCES") or "[]"),
+        help='JSON list of stop sequences for both tiers, e.g. ["\\n\\n\\n"]',
+    )
+    parser.add_argument("--system-prompt", type=Path, default=DEFAULT_PROMPT_PATH)
+    parser.add_argument(
+        "--generation", type=Path, default=DEFAULT_GENERATION_PATH,
+        help="Per-reason generation parameters (max_tokens, temperature, stop)",
+    )
+    parser.add_argument("--base-url", help="LLM API base URL, e.g. a local fake server")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turns", choices=("last", "all"), default="last")
+    parser.add_argument("--batch", action="store_true", help="Use the provider batch API (cheaper, up to 24 h)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Requests per submitted batch")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Seconds between batch status checks")
+    return parser.parse_args(argv)
+
+
+def _env_float(name: str) -> float | None:
+    # Unset or empty keeps the client default, as in the webhook
+    return float(os.getenv(name)) if os.getenv(name) else None
+
+
+def build_router(args: argparse.Namespace, model: str) -> ModelRouter:
+    """Model tiers built from the same settings the webhook uses; ``model`` is the full-tier default."""
+    stop = check_stop_sequences(args.stop, "--stop")
+    full = ModelTier(FULL, model, args.max_tokens, args.temperature, stop)
+    fast = ModelTier(FAST, args.fast_model or model, args.fast_max_tokens, args.fast_temperature, stop)
+    return ModelRouter(
+        fast=fast, full=full, enabled=bool(args.fast_model), overrides=load_generation_overrides(args.generation)
+    )
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    if args.output.exists() and not args.resume:
+        raise SystemExit(f"{args.output} exists; pass --resume to continue it or choose another file")
+
+    llm_client = create_llm_client(args.provider, model=args.model, base_url=args.base_url)
+    router = build_router(args, llm_client.model)
+    system_prompt = args.system_prompt.read_text(encoding="utf-8").strip() if args.system_prompt.exists() else ""
+
+    collector = None
+    if args.batch:
+        collector = BatchCollector(llm_client, max_batch_size=args.batch_size, poll_interval=args.poll_interval)
+
+    redis_client = None
+    if args.redis:
+        redis_client = create_redis(args.redis, cluster=args.redis_cluster)
+        conversations = iter_redis(redis_client)
+    else:
+        conversations = iter_jsonl(args.input)
+    try:
+        return await replay(
+            conversations,
+            llm_client,
+            args.output,
+            router,
+            system_prompt=system_prompt,
+            concurrency=args.concurrency,
+            turns=args.turns,
+            resume=args.resume,
+            collector=collector,
+        )
+    finally:
+        await llm_client.aclose()
+        if redis_client is not None:
+            await redis_client.aclose()
+
+
+def main(argv: List[str] | None = None) -> int:
+    summary = asyncio.run(_main(_parse_args(sys.argv[1:] if argv is None else argv)))
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
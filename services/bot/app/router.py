@@ -0,0 +1,207 @@
+import json
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List
+
+FAST = "fast"
+FULL = "full"
+
+_WORD_RE = re.compile(r"\w+")
+
+# Messages made only of these words are small talk the fast tier handles well
+_SMALL_TALK = frozenset({
+    "hola", "buenas", "buenos", "dias", "tardes", "noches", "hey", "hi", "hello", "saludos",
+    "gracias", "muchas", "mil", "thanks", "ok", "okay", "vale", "listo", "perfecto", "genial",
+    "excelente", "bien", "muy", "entendido", "claro", "adios", "chao", "bye", "nos", "vemos",
+    "hasta", "luego", "pronto", "que", "tal", "como", "estas", "esta", "todo", "va",
+})
+
+_AFFIRMATIONS = frozenset({"si", "ok", "okay", "vale", "claro", "dale", "va", "listo", "por", "favor", "porfa"})
+
+# Any of these needs the full model: pricing, technical detail, summaries, complaints
+_COMPLEX_HINTS = frozenset({
+    "precio", "precios", "costo", "costos", "cotizacion", "cotizar", "presupuesto", "descuento",
+    "factura", "pago", "pagos", "envio", "garantia", "devolucion", "reembolso", "contrato",
+    "tecnico", "tecnica", "especificaciones", "compatible", "instalacion", "configurar",
+    "configuracion", "error", "falla", "problema", "soporte", "comparar", "diferencia",
+    "recomienda", "recomendacion", "resumen", "resume", "explica", "explicame", "porque",
+    "disponibilidad", "stock", "inventario",
+})
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    name: str
+    model: str
+    max_tokens: int
+    # None keeps the client default
+    temperature: float | None = None
+    # Generation ends at the first of these (e.g. a sign-off the prompt asks for)
+    stop: tuple[str, ...] = ()
+
+
+# Generation parameters a per-reason override may change
+_GENERATION_FIELDS = frozenset({"max_tokens", "temperature", "stop"})
+
+# Stop sequences accepted by every provider (OpenAI takes 4, Gemini 5)
+MAX_STOP_SEQUENCES = 4
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    tier: ModelTier
+    reason: str
+
+
+def assistant_asked_question(history: List[dict]) -> bool:
+    """True if the assistant's last turn ended with a question."""
+    last_assistant = next((m for m in reversed(history) if m.get("role") == "assistant"), None)
+    return bool(last_assistant) and (last_assistant.get("content") or "").rstrip().endswith("?")
+
+
+def load_generation_overrides(path: Path) -> dict[str, dict]:
+    """
+    Load per-route-reason generation parameters; a missing file yields none.
+
+    Expected format::
+
+        {"reasons": {"small_talk": {"max_tokens": 120, "temperature": 0.5,
+                                    "stop": ["\\n\\n"]}}}
+
+    Reasons without an entry keep the tier's own parameters.
+
+    Raises:
+        ValueError: if an override sets anything but max_tokens, temperature
+            or stop, or lists more than ``MAX_STOP_SEQUENCES`` stop sequences
+    """
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    overrides = {}
+    for reason, params in data.get("reasons", {}).items():
+        unknown = set(params) - _GENERATION_FIELDS
+        if unknown:
+            raise ValueError(f"unknown generation parameters for {reason!r}: {sorted(unknown)}")
+        if "stop" in params:
+            params = {**params, "stop": check_stop_sequences(params["stop"], reason)}
+        overrides[reason] = params
+    return overrides
+
+
+def check_stop_sequences(stop, source: str) -> tuple[str, ...]:
+    """
+    Validate a stop-sequence list; providers would silently drop the extras.
+
+    Raises:
+        ValueError: more than ``MAX_STOP_SEQUENCES`` sequences
+    """
+    stop = tuple(stop)
+    if len(stop) > MAX_STOP_SEQUENCES:
+        raise ValueError(f"{source!r} sets {len(stop)} stop sequences; at most {MAX_STOP_SEQUENCES} are supported")
+    return stop
+
+
+def _normalize_words(text: str) -> List[str]:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _WORD_RE.findall(stripped)
+
+
+class ModelRouter:
+    """
+    Local, network-free classifier that picks a model tier for each turn.
+
+    Short small talk (greetings, thanks, acknowledgments) goes to the fast
+    tier; everything else, and in particular long, technical or commercial
+    messages and replies to a question the assistant just asked, goes to
+    the full tier. Decisions and LLM
+    latency are counted per tier so the cost/latency impact can be measured.
+
+    Generation parameters (max tokens, temperature, stop sequences) come
+    from the chosen tier and can be narrowed per decision reason, so small
+    talk gets a one-line budget while a quote keeps the full one.
+    """
+
+    def __init__(
+        self,
+        fast: ModelTier,
+        full: ModelTier,
+        enabled: bool = True,
+        max_fast_words: int = 8,
+        overrides: dict[str, dict] | None = None,
+    ):
+        """
+        Args:
+            fast: Cheap, low-latency tier for small talk
+            full: Default tier for everything else
+            enabled: When False every turn goes to the full tier
+            max_fast_words: Longest message (in words) eligible for the fast tier
+            overrides: Generation parameters by decision reason, applied on top of the tier
+        """
+        self.fast = fast
+        self.full = full
+        self._enabled = enabled
+        self._max_fast_words = max_fast_words
+        self._overrides = overrides or {}
+        self._decisions: Counter = Counter()
+        self._latency_total: Counter = Counter()
+        self._latency_count: Counter = Counter()
+
+    def classify(self, text: str, history: List[dict]) -> RouteDecision:
+        if not self._enabled:
+            return RouteDecision(self.full, "tiering_disabled")
+
+        words = _normalize_words(text)
+        if not words:
+            return RouteDecision(self.fast, "empty")
+        if len(words) > self._max_fast_words:
+            return RouteDecision(self.full, "long_message")
+        if any(word in _COMPLEX_HINTS for word in words):
+            return RouteDecision(self.full, "complex_keyword")
+
+        if assistant_asked_question(history):
+            # "sí" after "¿Deseas que te envíe una cotización?" starts real work
+            if all(word in _AFFIRMATIONS for word in words):
+                return RouteDecision(self.full, "answers_assistant_question")
+
+        if all(word in _SMALL_TALK for word in words):
+            return RouteDecision(self.fast, "small_talk")
+        return RouteDecision(self.full, "default")
+
+    def route(self, text: str, history: List[dict], downgrade: bool = False) -> RouteDecision:
+        """
+        Classify a turn and count the decision.
+
+        Args:
+            downgrade: Force the fast tier (sender near its quota), even with tiering disabled
+        """
+        decision = self.classify(text, history)
+        if downgrade and decision.tier is not self.fast:
+            decision = RouteDecision(self.fast, "quota")
+        self._decisions[(decision.tier.name, decision.reason)] += 1
+        override = self._overrides.get(decision.reason)
+        if override:
+            # Same tier name, so stats and latency still aggregate per tier
+            decision = RouteDecision(replace(decision.tier, **override), decision.reason)
+        return decision
+
+    def record_latency(self, tier: ModelTier, seconds: float):
+        self._latency_total[tier.name] += seconds
+        self._latency_count[tier.name] += 1
+
+    def stats(self) -> dict:
+        tiers = {}
+        for tier in (self.fast, self.full):
+            count = self._latency_count[tier.name]
+            tiers[tier.name] = {
+                "model": tier.model,
+                "max_tokens": tier.max_tokens,
+                "temperature": tier.temperature,
+                "requests": sum(n for (name, _), n in self._decisions.items() if name == tier.name),
+                "avg_latency_ms": round(self._latency_total[tier.name] / count * 1000, 1) if count else None,
+            }
+        reasons = {f"{name}:{reason}": n for (name, reason), n in sorted(self._decisions.items())}
+        return {"enabled": self._enabled, "tiers": tiers, "reasons": reasons, "overrides": self._overrides}
@@ -0,0 +1,154 @@
+import asyncio
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from redis.asyncio import Redis
+
+from .fallback import REDIS_DOWN_ERRORS, RedisHealth
+from .redis_backend import sender_key
+
+
+# Grant the lock and hand out the next fencing token in one atomic step, so
+# tokens are ordered exactly like lock acquisitions.
+_ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    local token = redis.call('incr', KEYS[2])
+    redis.call('pexpire', KEYS[2], ARGV[3])
+    return token
+end
+return 0
+"""
+
+# Only the owner may release; an expired lock re-acquired by someone else is left alone.
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LockTimeout(Exception):
+    """Raised when a sender lock could not be acquired in time."""
+
+
+def lock_key(sender: str) -> str:
+    return sender_key("lock", sender)
+
+
+def fence_key(sender: str) -> str:
+    return sender_key("lockfence", sender)
+
+
+class SenderLock:
+    """
+    Per-sender mutual exclusion across replicas.
+
+    A Redis lock (SET NX PX) serializes turns of the same sender while
+    unrelated senders proceed in parallel. Every acquisition returns a
+    monotonically increasing fencing token that writers pass to
+    ``ConversationMemory.append_message`` so a holder whose lock expired
+    cannot overwrite newer state. Waiters on the same replica queue on a
+    local ``asyncio.Lock`` first, so only one of them polls Redis.
+
+    With a ``health`` monitor, while Redis is down the local lock alone
+    serializes the sender's turns on this replica and no fencing token is
+    issued.
+    """
+
+    def __init__(
+        self,
+        redis_url: str | None = None,
+        ttl_ms: int = 60_000,
+        acquire_timeout: float = 30.0,
+        retry_interval: float = 0.05,
+        redis: Redis | None = None,
+        health: RedisHealth | None = None,
+    ):
+        """
+        Args:
+            redis_url: Redis connection URL (ignored when ``redis`` is given)
+            ttl_ms: Lock lease; must exceed the slowest expected turn
+            acquire_timeout: Maximum seconds to wait for the lock
+            retry_interval: Initial polling interval while the lock is held elsewhere
+            redis: Shared Redis client to reuse instead of opening a new pool
+            health: Redis health monitor; enables local-only locking while Redis is down
+        """
+        if redis is None and not redis_url:
+            raise ValueError("SenderLock requires redis_url or redis")
+        self._redis = redis if redis is not None else Redis.from_url(redis_url)
+        self._ttl_ms = ttl_ms
+        self._acquire_timeout = acquire_timeout
+        self._retry_interval = retry_interval
+        # Fencing counters outlive any lease and the 24h conversation TTL
+        self._fence_ttl_ms = 2 * 24 * 3600 * 1000
+        # sender -> [local lock, number of tasks using it]
+        self._local: dict[str, list] = {}
+        self._health = health
+
+    @asynccontextmanager
+    async def hold(self, sender: str) -> AsyncIterator[int | None]:
+        """
+        Hold the sender lock for the duration of the block.
+
+        Yields:
+            Fencing token for this acquisition; None when Redis is down and
+            only the local lock is held
+
+        Raises:
+            LockTimeout: if the lock is not acquired within ``acquire_timeout``
+        """
+        entry = self._local.setdefault(sender, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            deadline = time.monotonic() + self._acquire_timeout
+            try:
+                await asyncio.wait_for(entry[0].acquire(), timeout=self._acquire_timeout)
+            except asyncio.TimeoutError:
+                raise LockTimeout("timed out waiting for local lock")
+            try:
+                owner = uuid.uuid4().hex
+                token = await self._acquire(sender, owner, deadline)
+                try:
+                    yield token
+                finally:
+                    if token is not None:
+                        await self._release(sender, owner)
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._local.pop(sender, None)
+
+    async def _acquire(self, sender: str, owner: str, deadline: float) -> int | None:
+        delay = self._retry_interval
+        while True:
+            if self._health is not None and not self._health.available:
+                return None
+            try:
+                token = await self._redis.eval(
+                    _ACQUIRE_SCRIPT, 2, lock_key(sender), fence_key(sender), owner, self._ttl_ms, self._fence_ttl_ms
+                )
+            except REDIS_DOWN_ERRORS as exc:
+                if self._health is None:
+                    raise
+                self._health.report_failure(exc)
+                return None
+            if token:
+                return int(token)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LockTimeout("timed out waiting for sender lock")
+            await asyncio.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+            delay = min(delay * 2, 0.5)
+
+    async def _release(self, sender: str, owner: str):
+        try:
+            await self._redis.eval(_RELEASE_SCRIPT, 1, lock_key(sender), owner)
+        except Exception:
+            # The lease expires on its own; never mask the caller's outcome
+            pass
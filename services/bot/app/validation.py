@@ -1,8 +1,23 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from .media import SUPPORTED_MEDIA_TYPES
 
 
 class IncomingWhatsApp(BaseModel):
     from_number: str = Field(..., alias="from")
-    text: str
+    text: str | None = None
+    # Media messages forwarded by n8n: {"from", "type": "audio"|"image", "media_id", ...}
+    type: str = "text"
+    media_id: str | None = None
+    mime_type: str | None = None
+    caption: str | None = None
 
     model_config = {"populate_by_name": True}
+
+    @model_validator(mode="after")
+    def _check_content(self):
+        if self.type == "text" and self.text is None:
+            raise ValueError("text is required for text messages")
+        if self.type in SUPPORTED_MEDIA_TYPES and not self.media_id:
+            raise ValueError("media_id is required for media messages")
+        return self
@@ -1,11 +1,54 @@
 import os
+import re
 import httpx
 import logging
+from typing import BinaryIO, List
 
 logger = logging.getLogger(__name__)
 
 
 WHATSAPP_API_VERSION = "v21.0"
+# Longest text message body the Cloud API accepts
+WHATSAPP_TEXT_LIMIT = 4096
+
+# Preferred split points, best first: paragraph, line, sentence end, any space
+_BREAKS = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"[.!?…](?=\s)"), re.compile(r"\s"))
+
+
+class MediaTooLargeError(Exception):
+    """Raised when a media download exceeds the configured size limit."""
+
+
+def split_message(text: str, limit: int = WHATSAPP_TEXT_LIMIT) -> List[str]:
+    """
+    Split a reply into parts WhatsApp accepts, in reading order.
+
+    Each cut is made at the last paragraph break, line break, sentence end
+    or space in the second half of the allowed window, and only falls back
+    to a hard cut for a run without any of them.
+
+    Args:
+        text: Reply text
+        limit: Longest part, in characters
+
+    Returns:
+        Non-empty parts of at most ``limit`` characters
+    """
+    parts = []
+    text = text.strip()
+    while len(text) > limit:
+        window = text[:limit + 1]
+        cut = limit
+        for pattern in _BREAKS:
+            ends = [match.end() for match in pattern.finditer(window, limit // 2) if match.end() <= limit]
+            if ends:
+                cut = ends[-1]
+                break
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
 
 
 class WhatsAppClient:
@@ -13,30 +56,122 @@ class WhatsAppClient:
         self.token = token or os.getenv("WHATSAPP_TOKEN")
         self.phone_id = phone_id or os.getenv("WHATSAPP_PHONE_ID")
         self.base = "https://graph.facebook.com"
+        self._http: httpx.AsyncClient | None = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # One pooled client: replies reuse the TLS connection to the Graph API
+        # instead of paying a handshake (and SSL context setup) per message
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=15.0)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
     async def send_text_message(self, to: str, text: str) -> dict:
+        """
+        Send a text reply, split into several messages above ``WHATSAPP_TEXT_LIMIT``.
+
+        Parts are sent in order; a failed part stops the rest.
+
+        Returns:
+            Graph API response whose ``messages`` lists every part sent
+        """
         if not self.token or not self.phone_id:
             raise RuntimeError("WhatsApp credentials not configured")
+        parts = split_message(text) or [text]
+        if len(parts) > 1:
+            logger.info("Reply of %s chars sent as %s messages", len(text), len(parts))
+        result: dict = {}
+        for part in parts:
+            response = await self._send_text(to, part)
+            if not result:
+                result = response
+            else:
+                result.setdefault("messages", []).extend(response.get("messages", []))
+        return result
+
+    async def _send_text(self, to: str, body: str) -> dict:
         url = f"{self.base}/{WHATSAPP_API_VERSION}/{self.phone_id}/messages"
         headers = {"Authorization": f"Bearer {self.token}"}
         payload = {
             "messaging_product": "whatsapp",
             "to": to,
             "type": "text",
-            "text": {"body": text},
+            "text": {"body": body},
         }
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.post(url, json=payload, headers=headers)
-            if not r.is_success:
+        r = await self._client().post(url, json=payload, headers=headers)
+        if not r.is_success:
+            error_message = None
+            try:
+                body = r.json()
+                error_message = body.get("error", {}).get("message")
+            except Exception:
                 error_message = None
-                try:
-                    body = r.json()
-                    error_message = body.get("error", {}).get("message")
-                except Exception:
-                    error_message = None
-                if error_message:
-                    logger.error(f"WhatsApp API error {r.status_code}: {error_message}")
-                else:
-                    logger.error(f"WhatsApp API error {r.status_code}")
+            if error_message:
+                logger.error("WhatsApp API error %s: %s", r.status_code, error_message)
+            else:
+                logger.error("WhatsApp API error %s", r.status_code)
+        r.raise_for_status()
+        return r.json()
+
+    async def check_credentials(self) -> None:
+        """
+        Confirm the token can read the configured phone number.
+
+        Raises:
+            RuntimeError: Credentials are not configured
+            httpx.HTTPStatusError: The Graph API rejected them (expired token, wrong phone id)
+        """
+        if not self.token or not self.phone_id:
+            raise RuntimeError("WhatsApp credentials not configured")
+        url = f"{self.base}/{WHATSAPP_API_VERSION}/{self.phone_id}"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        r = await self._client().get(url, params={"fields": "id"}, headers=headers)
+        r.raise_for_status()
+
+    async def get_media_info(self, media_id: str) -> dict:
+        """
+        Resolve a media id to its temporary download URL.
+
+        Returns:
+            Graph API media object with 'url', 'mime_type' and 'file_size'
+        """
+        if not self.token:
+            raise RuntimeError("WhatsApp credentials not configured")
+        url = f"{self.base}/{WHATSAPP_API_VERSION}/{media_id}"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        r = await self._client().get(url, headers=headers)
+        r.raise_for_status()
+        return r.json()
+
+    async def download_media(self, url: str, dest: BinaryIO, max_bytes: int) -> int:
+        """
+        Stream a media file into ``dest`` without holding it in memory.
+
+        Args:
+            url: Download URL from ``get_media_info``
+            dest: Writable binary file object
+            max_bytes: Abort once more than this many bytes arrive
+
+        Returns:
+            Number of bytes written
+
+        Raises:
+            MediaTooLargeError: if the file exceeds ``max_bytes``
+        """
+        headers = {"Authorization": f"Bearer {self.token}"}
+        written = 0
+        async with self._client().stream("GET", url, headers=headers, timeout=30.0) as r:
             r.raise_for_status()
-            return r.json()
+            declared = int(r.headers.get("content-length") or 0)
+            if declared > max_bytes:
+                raise MediaTooLargeError(f"media is {declared} bytes (limit {max_bytes})")
+            async for chunk in r.aiter_bytes(64 * 1024):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise MediaTooLargeError(f"media exceeds {max_bytes} bytes")
+                dest.write(chunk)
+        return written
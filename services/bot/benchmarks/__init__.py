@@ -0,0 +1 @@
+"""Benchmark suite for the bot service (see __main__.py)."""
@@ -0,0 +1,37 @@
+"""
+Run the benchmark suite from services/bot:
+
+    python -m benchmarks              # every benchmark
+    python -m benchmarks startup      # only modules whose name contains "startup"
+"""
+import importlib
+import sys
+
+BENCHMARKS = [
+    "bench_startup",
+    "bench_sender_lock",
+    "bench_intents",
+    "bench_cleaner",
+    "bench_generation",
+    "bench_webhook",
+    "bench_logging",
+    "bench_profiling",
+    "bench_replay",
+]
+
+
+def main(argv: list[str]) -> int:
+    selected = [name for name in BENCHMARKS if not argv or any(arg in name for arg in argv)]
+    if not selected:
+        print(f"No benchmark matches {argv}; available: {', '.join(BENCHMARKS)}")
+        return 1
+    for name in selected:
+        module = importlib.import_module(f"benchmarks.{name}")
+        print(f"== {name}")
+        for result in module.run():
+            print(result.format())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,44 @@
+"""
+clean_text cost per message on realistic and adversarial inputs.
+
+``legacy`` is the previous two-regex implementation, kept here as the
+baseline; ``capped`` applies the production MAX_INPUT_CHARS limit.
+"""
+import re
+from typing import List
+
+from app.cleaner import clean_text
+from app.main import INPUT_TRUNCATION, MAX_INPUT_CHARS
+from .common import BenchResult, measure
+
+SAMPLES = {
+    "short": "hola, ¿tienen envío a Monterrey?",
+    "sentence_emoji": "¡Muchas gracias! 🙏 Quisiera 20 laptops 💻 con garantía extendida para la oficina 👨‍👩‍👧",
+    "multiline": "Buenas tardes\n\nNecesito:\n- 10 monitores\n- 5 teclados\n\t- 5 mouse\n\nSaludos",
+    "paste_64k": ("Cláusula 4.2: el proveedor entregará los equipos en un plazo de 30 días. " * 900)[:65536],
+    "whitespace_64k": " \t\n" * 21845,
+    "zero_width_64k": "a​" * 32768,
+    "controls_64k": "x\x00\x1b" * 21845,
+    "combining_64k": "é" * 32768,
+}
+
+
+def _legacy_clean_text(text: str) -> str:
+    if not text:
+        return ""
+    s = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"[\x00-\x1F\x7F]+", "", s)
+
+
+def run(repeat: int = 2000) -> List[BenchResult]:
+    results = []
+    for name, text in SAMPLES.items():
+        n = repeat if len(text) < 1000 else repeat // 10
+        results.append(measure(f"cleaner.legacy.{name}", lambda text=text: _legacy_clean_text(text), n))
+        results.append(measure(f"cleaner.clean_text.{name}", lambda text=text: clean_text(text), n))
+        results.append(measure(
+            f"cleaner.capped.{name}",
+            lambda text=text: clean_text(text, max_chars=MAX_INPUT_CHARS, truncation=INPUT_TRUNCATION),
+            n,
+        ))
+    return results
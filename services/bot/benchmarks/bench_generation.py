@@ -0,0 +1,67 @@
+"""
+Reply latency by generation parameters against the local fake LLM server.
+
+The fake model writes a long answer (``REPLY_TOKENS``) at ``TOKEN_MS`` per
+token, so latency tracks how many tokens max_tokens and stop sequences let
+it generate, like decode time on a real provider. The benchmark name
+carries the mean completion tokens and the share of replies cut off at
+max_tokens. Also times ``split_message`` on an oversized reply.
+"""
+import asyncio
+import time
+from typing import List
+
+from app.llm import FINISH_LENGTH, create_llm_client, trim_to_sentence
+from app.whatsapp_client import WHATSAPP_TEXT_LIMIT, split_message
+from .common import BenchResult, measure
+from .fake_llm import running_server
+
+CALLS = 40
+LATENCY_MS = 20.0
+TOKEN_MS = 1.0
+REPLY_TOKENS = 600
+MESSAGES = [{"role": "user", "content": "¿Qué incluye el plan empresarial?"}]
+
+# name -> (max_tokens, stop sequences)
+CONFIGS = {
+    "max800": (800, ()),
+    "max400": (400, ()),
+    "max120": (120, ()),
+    "max800+stop_paragraph": (800, ("\n\n",)),
+}
+
+
+async def _calls(base: str, max_tokens: int, stop: tuple) -> tuple[List[float], List[int], int]:
+    client = create_llm_client("openai", model="fake-model", base_url=f"{base}/v1")
+    samples, tokens, cut = [], [], 0
+    try:
+        for _ in range(CALLS):
+            started = time.perf_counter()
+            completion = await client.complete(MESSAGES, max_tokens=max_tokens, stop=stop)
+            if completion.finish_reason == FINISH_LENGTH:
+                trim_to_sentence(completion.text)
+                cut += 1
+            samples.append((time.perf_counter() - started) * 1000)
+            tokens.append(completion.completion_tokens or 0)
+    finally:
+        await client.aclose()
+    return samples, tokens, cut
+
+
+def run() -> List[BenchResult]:
+    results = []
+    with running_server(latency_ms=LATENCY_MS, jitter_ms=2, token_ms=TOKEN_MS, reply_tokens=REPLY_TOKENS) as base:
+        for name, (max_tokens, stop) in CONFIGS.items():
+            samples, tokens, cut = asyncio.run(_calls(base, max_tokens, stop))
+            mean_tokens = round(sum(tokens) / len(tokens))
+            results.append(BenchResult(
+                f"generation.{name} ({mean_tokens} tok, {cut * 100 // CALLS}% cut)", samples
+            ))
+
+    long_reply = ("Este es un párrafo de la respuesta con varias oraciones. " * 12 + "\n\n") * 30
+    results.append(measure(
+        f"split_message.{len(long_reply)}ch/{WHATSAPP_TEXT_LIMIT}",
+        lambda: split_message(long_reply),
+        repeat=2000,
+    ))
+    return results
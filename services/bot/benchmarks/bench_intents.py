@@ -0,0 +1,23 @@
+"""
+Canned-reply matching cost per message, on the shipped intent table.
+"""
+from typing import List
+
+from app.intents import IntentMatcher
+from app.main import INTENTS_PATH
+from .common import BenchResult, measure
+
+SAMPLES = {
+    "hit_short": "hola",
+    "hit_multiword": "¡Muchas gracias! 🙏",
+    "miss_sentence": "Hola, quisiera una cotización para 20 laptops con garantía extendida",
+    "miss_long": "necesito ayuda con la instalación " * 40,
+}
+
+
+def run(repeat: int = 20000) -> List[BenchResult]:
+    matcher = IntentMatcher.from_file(INTENTS_PATH)
+    results = [measure("intents.load_and_compile", lambda: IntentMatcher.from_file(INTENTS_PATH), 200)]
+    for name, text in SAMPLES.items():
+        results.append(measure(f"intents.match.{name}", lambda text=text: matcher.match(text, []), repeat))
+    return results
@@ -0,0 +1,109 @@
+"""
+Caller-side logging cost of one webhook turn.
+
+Each turn logs what the bot logs for a message (processing, routing,
+generation, delivery) plus a DEBUG dump of the conversation that is
+disabled at INFO. ``basic_text.fstring`` is the previous setup: a
+``StreamHandler`` writing on the calling thread and messages built with
+f-strings, so the disabled DEBUG line is still formatted. The ``queue``
+variants use ``configure_logging``: %-style arguments, records handed to a
+background thread that formats and writes them. Output goes to a real
+file, then to a sink that takes ``SLOW_WRITE_MS`` per write, like a stdout
+pipe the container log driver is slow to drain. Only the time spent in the
+logging calls is measured, which is what the event loop pays.
+"""
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+from app.logs import TEXT, configure_logging, correlation_id
+from .common import BenchResult
+
+TURNS = 3000
+SLOW_TURNS = 300
+SLOW_WRITE_MS = 0.2
+SENDER = "***1234"
+HISTORY = [{"role": "user" if i % 2 else "assistant", "content": "¿Tienen envío a Monterrey? " * 8} for i in range(20)]
+
+
+def _fstring_turn(logger: logging.Logger, turn: int) -> None:
+    logger.info(f"Processing message from {SENDER}: {57} chars")
+    logger.debug(f"Conversation for {SENDER}: {HISTORY}")
+    logger.info(f"Routing {SENDER} -> {'full'} ({'default'})")
+    logger.info(f"Generated response for {SENDER}: {412} tokens in {830.4:.0f}ms")
+    logger.info(f"Sent reply to {SENDER}: {turn}")
+
+
+def _lazy_turn(logger: logging.Logger, turn: int) -> None:
+    logger.info("Processing message from %s: %s chars", SENDER, 57)
+    logger.debug("Conversation for %s: %s", SENDER, HISTORY)
+    logger.info("Routing %s -> %s (%s)", SENDER, "full", "default")
+    logger.info("Generated response for %s: %s tokens in %.0fms", SENDER, 412, 830.4)
+    logger.info("Sent reply to %s: %s", SENDER, turn)
+
+
+class _SlowSink:
+    """Write target that blocks ``SLOW_WRITE_MS`` per write."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        time.sleep(SLOW_WRITE_MS / 1000)
+        return self._stream.write(text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+
+def _run_turns(logger: logging.Logger, turn_fn: Callable[[logging.Logger, int], None], turns: int) -> List[float]:
+    samples = []
+    for turn in range(turns):
+        token = correlation_id.set(f"bench-{turn:08d}")
+        try:
+            started = time.perf_counter()
+            turn_fn(logger, turn)
+            samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            correlation_id.reset(token)
+    return samples
+
+
+def _basic(path: str, logger: logging.Logger, slow: bool = False) -> List[float]:
+    with open(path, "a", encoding="utf-8") as stream:
+        handler = logging.StreamHandler(_SlowSink(stream) if slow else stream)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logger.handlers = [handler]
+        logger.setLevel(logging.INFO)
+        return _run_turns(logger, _fstring_turn, SLOW_TURNS if slow else TURNS)
+
+
+def _queued(path: str, logger: logging.Logger, slow: bool = False, **kwargs) -> List[float]:
+    with open(path, "a", encoding="utf-8") as stream:
+        sink = _SlowSink(stream) if slow else stream
+        listener = configure_logging(level=logging.INFO, stream=sink, logger=logger, **kwargs)
+        try:
+            return _run_turns(logger, _lazy_turn, SLOW_TURNS if slow else TURNS)
+        finally:
+            listener.stop()
+
+
+def run() -> List[BenchResult]:
+    logger = logging.getLogger("bench.logging")
+    logger.propagate = False
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bot.log")
+        for name, fn in (
+            ("basic_text.fstring", lambda: _basic(path, logger)),
+            ("queue_text.lazy", lambda: _queued(path, logger, fmt=TEXT)),
+            ("queue_json.lazy", lambda: _queued(path, logger)),
+            ("queue_json.lazy.sampled10%", lambda: _queued(path, logger, sample_rate=0.1)),
+            ("slow.basic_text.fstring", lambda: _basic(path, logger, slow=True)),
+            ("slow.queue_json.lazy", lambda: _queued(path, logger, slow=True)),
+        ):
+            results.append(BenchResult(f"logging.{name}/turn", fn()))
+        logger.handlers = []
+    return results
@@ -0,0 +1,72 @@
+"""
+Overhead of the latency diagnostics.
+
+``tracking`` times the instrumentation of one webhook turn (a tracked
+request with the stages ``_process_turn`` marks) against the same code
+with tracking disabled. ``profiler`` runs a CPU-bound event-loop workload
+alone and while ``SamplingProfiler`` samples the loop thread, at the
+default 5 ms interval and at 1 ms.
+"""
+import asyncio
+import time
+from typing import List
+
+from app.profiling import SamplingProfiler, SlowRequestRecorder, record_stage, stage
+from .common import BenchResult, measure
+
+STAGES = ("read_body", "auth", "parse", "clean", "rate_limit", "history", "intents", "quota",
+          "concurrency_slot", "memory_write", "llm", "memory_write", "whatsapp_send")
+WORKLOAD_ROUNDS = 200
+
+
+def _turn(recorder: SlowRequestRecorder):
+    with recorder.track("whatsapp_webhook"):
+        for name in STAGES[:-2]:
+            with stage(name):
+                pass
+        started = time.perf_counter()
+        record_stage("sender_lock", started)
+        with stage(STAGES[-1]):
+            pass
+
+
+def _work():
+    total = 0
+    for i in range(20_000):
+        total += i * i % 7
+    return total
+
+
+async def _workload() -> List[float]:
+    samples = []
+    for _ in range(WORKLOAD_ROUNDS):
+        started = time.perf_counter()
+        _work()
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0)
+    return samples
+
+
+async def _profiled(interval: float) -> List[float]:
+    profiler = SamplingProfiler(interval=interval)
+    profiling = asyncio.create_task(profiler.profile(60))
+    await asyncio.sleep(0.01)
+    try:
+        return await _workload()
+    finally:
+        profiler.stop()
+        await profiling
+
+
+def run() -> List[BenchResult]:
+    # Threshold high enough that nothing is recorded: pure tracking cost
+    tracked = SlowRequestRecorder(threshold_ms=10_000)
+    disabled = SlowRequestRecorder(threshold_ms=0)
+    results = [
+        measure("tracking.disabled/turn", lambda: _turn(disabled), repeat=20_000),
+        measure("tracking.enabled/turn", lambda: _turn(tracked), repeat=20_000),
+        BenchResult("profiler.off/round", asyncio.run(_workload())),
+    ]
+    for interval in (0.005, 0.001):
+        results.append(BenchResult(f"profiler.{interval * 1000:g}ms/round", asyncio.run(_profiled(interval))))
+    return results
@@ -0,0 +1,56 @@
+"""
+Offline replay throughput against the local fake LLM server, by concurrency.
+
+Per-call latency is the fake server delay plus client overhead; the
+benchmark name carries the achieved calls/s.
+"""
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from typing import List
+
+from app.llm import create_llm_client
+from app.replay import iter_jsonl, replay
+from app.router import FAST, FULL, ModelRouter, ModelTier
+from .common import BenchResult
+from .fake_llm import running_server
+
+CONVERSATIONS = 300
+LATENCY_MS = 50.0
+
+
+def _write_conversations(path: Path):
+    with open(path, "w", encoding="utf-8") as handle:
+        for i in range(CONVERSATIONS):
+            messages = [
+                {"role": "user", "content": "Hola, quisiera una cotización"},
+                {"role": "assistant", "content": "¡Claro! ¿Para cuántas unidades?"},
+                {"role": "user", "content": f"Para {i + 1} laptops con garantía extendida"},
+            ]
+            handle.write(json.dumps({"id": f"5215{i:08d}", "messages": messages}) + "\n")
+
+
+async def _replay(base: str, source: Path, output: Path, concurrency: int) -> dict:
+    client = create_llm_client("openai", model="fake-model", base_url=f"{base}/v1")
+    router = ModelRouter(ModelTier(FAST, "fake-model", 200), ModelTier(FULL, "fake-model", 800), enabled=False)
+    try:
+        return await replay(iter_jsonl(source), client, output, router, concurrency=concurrency)
+    finally:
+        await client.aclose()
+
+
+def run() -> List[BenchResult]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, running_server(latency_ms=LATENCY_MS, jitter_ms=10) as base:
+        source = Path(tmp) / "conversations.jsonl"
+        _write_conversations(source)
+        for concurrency in (1, 8, 32):
+            output = Path(tmp) / f"out-{concurrency}.jsonl"
+            summary = asyncio.run(_replay(base, source, output, concurrency))
+            rows = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+            results.append(BenchResult(
+                f"replay.c{concurrency} ({summary['calls_per_s']} calls/s)",
+                [row["latency_ms"] for row in rows],
+            ))
+    return results
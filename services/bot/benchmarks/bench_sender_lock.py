@@ -0,0 +1,73 @@
+"""
+Per-sender lock overhead against a real Redis (BENCH_REDIS_URL).
+
+Compares a bare PING round trip with an uncontended acquire/release, and
+checks that unrelated senders holding their locks concurrently finish in
+roughly one hold period rather than N of them.
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import List
+
+from redis.asyncio import Redis
+
+from app.sender_lock import SenderLock
+from .common import BenchResult, measure_async
+
+HOLD_SECONDS = 0.01
+PARALLEL_SENDERS = 50
+
+
+async def _run(redis: Redis, repeat: int) -> List[BenchResult]:
+    lock = SenderLock(redis=redis)
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    counter = iter(range(10**9))
+
+    async def hold_once():
+        async with lock.hold(f"{prefix}-{next(counter)}"):
+            pass
+
+    async def hold_same():
+        async with lock.hold(f"{prefix}-same"):
+            pass
+
+    async def parallel_round():
+        async def turn(i: int):
+            async with lock.hold(f"{prefix}-p{i}"):
+                await asyncio.sleep(HOLD_SECONDS)
+        await asyncio.gather(*(turn(i) for i in range(PARALLEL_SENDERS)))
+
+    results = [
+        await measure_async("redis.ping", redis.ping, repeat),
+        await measure_async("sender_lock.acquire_release", hold_once, repeat),
+        await measure_async("sender_lock.acquire_release_same_key", hold_same, repeat),
+    ]
+    parallel = await measure_async(
+        f"sender_lock.parallel_{PARALLEL_SENDERS}x{int(HOLD_SECONDS * 1000)}ms", parallel_round, 20
+    )
+    results.append(parallel)
+
+    keys = [key async for key in redis.scan_iter(match=f"*{prefix}*")]
+    if keys:
+        await redis.delete(*keys)
+    return results
+
+
+def run(repeat: int = 500) -> List[BenchResult]:
+    url = os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/0")
+
+    async def main():
+        redis = Redis.from_url(url)
+        try:
+            try:
+                await asyncio.wait_for(redis.ping(), timeout=1.0)
+            except Exception as exc:
+                print(f"skipped: Redis not reachable at {url} ({exc.__class__.__name__})")
+                return []
+            return await _run(redis, repeat)
+        finally:
+            await redis.aclose()
+
+    return asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Cold start: app import time, lifespan startup and first-request latency.
+
+Each sample runs in a fresh interpreter so module caches do not hide
+import cost. Redis does not need to be reachable: /health reports
+"degraded" but the request path is still exercised end to end.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+from .common import BenchResult
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+
+_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+t2 = time.perf_counter()
+with TestClient(app.main.app) as client:
+    t3 = time.perf_counter()
+    client.get("/health")
+    t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "lifespan_ms": (t3 - t2) * 1000,
+    "first_request_ms": (t4 - t3) * 1000,
+}))
+"""
+
+
+def _probe_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("LLM_PROVIDER", "gemini")
+    env.setdefault("GOOGLE_API_KEY", "bench-key")
+    env.setdefault("OPENAI_API_KEY", "bench-key")
+    env.setdefault("BOT_SECRET", "bench-secret")
+    env["REDIS_URL"] = os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/0")
+    return env
+
+
+def run(repeat: int = 5) -> List[BenchResult]:
+    samples: dict[str, list[float]] = {"import_ms": [], "lifespan_ms": [], "first_request_ms": []}
+    env = _probe_env()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=BOT_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings = json.loads(out.stdout.strip().splitlines()[-1])
+        for key, value in timings.items():
+            samples[key].append(value)
+    return [BenchResult(f"startup.{key}", values) for key, values in samples.items()]
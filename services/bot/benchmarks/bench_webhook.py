@@ -0,0 +1,188 @@
+"""
+Webhook path latency: Meta -> bot (signed, direct) against Meta -> n8n -> bot.
+
+The bot runs the real webhook handler over HTTP with in-memory stand-ins
+for Redis-backed components, the fake LLM server behind it and a
+WhatsApp client that records when the reply is sent. The n8n hop is a
+relay doing what the "Send to Bot" node does: map the first message to
+the internal format, POST it with ``x-bot-secret`` and answer Meta once
+the bot returns. It measures the extra HTTP hop only; n8n's own
+per-execution overhead comes on top in production.
+
+``ack`` is when Meta gets its 200, ``reply`` when the WhatsApp reply is sent.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Iterator, List
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+import app.main as main
+from app.concurrency import AdaptiveConcurrencyLimiter
+from app.intents import IntentMatcher
+from app.llm import create_llm_client
+from app.meta_webhook import sign
+from app.quota import ALLOW, QuotaDecision
+from app.router import FAST, FULL, ModelRouter, ModelTier
+from .common import BenchResult
+from .fake_llm import running_server
+
+MESSAGES = 100
+LLM_LATENCY_MS = 50.0
+APP_SECRET = "bench-app-secret"
+BOT_SECRET = "bench-bot-secret"
+
+
+class _Memory:
+    def __init__(self):
+        self._conversations: dict[str, list] = {}
+
+    async def get_conversation(self, sender):
+        return list(self._conversations.get(sender, []))
+
+    async def append_message(self, sender, role, content, fence=None):
+        self._conversations.setdefault(sender, []).append({"role": role, "content": content})
+
+
+class _RateLimiter:
+    async def check_rate_limit(self, sender):
+        return True, 1, 10
+
+
+class _SenderLock:
+    @asynccontextmanager
+    async def hold(self, sender):
+        yield 1
+
+
+class _Quota:
+    async def check(self, sender):
+        return QuotaDecision(ALLOW)
+
+    async def record(self, *args, **kwargs):
+        pass
+
+
+class _WhatsApp:
+    """Records when each sender's reply goes out."""
+
+    def __init__(self):
+        self.sent: dict[str, float] = {}
+        self.events: dict[str, threading.Event] = {}
+
+    async def send_text_message(self, to, text):
+        self.sent[to] = time.perf_counter()
+        self.events.setdefault(to, threading.Event()).set()
+        return {"messages": [{"id": f"wamid.{to}"}]}
+
+
+@contextmanager
+def _serve(app: FastAPI) -> Iterator[str]:
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def _relay_app(bot_url: str) -> FastAPI:
+    """What the n8n flow does for a message: forward messages[0] and wait for the bot."""
+    relay = FastAPI()
+    client = httpx.AsyncClient(timeout=30.0)
+
+    @relay.post("/webhook/whatsapp")
+    async def forward(request: Request):
+        body = await request.json()
+        msg = body["entry"][0]["changes"][0]["value"]["messages"][0]
+        await client.post(
+            f"{bot_url}/webhook/whatsapp",
+            json={"from": msg["from"], "type": msg["type"], "text": msg.get("text", {}).get("body")},
+            headers={"x-bot-secret": BOT_SECRET},
+        )
+        return {"status": "ok"}
+
+    return relay
+
+
+def _install(llm_base: str) -> _WhatsApp:
+    whatsapp = _WhatsApp()
+    main.BOT_SECRET = BOT_SECRET
+    main.META_APP_SECRET = APP_SECRET
+    main.memory = _Memory()
+    main.rate_limiter = _RateLimiter()
+    main.sender_lock = _SenderLock()
+    main.quota = _Quota()
+    main.whatsapp_client = whatsapp
+    main.intent_matcher = IntentMatcher([], {})
+    main.single_flight = None
+    main.meta_dedup = None
+    main.concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=64, max_limit=64)
+    main.llm_client = create_llm_client("openai", model="fake-model", base_url=f"{llm_base}/v1")
+    main.model_router = ModelRouter(
+        ModelTier(FAST, "fake-model", 200), ModelTier(FULL, "fake-model", 200), enabled=False
+    )
+    return whatsapp
+
+
+def _meta_body(sender: str) -> bytes:
+    return json.dumps({"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {"messages": [
+        {"id": f"wamid.{sender}", "from": sender, "type": "text", "text": {"body": "¿Tienen envío a Monterrey?"}},
+    ]}}]}]}).encode()
+
+
+def _measure(url: str, whatsapp: _WhatsApp, prefix: str, signed: bool) -> tuple[List[float], List[float]]:
+    acks, replies = [], []
+    with httpx.Client(timeout=30.0) as client:
+        for i in range(MESSAGES):
+            sender = f"{prefix}{i:06d}"
+            body = _meta_body(sender)
+            headers = {"Content-Type": "application/json"}
+            if signed:
+                headers["X-Hub-Signature-256"] = sign(APP_SECRET, body)
+            event = whatsapp.events.setdefault(sender, threading.Event())
+            started = time.perf_counter()
+            client.post(f"{url}/webhook/whatsapp", content=body, headers=headers).raise_for_status()
+            acked = time.perf_counter()
+            event.wait(timeout=30)
+            acks.append((acked - started) * 1000)
+            replies.append((whatsapp.sent[sender] - started) * 1000)
+    return acks, replies
+
+
+def run() -> List[BenchResult]:
+    saved = {name: getattr(main, name) for name in (
+        "BOT_SECRET", "META_APP_SECRET", "memory", "rate_limiter", "sender_lock", "quota", "whatsapp_client",
+        "intent_matcher", "single_flight", "meta_dedup", "concurrency_limiter", "llm_client", "model_router",
+    )}
+    app_logger = logging.getLogger("app")
+    level = app_logger.level
+    # Per-turn INFO logs would dominate the output and the timings
+    app_logger.setLevel(logging.WARNING)
+    try:
+        with running_server(latency_ms=LLM_LATENCY_MS, jitter_ms=0) as llm_base:
+            whatsapp = _install(llm_base)
+            with _serve(main.app) as bot_url, _serve(_relay_app(bot_url)) as relay_url:
+                direct_ack, direct_reply = _measure(bot_url, whatsapp, "52100", signed=True)
+                relay_ack, relay_reply = _measure(relay_url, whatsapp, "52200", signed=False)
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+        app_logger.setLevel(level)
+    return [
+        BenchResult("webhook.direct.ack", direct_ack),
+        BenchResult("webhook.direct.reply", direct_reply),
+        BenchResult("webhook.via_n8n_hop.ack", relay_ack),
+        BenchResult("webhook.via_n8n_hop.reply", relay_reply),
+    ]
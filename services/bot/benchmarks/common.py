@@ -0,0 +1,49 @@
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List
+
+
+@dataclass
+class BenchResult:
+    name: str
+    samples_ms: List[float]
+    unit: str = "ms"
+
+    @property
+    def mean(self) -> float:
+        return statistics.fmean(self.samples_ms) if self.samples_ms else 0.0
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples_ms:
+            return 0.0
+        ordered = sorted(self.samples_ms)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def format(self) -> str:
+        return (
+            f"{self.name:<40} n={len(self.samples_ms):<6} "
+            f"mean={self.mean:10.4f}{self.unit} p50={self.percentile(50):10.4f}{self.unit} "
+            f"p95={self.percentile(95):10.4f}{self.unit}"
+        )
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 1000) -> BenchResult:
+    """Time ``fn`` ``repeat`` times and return per-call samples in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return BenchResult(name, samples)
+
+
+async def measure_async(name: str, fn: Callable[[], Awaitable[object]], repeat: int = 1000) -> BenchResult:
+    """Async counterpart of ``measure``: awaits ``fn()`` ``repeat`` times."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return BenchResult(name, samples)
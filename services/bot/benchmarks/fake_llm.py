@@ -0,0 +1,234 @@
+"""
+Local fake LLM server speaking the OpenAI and Gemini HTTP APIs.
+
+    python -m benchmarks.fake_llm --port 8089 --latency-ms 300
+    python -m app.replay --input conversations.jsonl --output results.jsonl \\
+        --provider openai --base-url http://127.0.0.1:8089/v1
+    (Gemini: --provider gemini --base-url http://127.0.0.1:8089/v1beta)
+
+Replies echo the last user message after a configurable delay and report
+token usage estimated at ~4 characters per token. With ``--reply-tokens``
+the echo is padded with filler paragraphs to that length, and
+``--token-ms`` adds a per-generated-token delay, so max tokens and stop
+sequences shorten replies (and their latency) like a real model; a reply
+cut by max tokens reports ``finish_reason`` length. Batch endpoints (OpenAI
+``/v1/files`` + ``/v1/batches``, Gemini ``:batchGenerateContent``) accept
+jobs and report them completed on the first status check.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Iterator
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+_FILLER = "Este es un detalle adicional de la respuesta simulada. "
+
+
+def _generate(user_text: str, max_tokens: int, stop: list[str], reply_tokens: int) -> tuple[str, bool]:
+    """Reply the fake model would write, cut like a real one; returns (text, hit max_tokens)."""
+    reply = f"Respuesta simulada a: {user_text}"
+    sentences = 0
+    while len(reply) < reply_tokens * 4:
+        sentences += 1
+        reply += ("\n\n" if sentences % 3 == 1 else " ") + _FILLER.strip()
+    for sequence in stop:
+        index = reply.find(sequence)
+        if index >= 0:
+            reply = reply[:index]
+    if len(reply) > max_tokens * 4:
+        return reply[:max_tokens * 4], True
+    return reply, False
+
+
+def _openai_reply(body: dict, reply_tokens: int = 0) -> dict:
+    messages = body.get("messages", [])
+    prompt = json.dumps(messages, ensure_ascii=False)
+    last = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+    stop = body.get("stop") or []
+    reply, cut = _generate(
+        last if isinstance(last, str) else "[multimodal]",
+        body.get("max_tokens", 800),
+        [stop] if isinstance(stop, str) else stop,
+        reply_tokens,
+    )
+    return {
+        "model": body.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "length" if cut else "stop",
+        }],
+        "usage": {
+            "prompt_tokens": _estimate_tokens(prompt),
+            "completion_tokens": _estimate_tokens(reply),
+            "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(reply),
+        },
+    }
+
+
+def _gemini_reply(body: dict, reply_tokens: int = 0) -> dict:
+    contents = body.get("contents", [])
+    prompt = json.dumps(body, ensure_ascii=False)
+    config = body.get("generationConfig", {})
+    user_parts = [p.get("text", "") for c in contents if c.get("role") == "user" for p in c.get("parts", [])]
+    reply, cut = _generate(
+        user_parts[-1] if user_parts else "",
+        config.get("maxOutputTokens", 800),
+        config.get("stopSequences", []),
+        reply_tokens,
+    )
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": reply}]},
+            "finishReason": "MAX_TOKENS" if cut else "STOP",
+        }],
+        "usageMetadata": {
+            "promptTokenCount": _estimate_tokens(prompt),
+            "candidatesTokenCount": _estimate_tokens(reply),
+        },
+    }
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    # Parsed with the stdlib so the fake server needs no python-multipart
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True)
+    raise HTTPException(status_code=400, detail="missing file part")
+
+
+def create_app(
+    latency_ms: float = 300.0, jitter_ms: float = 50.0, token_ms: float = 0.0, reply_tokens: int = 0
+) -> FastAPI:
+    app = FastAPI(title="fake-llm")
+    files: dict[str, str] = {}
+    batches: dict[str, dict] = {}
+
+    async def delay(completion_tokens: int = 0):
+        generation_ms = latency_ms + completion_tokens * token_ms
+        await asyncio.sleep(max(0.0, generation_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        reply = _openai_reply(await request.json(), reply_tokens)
+        await delay(reply["usage"]["completion_tokens"])
+        return reply
+
+    @app.post("/v1/files")
+    async def openai_upload(request: Request):
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        files[file_id] = _multipart_file(request.headers.get("content-type", ""), await request.body()).decode("utf-8")
+        return {"id": file_id, "object": "file", "purpose": "batch"}
+
+    @app.post("/v1/batches")
+    async def openai_create_batch(request: Request):
+        body = await request.json()
+        lines = [json.loads(line) for line in files.get(body["input_file_id"], "").splitlines() if line.strip()]
+        output_id = f"file-{uuid.uuid4().hex[:12]}"
+        files[output_id] = "\n".join(
+            json.dumps({
+                "id": f"batch_req_{i}",
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "body": _openai_reply(line["body"], reply_tokens)},
+                "error": None,
+            })
+            for i, line in enumerate(lines)
+        )
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batches[batch_id] = {"id": batch_id, "status": "validating", "output_file_id": output_id, "error_file_id": None}
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}")
+    async def openai_get_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404)
+        batches[batch_id]["status"] = "completed"
+        return batches[batch_id]
+
+    @app.get("/v1/files/{file_id}/content")
+    async def openai_file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404)
+        return PlainTextResponse(files[file_id])
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        body = await request.json()
+        model, _, action = model_action.partition(":")
+        if action == "batchGenerateContent":
+            requests = body["batch"]["input_config"]["requests"]["requests"]
+            name = f"batches/{uuid.uuid4().hex[:12]}"
+            batches[name] = {
+                "name": name,
+                "metadata": {"state": "BATCH_STATE_PENDING", "model": f"models/{model}"},
+                "response": {"inlinedResponses": {"inlinedResponses": [
+                    {"response": _gemini_reply(item["request"], reply_tokens), "metadata": item.get("metadata", {})}
+                    for item in requests
+                ]}},
+            }
+            return {"name": name, "metadata": batches[name]["metadata"]}
+        reply = _gemini_reply(body, reply_tokens)
+        await delay(reply["usageMetadata"]["candidatesTokenCount"])
+        return reply
+
+    @app.get("/v1beta/batches/{batch_id}")
+    async def gemini_get_batch(batch_id: str):
+        name = f"batches/{batch_id}"
+        if name not in batches:
+            raise HTTPException(status_code=404)
+        batches[name]["metadata"]["state"] = "BATCH_STATE_SUCCEEDED"
+        return batches[name]
+
+    return app
+
+
+@contextmanager
+def running_server(
+    latency_ms: float = 300.0, jitter_ms: float = 50.0, token_ms: float = 0.0, reply_tokens: int = 0
+) -> Iterator[str]:
+    """Serve the fake LLM on a free local port in a background thread; yields its base URL."""
+    app = create_app(latency_ms, jitter_ms, token_ms, reply_tokens)
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fake_llm")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Extra delay per generated token")
+    parser.add_argument("--reply-tokens", type=int, default=0, help="Natural reply length before max tokens/stop")
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.token_ms, args.reply_tokens)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
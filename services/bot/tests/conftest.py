@@ -24,7 +24,11 @@ def app_client(mocker):
     """
     TestClient con todas las dependencias externas mockeadas:
     - Redis (memory, rate_limiter)
+    - Lock distribuido por remitente
+    - Limitador de concurrencia adaptativo
+    - Cuotas diarias de tokens/costo
     - LLM (gemini/openai)
+    - Procesamiento de media
     - WhatsApp API
     """
     # Mockear Redis / memory
@@ -32,6 +36,10 @@ def app_client(mocker):
     mock_memory.ping = AsyncMock(return_value=True)
     mock_memory.get_conversation = AsyncMock(return_value=[])
     mock_memory.append_message = AsyncMock()
+    mock_memory.cache_stats = MagicMock(return_value={"enabled": False})
+    mock_memory.archive_stats = MagicMock(return_value={"enabled": False})
+    mock_memory.fallback_stats = MagicMock(return_value={"enabled": False})
+    mock_memory.needs_write_back = MagicMock(return_value=False)
     mocker.patch("app.main.memory", mock_memory)
 
     # Mockear rate limiter — por defecto permite pasar
@@ -39,9 +47,57 @@ def app_client(mocker):
     mock_rl.check_rate_limit = AsyncMock(return_value=(True, 1, 10))
     mocker.patch("app.main.rate_limiter", mock_rl)
 
+    # Mockear lock por remitente — entrega siempre el token de fencing 1
+    mock_lock = MagicMock()
+    mock_lock.hold.return_value.__aenter__ = AsyncMock(return_value=1)
+    mock_lock.hold.return_value.__aexit__ = AsyncMock(return_value=False)
+    mocker.patch("app.main.sender_lock", mock_lock)
+
+    # Mockear limitador de concurrencia — por defecto concede slot
+    mock_cl = MagicMock()
+    mock_cl.acquire = AsyncMock(return_value=True)
+    mock_cl.release = MagicMock()
+    mock_cl.stats = MagicMock(return_value={"limit": 16, "in_flight": 0, "queue_depth": 0, "shed_total": 0})
+    mock_cl.queue_depth = 0
+    mock_cl.in_flight = 0
+    mocker.patch("app.main.concurrency_limiter", mock_cl)
+
+    # Router de modelos real (lógica local, sin red)
+    from app.router import ModelRouter, ModelTier
+    router = ModelRouter(
+        fast=ModelTier("fast", "gemini-2.0-flash-lite", 200),
+        full=ModelTier("full", "gemini-2.0-flash", 800),
+    )
+    mocker.patch("app.main.model_router", router)
+
+    # Tabla de intents vacía — cada test que la necesite carga la suya
+    from app.intents import IntentMatcher
+    mocker.patch("app.main.intent_matcher", IntentMatcher([], {}))
+
+    # Mockear procesamiento de media (descarga + transcripción / imágenes)
+    mock_media = MagicMock()
+    mock_media.process = AsyncMock()
+    mocker.patch("app.main.media_processor", mock_media)
+
+    # Mockear cuotas — por defecto permite y no registra nada
+    from app.quota import QuotaDecision
+    mock_quota = MagicMock()
+    mock_quota.check = AsyncMock(return_value=QuotaDecision("allow"))
+    mock_quota.record = AsyncMock()
+    mock_quota.spend = AsyncMock(return_value={"day": "20260101", "models": {}, "total_cost_usd": 0.0})
+    mocker.patch("app.main.quota", mock_quota)
+
+    # Coalescing real en proceso (sin Redis)
+    from app.coalesce import SingleFlight
+    mocker.patch("app.main.single_flight", SingleFlight())
+
     # Mockear LLM
+    from app.llm import ChatCompletion
     mock_llm = MagicMock()
-    mock_llm.chat = AsyncMock(return_value="Respuesta de prueba del bot.")
+    mock_llm.complete = AsyncMock(return_value=ChatCompletion(
+        text="Respuesta de prueba del bot.", model="gemini-2.0-flash", prompt_tokens=120, completion_tokens=12
+    ))
+    mock_llm.list_models = AsyncMock(return_value=["models/gemini-2.0-flash"])
     mocker.patch("app.main.llm_client", mock_llm)
 
     # Mockear WhatsApp client
@@ -49,6 +105,7 @@ def app_client(mocker):
     mock_wa.token = "test-token"
     mock_wa.phone_id = "123456789"
     mock_wa.send_text_message = AsyncMock(return_value={"messages": [{"id": "wamid.test"}]})
+    mock_wa.check_credentials = AsyncMock()
     mocker.patch("app.main.whatsapp_client", mock_wa)
 
     from app.main import app
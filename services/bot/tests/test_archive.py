@@ -0,0 +1,121 @@
+import sys
+import threading
+
+import pytest
+
+from app.archive import ConversationArchive
+
+
+def _conversation(n=3):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"mensaje {i}"} for i in range(n)]
+
+
+def test_store_y_load_recuperan_la_conversacion(tmp_path):
+    archive = ConversationArchive(tmp_path)
+
+    stored = archive.store_many([("521111111111", _conversation()), ("522222222222", _conversation(5))])
+
+    assert stored == 2
+    assert archive.load("521111111111") == _conversation()
+    assert archive.load("522222222222") == _conversation(5)
+    assert archive.load("523333333333") is None
+
+
+def test_segmento_es_append_only_y_el_indice_apunta_al_ultimo(tmp_path):
+    archive = ConversationArchive(tmp_path)
+    archive.store_many([("521111111111", _conversation(2))])
+    segment = next(tmp_path.glob("*.seg"))
+    size = segment.stat().st_size
+
+    archive.store_many([("521111111111", _conversation(4))])
+
+    assert segment.stat().st_size > size
+    assert archive.load("521111111111") == _conversation(4)
+    assert archive.stats()["senders"] == 1
+
+
+def test_dos_replicas_en_el_mismo_directorio_no_mezclan_registros(tmp_path):
+    """Dos instancias sobre el mismo volumen (dos réplicas) escriben a la vez en el mismo segmento."""
+    replicas = [ConversationArchive(tmp_path), ConversationArchive(tmp_path)]
+
+    def archive_batches(replica, prefix):
+        for batch in range(20):
+            replica.store_many([(f"{prefix}{batch}{i}", _conversation(batch + 50)) for i in range(10)])
+
+    threads = [threading.Thread(target=archive_batches, args=(replica, f"52{n}")) for n, replica in enumerate(replicas)]
+    # Cambios de hilo frecuentes para que los appends se intercalen si no hay lock de archivo
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(previous)
+
+    for n in range(2):
+        for batch in range(20):
+            assert replicas[1 - n].load(f"52{n}{batch}9") == _conversation(batch + 50)
+    assert replicas[0].stats()["senders"] == 400
+
+
+def test_indice_usa_journal_compatible_con_volumenes_de_red(tmp_path):
+    archive = ConversationArchive(tmp_path)
+
+    (mode,) = archive._db.execute("PRAGMA journal_mode").fetchone()
+
+    assert mode == "delete"
+    assert not list(tmp_path.glob("*-shm"))
+
+
+def test_registros_se_guardan_comprimidos(tmp_path):
+    archive = ConversationArchive(tmp_path)
+    messages = [{"role": "user", "content": "quiero una cotización de paneles solares " * 20}]
+
+    archive.store_many([("521111111111", messages)])
+
+    assert archive.stats()["bytes"] < len(str(messages)) / 4
+
+
+def test_indice_persiste_entre_instancias(tmp_path):
+    ConversationArchive(tmp_path).store_many([("521111111111", _conversation())])
+
+    assert ConversationArchive(tmp_path).load("521111111111") == _conversation()
+
+
+def test_delete_olvida_al_remitente(tmp_path):
+    archive = ConversationArchive(tmp_path)
+    archive.store_many([("521111111111", _conversation())])
+
+    archive.delete("521111111111")
+
+    assert archive.load("521111111111") is None
+
+
+def test_purge_borra_segmentos_viejos_y_su_indice(tmp_path):
+    archive = ConversationArchive(tmp_path)
+    archive.store_many([("521111111111", _conversation())])
+    # Simular un segmento de hace un año
+    old = tmp_path / "conversations-20000101.seg"
+    next(tmp_path.glob("*.seg")).rename(old)
+    archive._db.execute("UPDATE conversations SET segment = ?", (old.name,))
+    archive._db.commit()
+    archive.store_many([("522222222222", _conversation())])
+
+    removed = archive.purge(retention_days=30)
+
+    assert removed == 1
+    assert not old.exists()
+    assert archive.load("521111111111") is None
+    assert archive.load("522222222222") == _conversation()
+
+
+@pytest.mark.asyncio
+async def test_variantes_async_no_bloquean_el_loop(tmp_path):
+    archive = ConversationArchive(tmp_path)
+
+    await archive.store_many_async([("521111111111", _conversation())])
+
+    assert await archive.load_async("521111111111") == _conversation()
+    assert (await archive.stats_async())["segments"] == 1
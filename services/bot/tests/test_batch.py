@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.batch import BatchCollector, BatchError
+from app.llm import BATCH_COMPLETED, BATCH_FAILED, BATCH_RUNNING, BatchResult, ChatCompletion
+
+MESSAGES = [{"role": "user", "content": "resume esta conversación"}]
+
+
+def _llm():
+    client = MagicMock()
+    client.submit_batch = AsyncMock(side_effect=lambda requests: f"batch-{len(client.submit_batch.await_args_list)}")
+    client.batch_status = AsyncMock(return_value=BATCH_COMPLETED)
+    client.batch_results = AsyncMock(return_value=[])
+    return client
+
+
+def _results_for(client):
+    """batch_results que responde a cada custom_id enviado."""
+    submitted = {}
+
+    async def submit(requests):
+        batch_id = f"batch-{len(submitted)}"
+        submitted[batch_id] = requests
+        return batch_id
+
+    async def results(batch_id):
+        return [
+            BatchResult(r.custom_id, completion=ChatCompletion(f"ok {r.model}", r.model or "default", 5, 1))
+            for r in submitted[batch_id]
+        ]
+
+    client.submit_batch = AsyncMock(side_effect=submit)
+    client.batch_results = AsyncMock(side_effect=results)
+    return submitted
+
+
+@pytest.mark.asyncio
+async def test_flush_agrupa_por_modelo_y_resuelve_futuros():
+    llm = _llm()
+    submitted = _results_for(llm)
+    collector = BatchCollector(llm)
+
+    a = await collector.submit(MESSAGES, model="rapido", max_tokens=100)
+    b = await collector.submit(MESSAGES, model="completo")
+    c = await collector.submit(MESSAGES, model="rapido")
+    batch_ids = await collector.flush()
+
+    assert len(batch_ids) == 2
+    assert sorted(len(requests) for requests in submitted.values()) == [1, 2]
+    assert not a.done()
+
+    assert await collector.poll() == 3
+    assert (await a).text == "ok rapido"
+    assert (await b).text == "ok completo"
+    assert (await c).model == "rapido"
+    assert collector.stats()["completed_jobs"] == 3
+    assert collector.stats()["outstanding_batches"] == 0
+
+
+@pytest.mark.asyncio
+async def test_submit_envia_el_batch_al_llenarse():
+    llm = _llm()
+    _results_for(llm)
+    collector = BatchCollector(llm, max_batch_size=2)
+
+    await collector.submit(MESSAGES)
+    llm.submit_batch.assert_not_awaited()
+    await collector.submit(MESSAGES)
+
+    llm.submit_batch.assert_awaited_once()
+    assert collector.stats()["queued_jobs"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_en_curso_no_se_despacha():
+    llm = _llm()
+    _results_for(llm)
+    llm.batch_status.return_value = BATCH_RUNNING
+    collector = BatchCollector(llm)
+    future = await collector.submit(MESSAGES)
+    await collector.flush()
+
+    assert await collector.poll() == 0
+    llm.batch_results.assert_not_awaited()
+    assert not future.done()
+
+
+@pytest.mark.asyncio
+async def test_errores_por_request_y_resultados_faltantes_fallan_el_futuro():
+    llm = _llm()
+    collector = BatchCollector(llm)
+    a = await collector.submit(MESSAGES)
+    b = await collector.submit(MESSAGES)
+    await collector.flush()
+    custom_ids = [r.custom_id for r in llm.submit_batch.await_args.args[0]]
+    llm.batch_results.return_value = [BatchResult(custom_ids[0], error="contenido bloqueado")]
+
+    await collector.poll()
+
+    with pytest.raises(BatchError, match="contenido bloqueado"):
+        await a
+    with pytest.raises(BatchError, match="no result"):
+        await b
+    assert collector.stats()["failed_jobs"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_fallido_falla_todos_sus_trabajos():
+    llm = _llm()
+    llm.batch_status.return_value = BATCH_FAILED
+    collector = BatchCollector(llm)
+    future = await collector.submit(MESSAGES)
+    await collector.flush()
+
+    await collector.poll()
+
+    with pytest.raises(BatchError, match="batch failed"):
+        await future
+
+
+@pytest.mark.asyncio
+async def test_error_al_enviar_falla_los_futuros():
+    llm = _llm()
+    llm.submit_batch.side_effect = RuntimeError("401")
+    collector = BatchCollector(llm)
+    future = await collector.submit(MESSAGES)
+
+    assert await collector.flush() == []
+    with pytest.raises(BatchError, match="submission failed"):
+        await future
+
+
+@pytest.mark.asyncio
+async def test_error_de_red_al_consultar_se_reintenta():
+    llm = _llm()
+    _results_for(llm)
+    llm.batch_status.side_effect = [RuntimeError("timeout"), BATCH_COMPLETED]
+    collector = BatchCollector(llm)
+    future = await collector.submit(MESSAGES)
+    await collector.flush()
+
+    assert await collector.poll() == 0
+    assert await collector.poll() == 1
+    assert (await future).text.startswith("ok")
+
+
+@pytest.mark.asyncio
+async def test_drain_espera_hasta_despachar_todo():
+    llm = _llm()
+    _results_for(llm)
+    llm.batch_status.side_effect = [BATCH_RUNNING, BATCH_RUNNING, BATCH_COMPLETED]
+    collector = BatchCollector(llm, poll_interval=0)
+    future = await collector.submit(MESSAGES)
+
+    await asyncio.wait_for(collector.drain(), timeout=1)
+
+    assert future.done()
+    assert llm.batch_status.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_loop_en_segundo_plano_envia_por_tiempo():
+    llm = _llm()
+    _results_for(llm)
+    collector = BatchCollector(llm, flush_interval=0.01, poll_interval=0.01)
+    collector.start()
+    try:
+        result = await asyncio.wait_for(await collector.submit(MESSAGES), timeout=1)
+    finally:
+        await collector.stop()
+
+    assert result.text.startswith("ok")
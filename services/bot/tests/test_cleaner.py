@@ -1,7 +1,9 @@
 """
 Tests de limpieza de texto — app/cleaner.py
 """
-from app.cleaner import clean_text
+import pytest
+
+from app.cleaner import TRUNCATION_MARKER, clean_text
 
 
 def test_elimina_espacios_extra():
@@ -27,6 +29,77 @@ def test_texto_normal_sin_cambios():
     assert clean_text(texto) == texto
 
 
-def test_elimina_caracteres_nulos():
-    # \x00 es control char — se elimina (no se reemplaza con espacio)
-    assert clean_text("hola\x00mundo") == "holamundo"
+def test_caracteres_de_control_separan_palabras():
+    # \x00 es control char — se reemplaza con espacio para no pegar palabras
+    assert clean_text("hola\x00mundo") == "hola mundo"
+    assert clean_text("hola\x1b\x7f\x85mundo") == "hola mundo"
+
+
+def test_elimina_caracteres_invisibles_y_bidi():
+    assert clean_text("ho\u200bla\ufeff mun\u202edo\u2066") == "hola mundo"
+
+
+def test_conserva_emoji_con_zwj_y_modificadores():
+    texto = "Familia 👨\u200d👩\u200d👧 y pulgar 👍🏽 desde 🇲🇽"
+    assert clean_text(texto) == texto
+
+
+def test_normaliza_a_nfc():
+    # "e" + acento combinante → "é" precompuesto
+    assert clean_text("cafe\u0301") == "café"
+
+
+def test_sin_limite_no_recorta():
+    texto = "palabra " * 2000
+    assert clean_text(texto) == texto.strip()
+
+
+def test_recorta_al_inicio_con_marcador():
+    resultado = clean_text("uno dos tres cuatro cinco", max_chars=10)
+
+    assert resultado == "uno dos t" + TRUNCATION_MARKER
+    assert len(resultado) <= 10
+
+
+def test_recorta_conservando_el_final():
+    assert clean_text("uno dos tres cuatro cinco", max_chars=13, truncation="tail") == TRUNCATION_MARKER + "cuatro cinco"
+
+
+def test_recorta_conservando_inicio_y_final():
+    resultado = clean_text("inicio " + "relleno " * 100 + "final", max_chars=20, truncation="middle")
+
+    assert resultado.startswith("inicio")
+    assert resultado.endswith("final")
+    assert TRUNCATION_MARKER in resultado
+    assert len(resultado) <= 20
+
+
+def test_no_corta_secuencias_de_emoji():
+    familia = "👨\u200d👩\u200d👧"
+    for limite in range(1, 12):
+        resultado = clean_text(f"hola {familia} {familia}", max_chars=limite)
+        assert len(resultado) <= limite
+        # Cada familia queda completa o no aparece
+        assert resultado.replace(familia, "").count("\u200d") == 0
+
+
+def test_no_corta_banderas():
+    assert clean_text("🇲🇽🇺🇸🇨🇦", max_chars=4) == "🇲🇽" + TRUNCATION_MARKER
+
+
+def test_entrada_enorme_se_recorta_sin_procesarla_completa():
+    resultado = clean_text("a" * 1_000_000, max_chars=100)
+
+    assert len(resultado) == 100
+    assert resultado.endswith(TRUNCATION_MARKER)
+
+
+def test_entrada_enorme_conserva_el_final_en_modo_tail():
+    resultado = clean_text(" " * 100_000 + "hola", max_chars=100, truncation="tail")
+
+    assert resultado == TRUNCATION_MARKER + "hola"
+
+
+def test_politica_invalida_lanza_error():
+    with pytest.raises(ValueError):
+        clean_text("hola", max_chars=10, truncation="random")
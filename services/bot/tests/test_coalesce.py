@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.coalesce import SingleFlight, request_key
+from app.llm import ChatCompletion
+
+MESSAGES = [{"role": "system", "content": "Eres un vendedor."}, {"role": "user", "content": "QUIERO LA PROMO"}]
+COMPLETION = ChatCompletion("¡Claro! La promo incluye...", "modelo", 40, 10)
+
+
+def _slow_call(result=COMPLETION, delay=0.02):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return call, calls
+
+
+def _flight(**kwargs):
+    return SingleFlight(encode=ChatCompletion.to_json, decode=ChatCompletion.from_json, **kwargs)
+
+
+def test_request_key_depende_de_mensajes_modelo_y_max_tokens():
+    base = request_key(MESSAGES, "modelo", 800)
+
+    assert base == request_key([dict(m) for m in MESSAGES], "modelo", 800)
+    assert base != request_key(MESSAGES, "otro-modelo", 800)
+    assert base != request_key(MESSAGES, "modelo", 200)
+    assert base != request_key(MESSAGES + [{"role": "user", "content": "?"}], "modelo", 800)
+
+
+@pytest.mark.asyncio
+async def test_llamadas_identicas_concurrentes_comparten_una_sola():
+    flight = _flight()
+    call, calls = _slow_call()
+
+    results = await asyncio.gather(*(flight.run("k", call) for _ in range(50)))
+
+    assert len(calls) == 1
+    assert all(result is COMPLETION for result, _ in results)
+    assert sum(shared for _, shared in results) == 49
+    assert flight.stats()["shared_local"] == 49
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_no_guarda_resultados_una_vez_terminada_la_llamada():
+    flight = _flight()
+    call, calls = _slow_call(delay=0)
+
+    await flight.run("k", call)
+    await flight.run("k", call)
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_claves_distintas_no_se_agrupan():
+    flight = _flight()
+    call, calls = _slow_call()
+
+    await asyncio.gather(flight.run("a", call), flight.run("b", call))
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_error_del_lider_llega_a_todos_los_que_esperan():
+    flight = _flight()
+    call, calls = _slow_call(result=RuntimeError("timeout"))
+
+    results = await asyncio.gather(*(flight.run("k", call) for _ in range(3)), return_exceptions=True)
+
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_si_se_cancela_el_lider_los_demas_llaman_por_su_cuenta():
+    flight = _flight()
+    call, calls = _slow_call(delay=0.05)
+
+    leader = asyncio.create_task(flight.run("k", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.run("k", call))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    result, shared = await follower
+    assert result is COMPLETION
+    assert shared is False
+    assert len(calls) == 2
+
+
+def _redis(claimed=True, stored=None, lock_exists=True):
+    redis = MagicMock()
+    redis.set = AsyncMock(return_value=claimed)
+    redis.get = AsyncMock(side_effect=list(stored) if stored is not None else None, return_value=None)
+    redis.exists = AsyncMock(return_value=1 if lock_exists else 0)
+    redis.eval = AsyncMock(return_value=1)
+    return redis
+
+
+@pytest.mark.asyncio
+async def test_lider_entre_replicas_publica_el_resultado():
+    redis = _redis(claimed=True)
+    flight = _flight(redis=redis)
+    call, calls = _slow_call(delay=0)
+
+    result, shared = await flight.run("abc", call)
+
+    assert (result, shared) == (COMPLETION, False)
+    redis.set.assert_awaited_once()
+    assert redis.set.await_args.args[0] == "flight:{abc}"
+    assert redis.set.await_args.kwargs["nx"] is True
+    args = redis.eval.await_args.args
+    assert args[1:4] == (2, "flight:{abc}", "flightresult:{abc}")
+    assert ChatCompletion.from_json(args[5]) == COMPLETION
+
+
+@pytest.mark.asyncio
+async def test_otra_replica_espera_el_resultado_publicado():
+    redis = _redis(claimed=False, stored=[None, COMPLETION.to_json().encode()])
+    flight = _flight(redis=redis, poll_interval=0)
+    call, calls = _slow_call(delay=0)
+
+    result, shared = await flight.run("abc", call)
+
+    assert (result, shared) == (COMPLETION, True)
+    assert calls == []
+    assert flight.stats()["shared_remote"] == 1
+
+
+@pytest.mark.asyncio
+async def test_si_el_lider_remoto_falla_se_llama_por_cuenta_propia():
+    redis = _redis(claimed=False, stored=[None, None], lock_exists=False)
+    flight = _flight(redis=redis, poll_interval=0)
+    call, calls = _slow_call(delay=0)
+
+    result, shared = await flight.run("abc", call)
+
+    assert (result, shared) == (COMPLETION, False)
+    assert len(calls) == 1
+    assert flight.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_error_del_lider_libera_el_reclamo_sin_publicar():
+    redis = _redis(claimed=True)
+    flight = _flight(redis=redis)
+    call, _ = _slow_call(result=RuntimeError("timeout"), delay=0)
+
+    with pytest.raises(RuntimeError):
+        await flight.run("abc", call)
+
+    (eval_call,) = redis.eval.await_args_list
+    assert eval_call.args[1:3] == (1, "flight:{abc}")
+
+
+@pytest.mark.asyncio
+async def test_error_de_redis_no_bloquea_la_llamada():
+    redis = _redis()
+    redis.set = AsyncMock(side_effect=ConnectionError("down"))
+    flight = _flight(redis=redis)
+    call, calls = _slow_call(delay=0)
+
+    result, shared = await flight.run("abc", call)
+
+    assert (result, shared) == (COMPLETION, False)
+    assert flight.stats()["redis_errors"] == 1
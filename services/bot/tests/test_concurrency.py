@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+
+from app.concurrency import AdaptiveConcurrencyLimiter
+
+
+@pytest.mark.asyncio
+async def test_acquire_concede_slots_hasta_el_limite():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1, queue_timeout=0.01)
+
+    assert await limiter.acquire() is True
+    assert await limiter.acquire() is True
+    assert await limiter.acquire() is False
+    assert limiter.in_flight == 2
+    assert limiter.stats()["shed_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_release_despierta_al_siguiente_en_cola():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, queue_timeout=1.0)
+    assert await limiter.acquire() is True
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+
+    limiter.release(latency=0.1)
+    assert await waiter is True
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_conversacion_en_curso_tiene_prioridad():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, queue_timeout=1.0)
+    assert await limiter.acquire() is True
+
+    order = []
+
+    async def wait(name, priority):
+        if await limiter.acquire(priority=priority):
+            order.append(name)
+
+    new_sender = asyncio.create_task(wait("nuevo", False))
+    await asyncio.sleep(0)
+    ongoing = asyncio.create_task(wait("en_curso", True))
+    await asyncio.sleep(0)
+
+    limiter.release()
+    await asyncio.sleep(0.01)
+    assert order == ["en_curso"]
+
+    limiter.release()
+    await asyncio.gather(new_sender, ongoing)
+    assert order == ["en_curso", "nuevo"]
+
+
+@pytest.mark.asyncio
+async def test_cola_llena_desaloja_remitente_nuevo_por_prioritario():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, queue_timeout=1.0, max_queue=1)
+    assert await limiter.acquire() is True
+
+    new_sender = asyncio.create_task(limiter.acquire(priority=False))
+    await asyncio.sleep(0)
+    ongoing = asyncio.create_task(limiter.acquire(priority=True))
+    await asyncio.sleep(0)
+
+    assert await new_sender is False
+    limiter.release(latency=0.1)
+    assert await ongoing is True
+
+
+def test_latencia_alta_reduce_el_limite():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=20, min_limit=2, target_latency=1.0, backoff=0.5)
+    limiter._in_flight = 1
+
+    limiter.release(latency=5.0)
+
+    assert limiter.limit == 10
+
+
+def test_error_reduce_el_limite_una_vez_por_ventana():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=20, min_limit=2, target_latency=60.0, backoff=0.5)
+    limiter._in_flight = 2
+
+    limiter.release(success=False)
+    limiter.release(success=False)
+
+    assert limiter.limit == 10
+
+
+def test_latencia_baja_con_carga_aumenta_el_limite():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, min_limit=1, target_latency=1.0)
+    for _ in range(8):
+        limiter._in_flight = 4
+        limiter.release(latency=0.1)
+
+    assert limiter.limit == 5
+
+
+def test_latencia_baja_sin_carga_no_aumenta_el_limite():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=1, target_latency=1.0)
+    for _ in range(50):
+        limiter._in_flight = 1
+        limiter.release(latency=0.1)
+
+    assert limiter.limit == 10
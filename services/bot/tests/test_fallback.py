@@ -0,0 +1,142 @@
+"""
+Tests del modo degradado sin Redis (monitor de salud, store y rate limit locales) — app/fallback.py
+"""
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.fallback import LocalConversationStore, LocalRateLimiter, RedisHealth
+
+
+def _health(ping_results, failures=2):
+    redis_mock = MagicMock()
+    redis_mock.ping = AsyncMock(side_effect=ping_results)
+    return RedisHealth(redis_mock, failures=failures)
+
+
+@pytest.mark.asyncio
+async def test_redis_se_marca_caido_tras_pings_fallidos_consecutivos():
+    health = _health([True, RedisConnectionError(), True, RedisConnectionError(), RedisConnectionError()])
+
+    for _ in range(4):
+        await health.check()
+        assert health.available
+    await health.check()
+
+    assert not health.available
+    assert health.stats()["outages"] == 1
+
+
+@pytest.mark.asyncio
+async def test_error_reportado_marca_caido_al_instante_y_la_recuperacion_dispara_callbacks():
+    health = _health([True])
+    recovered = AsyncMock()
+    health.on_recovery(recovered)
+
+    health.report_failure(RedisConnectionError())
+    assert not health.available
+    assert health.stats()["down_for_seconds"] is not None
+
+    assert await health.check() is True
+    assert health.available
+    await health.wait_recovered()
+    recovered.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_recuperacion_lenta_no_frena_los_pings():
+    """Los callbacks corren en su propia tarea: un write-back largo no retrasa el siguiente ping."""
+    health = _health([True, True])
+    release = asyncio.Event()
+
+    async def slow_write_back():
+        await release.wait()
+
+    health.on_recovery(slow_write_back)
+    health.report_failure()
+
+    await asyncio.wait_for(health.check(), timeout=1)
+    assert await asyncio.wait_for(health.check(), timeout=1) is True
+    release.set()
+    await health.wait_recovered()
+
+
+@pytest.mark.asyncio
+async def test_callback_que_falla_no_impide_la_recuperacion():
+    health = _health([True])
+    health.on_recovery(AsyncMock(side_effect=RuntimeError("boom")))
+    health.report_failure()
+
+    await health.check()
+    await health.wait_recovered()
+
+    assert health.available
+
+
+def test_store_local_guarda_pendientes_para_reescribir():
+    store = LocalConversationStore()
+    store.seed("5211", [{"role": "user", "content": "antes"}])
+
+    store.append("5211", {"role": "user", "content": "durante"}, max_messages=20)
+
+    assert [m["content"] for m in store.get("5211")] == ["antes", "durante"]
+    assert store.pending("5211") == [{"role": "user", "content": "durante"}]
+    assert store.pending_ids() == ["5211"]
+    store.discard("5211")
+    assert store.get("5211") is None
+
+
+def test_store_local_acota_historial_y_entradas():
+    store = LocalConversationStore(max_entries=2)
+    for i in range(3):
+        store.append("5211", {"role": "user", "content": f"m{i}"}, max_messages=2)
+    store.append("5222", {"role": "user", "content": "x"}, max_messages=2)
+    store.append("5233", {"role": "user", "content": "y"}, max_messages=2)
+
+    assert store.get("5211") is None
+    # Al expulsar se pierden sus 3 mensajes pendientes, y se cuentan
+    assert store.stats() == {"conversations": 2, "pending_conversations": 2, "lost_pending_messages": 3}
+
+
+def test_store_local_respeta_ttl(mocker):
+    store = LocalConversationStore(ttl=10)
+    mocker.patch("app.fallback.time.monotonic", return_value=100.0)
+    store.append("5211", {"role": "user", "content": "hola"}, max_messages=20)
+
+    mocker.patch("app.fallback.time.monotonic", return_value=111.0)
+
+    assert store.get("5211") is None
+    assert store.lost_pending == 1
+
+
+def test_seed_no_pisa_una_conversacion_existente():
+    store = LocalConversationStore()
+    store.append("5211", {"role": "user", "content": "durante"}, max_messages=20)
+
+    store.seed("5211", [])
+
+    assert store.get("5211") == [{"role": "user", "content": "durante"}]
+
+
+def test_rate_limiter_local_por_ventana(mocker):
+    limiter = LocalRateLimiter(max_requests=2, window_seconds=60)
+    mocker.patch("app.fallback.time.monotonic", return_value=0.0)
+
+    assert limiter.check_rate_limit("5211") == (True, 1, 2)
+    assert limiter.check_rate_limit("5211") == (True, 2, 2)
+    assert limiter.check_rate_limit("5211") == (False, 3, 2)
+    assert limiter.check_rate_limit("5222") == (True, 1, 2)
+
+    mocker.patch("app.fallback.time.monotonic", return_value=61.0)
+    assert limiter.check_rate_limit("5211") == (True, 1, 2)
+
+
+def test_rate_limiter_local_acota_remitentes():
+    limiter = LocalRateLimiter(max_entries=2)
+    for sender in ("5211", "5222", "5233"):
+        limiter.check_rate_limit(sender)
+
+    assert list(limiter._windows) == ["5222", "5233"]
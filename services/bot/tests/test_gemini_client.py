@@ -3,6 +3,7 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock
 
 from app.gemini_client import GeminiClient
+from app.llm import BATCH_COMPLETED, BATCH_FAILED, BATCH_RUNNING, BatchRequest
 
 
 def test_constructor_sin_api_key_lanza_error(mocker):
@@ -22,11 +23,8 @@ async def test_chat_mapea_roles_y_system_instruction(mocker):
     }
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
 
     client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
     messages = [
@@ -60,11 +58,8 @@ async def test_chat_respuesta_inesperada_devuelve_vacio(mocker):
     response_mock.json.return_value = {"unexpected": True}
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
 
     client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
     result = await client.chat([{"role": "user", "content": "hola"}])
@@ -83,11 +78,8 @@ async def test_chat_candidates_sin_texto_devuelve_vacio(mocker):
     }
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
 
     client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
     result = await client.chat([{"role": "user", "content": "hola"}])
@@ -106,13 +98,175 @@ async def test_chat_error_http_se_propaga(mocker):
     response_mock.json.return_value = {}
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
 
     client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
 
     with pytest.raises(httpx.HTTPStatusError):
         await client.chat([{"role": "user", "content": "hola"}])
+
+
+@pytest.mark.asyncio
+async def test_chat_permite_sobrescribir_modelo_y_max_tokens(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "candidates": [{"content": {"parts": [{"text": "ok"}]}}]
+    }
+
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
+    await client.chat([{"role": "user", "content": "hola"}], model="gemini-2.0-flash-lite", max_tokens=200)
+
+    call = post_mock.await_args
+    assert call.args[0].endswith("/models/gemini-2.0-flash-lite:generateContent")
+    assert call.kwargs["json"]["generationConfig"]["maxOutputTokens"] == 200
+
+
+@pytest.mark.asyncio
+async def test_chat_convierte_partes_de_imagen_a_inline_data(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "candidates": [{"content": {"parts": [{"text": "ok"}]}}]
+    }
+
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="g-test", model="gemini-2.0-flash")
+    await client.chat([{"role": "user", "content": [
+        {"type": "text", "text": "¿lo tienen?"},
+        {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,QUJD"}},
+    ]}])
+
+    assert post_mock.await_args.kwargs["json"]["contents"] == [{
+        "role": "user",
+        "parts": [
+            {"text": "¿lo tienen?"},
+            {"inline_data": {"mime_type": "image/jpeg", "data": "QUJD"}},
+        ],
+    }]
+
+
+@pytest.mark.asyncio
+async def test_complete_devuelve_uso_de_tokens(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "candidates": [{"content": {"parts": [{"text": "hola"}]}}],
+        "usageMetadata": {"promptTokenCount": 30, "candidatesTokenCount": 4},
+    }
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="test", model="gemini-2.0-flash")
+    completion = await client.complete([{"role": "user", "content": "hola"}], model="gemini-2.0-flash-lite")
+
+    assert completion.text == "hola"
+    assert completion.model == "gemini-2.0-flash-lite"
+    assert (completion.prompt_tokens, completion.completion_tokens) == (30, 4)
+
+
+@pytest.mark.asyncio
+async def test_complete_envia_stop_sequences_y_normaliza_finish_reason(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "candidates": [{"content": {"parts": [{"text": "Claro, el precio es"}]}, "finishReason": "MAX_TOKENS"}],
+    }
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="test", model="gemini-2.0-flash")
+    completion = await client.complete(
+        [{"role": "user", "content": "hola"}], max_tokens=60, temperature=0.0, stop=("\n\n",)
+    )
+
+    config = post_mock.await_args.kwargs["json"]["generationConfig"]
+    assert config == {"temperature": 0.0, "maxOutputTokens": 60, "stopSequences": ["\n\n"]}
+    assert completion.finish_reason == "length"
+
+
+def _json_response(data):
+    response = MagicMock()
+    response.raise_for_status = MagicMock()
+    response.json.return_value = data
+    return response
+
+
+@pytest.mark.asyncio
+async def test_submit_batch_envia_requests_inline_con_su_clave(mocker):
+    post_mock = AsyncMock(return_value=_json_response({"name": "batches/123"}))
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="test", model="gemini-2.0-flash")
+    name = await client.submit_batch([
+        BatchRequest("a", [{"role": "system", "content": "Eres un vendedor."}, {"role": "user", "content": "hola"}]),
+    ])
+
+    assert name == "batches/123"
+    call = post_mock.await_args
+    assert call.args[0].endswith("/models/gemini-2.0-flash:batchGenerateContent")
+    (item,) = call.kwargs["json"]["batch"]["input_config"]["requests"]["requests"]
+    assert item["metadata"] == {"key": "a"}
+    assert item["request"]["system_instruction"]["parts"][0]["text"] == "Eres un vendedor."
+    assert item["request"]["contents"][0]["role"] == "user"
+
+
+@pytest.mark.asyncio
+async def test_batch_results_usa_la_clave_de_metadata(mocker):
+    batch = {
+        "name": "batches/123",
+        "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+        "response": {"inlinedResponses": {"inlinedResponses": [
+            {
+                "metadata": {"key": "a"},
+                "response": {
+                    "candidates": [{"content": {"parts": [{"text": "hola"}]}}],
+                    "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 3},
+                },
+            },
+            {"metadata": {"key": "b"}, "error": {"message": "contenido bloqueado"}},
+        ]}},
+    }
+    post_mock = AsyncMock(return_value=_json_response({"name": "batches/123"}))
+    get_mock = AsyncMock(return_value=_json_response(batch))
+    http_client = MagicMock(post=post_mock, get=get_mock, is_closed=False)
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=http_client)
+
+    client = GeminiClient(api_key="test", model="gemini-2.0-flash")
+    await client.submit_batch([BatchRequest("a", [], model="gemini-2.0-flash-lite")])
+
+    assert await client.batch_status("batches/123") == BATCH_COMPLETED
+    ok, failed = await client.batch_results("batches/123")
+
+    assert get_mock.await_args.args[0].endswith("/batches/123")
+    assert ok.custom_id == "a"
+    assert ok.completion.text == "hola"
+    assert ok.completion.model == "gemini-2.0-flash-lite"
+    assert (ok.completion.prompt_tokens, ok.completion.completion_tokens) == (12, 3)
+    assert failed.custom_id == "b"
+    assert failed.error == "contenido bloqueado"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("state, expected", [
+    ("BATCH_STATE_RUNNING", BATCH_RUNNING),
+    ("BATCH_STATE_EXPIRED", BATCH_FAILED),
+])
+async def test_batch_status_normaliza_estados(mocker, state, expected):
+    get_mock = AsyncMock(return_value=_json_response({"metadata": {"state": state}}))
+    mocker.patch("app.gemini_client.httpx.AsyncClient", return_value=MagicMock(get=get_mock, is_closed=False))
+
+    client = GeminiClient(api_key="test", model="gemini-2.0-flash")
+
+    assert await client.batch_status("batches/123") == expected
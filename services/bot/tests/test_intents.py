@@ -0,0 +1,94 @@
+"""
+Tests del matcher de intents con respuestas predefinidas — app/intents.py
+"""
+import json
+
+from app.intents import Intent, IntentMatcher, _Automaton, normalize
+
+
+def _matcher():
+    intents = [
+        Intent("greeting", "¡Hola!"),
+        Intent("thanks", "¡Con gusto!"),
+        Intent("ack", "Perfecto.", unless_pending_question=True),
+    ]
+    phrases = {
+        "greeting": ["hola", "buenos días", "buenas"],
+        "thanks": ["gracias", "muchas gracias"],
+        "ack": ["ok", "vale"],
+    }
+    return IntentMatcher(intents, phrases)
+
+
+def test_normalize_quita_acentos_puntuacion_y_emoji():
+    assert normalize("¡Buenos DÍAS! 😊") == "buenos dias"
+
+
+def test_automata_encuentra_frases_solapadas():
+    automaton = _Automaton({"he": 1, "she": 2, "hers": 3})
+    assert sorted(automaton.find("ushers")) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
+
+
+def test_mensaje_exacto_coincide():
+    assert _matcher().match("hola").name == "greeting"
+
+
+def test_frase_de_varias_palabras_con_acentos():
+    assert _matcher().match("Buenos días!!").name == "greeting"
+
+
+def test_repeticion_del_mismo_intent_coincide():
+    assert _matcher().match("hola hola 👋").name == "greeting"
+
+
+def test_frases_del_mismo_intent_combinadas():
+    assert _matcher().match("muchas gracias, gracias").name == "thanks"
+
+
+def test_mensaje_con_contenido_extra_no_coincide():
+    assert _matcher().match("hola, necesito una cotización") is None
+
+
+def test_intents_distintos_mezclados_no_coinciden():
+    assert _matcher().match("hola gracias") is None
+
+
+def test_subpalabra_no_coincide():
+    # "ok" dentro de "okupa" o "hola" dentro de "holanda" no es un intent
+    assert _matcher().match("holanda") is None
+    assert _matcher().match("okupa") is None
+
+
+def test_pregunta_pendiente_desactiva_intent_de_confirmacion():
+    history = [{"role": "assistant", "content": "¿Te envío la cotización?"}]
+    assert _matcher().match("ok", history) is None
+    assert _matcher().match("ok", []).name == "ack"
+
+
+def test_mensaje_largo_no_se_escanea():
+    assert _matcher().match("hola " * 200) is None
+
+
+def test_stats_cuenta_aciertos():
+    matcher = _matcher()
+    matcher.match("hola")
+    matcher.match("gracias")
+    matcher.match("hola")
+    assert matcher.stats() == {"intents": 3, "hits": {"greeting": 2, "thanks": 1}}
+
+
+def test_from_file_carga_tabla(tmp_path):
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps({"intents": [
+        {"name": "menu", "phrases": ["menú"], "response": "Opciones: ..."}
+    ]}), encoding="utf-8")
+
+    matcher = IntentMatcher.from_file(path)
+
+    assert matcher.match("MENU").response == "Opciones: ..."
+
+
+def test_from_file_inexistente_no_coincide_nunca(tmp_path):
+    matcher = IntentMatcher.from_file(tmp_path / "no-existe.json")
+    assert len(matcher) == 0
+    assert matcher.match("hola") is None
@@ -0,0 +1,184 @@
+"""
+Tests del logging estructurado (cola, JSON, correlation id, muestreo) — app/logs.py
+"""
+import io
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.logs import CorrelationIdMiddleware, Truncated, configure_logging, correlation_id, log_stats
+
+
+@pytest.fixture()
+def capture():
+    """Logger propio con su salida en memoria; devuelve una función que vacía la cola y parsea las líneas."""
+    stream = io.StringIO()
+    logger = logging.getLogger("tests.logs")
+    logger.propagate = False
+    state = {}
+
+    def setup(**kwargs):
+        state["listener"] = configure_logging(stream=stream, logger=logger, **kwargs)
+        return logger
+
+    def lines():
+        state["listener"].stop()
+        return [line for line in stream.getvalue().splitlines() if line]
+
+    yield setup, lines
+    logger.handlers = []
+
+
+def test_json_una_linea_por_registro_con_correlation_id(capture):
+    setup, lines = capture
+    logger = setup()
+
+    token = correlation_id.set("req-123")
+    try:
+        logger.info("Routing %s -> %s", "+52***1234", "full")
+    finally:
+        correlation_id.reset(token)
+    logger.warning("fuera de una request")
+
+    first, second = [json.loads(line) for line in lines()]
+    assert first["message"] == "Routing +52***1234 -> full"
+    assert first["level"] == "INFO"
+    assert first["logger"] == "tests.logs"
+    assert first["correlation_id"] == "req-123"
+    assert "correlation_id" not in second
+
+
+def test_formato_se_difiere_al_hilo_del_listener(capture):
+    """El hilo que loguea sólo encola: los argumentos se renderizan en el listener."""
+    setup, lines = capture
+    logger = setup()
+    rendered = []
+
+    class Spy:
+        def __str__(self):
+            rendered.append(True)
+            return "spy"
+
+    paused = logger.handlers[0].listener
+    paused.stop()
+    logger.info("valor %s", Spy())
+    assert rendered == []
+
+    paused.start()
+    assert json.loads(lines()[0])["message"] == "valor spy"
+    assert rendered == [True]
+
+
+def test_mensajes_y_payloads_largos_se_acotan(capture):
+    setup, lines = capture
+    logger = setup(max_chars=50)
+
+    logger.warning("respuesta inesperada: %s", Truncated({"data": "x" * 1000}, limit=20))
+    logger.info("y" * 200)
+
+    first, second = [json.loads(line)["message"] for line in lines()]
+    assert first.startswith("respuesta inesperada: {'data': 'xxxxxxx")
+    assert "chars truncated" in first
+    assert len(second) < 100 and second.endswith("[150 chars truncated]")
+
+
+def test_excepciones_se_incluyen(capture):
+    setup, lines = capture
+    logger = setup()
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("fallo", exc_info=True)
+
+    record = json.loads(lines()[0])
+    assert "ValueError: boom" in record["exc"]
+
+
+def test_formato_texto_incluye_correlation_id(capture):
+    setup, lines = capture
+    logger = setup(fmt="text")
+
+    token = correlation_id.set("abc")
+    try:
+        logger.info("hola")
+    finally:
+        correlation_id.reset(token)
+
+    assert lines()[0].endswith("- tests.logs - INFO - [abc] hola")
+
+
+def test_formato_desconocido_falla():
+    with pytest.raises(ValueError):
+        configure_logging(fmt="xml", logger=logging.getLogger("tests.logs.invalid"))
+
+
+def test_muestreo_conserva_requests_completas_y_advertencias(capture):
+    """Con 50%: cada request conserva todas o ninguna de sus líneas INFO; WARNING siempre pasa."""
+    setup, lines = capture
+    logger = setup(sample_rate=0.5)
+
+    for i in range(200):
+        token = correlation_id.set(f"req-{i}")
+        try:
+            logger.info("inicio")
+            logger.info("fin")
+            logger.warning("aviso")
+        finally:
+            correlation_id.reset(token)
+
+    records = [json.loads(line) for line in lines()]
+    info = [r["correlation_id"] for r in records if r["level"] == "INFO"]
+    assert sum(r["level"] == "WARNING" for r in records) == 200
+    assert 40 < len(set(info)) < 160
+    assert all(info.count(cid) == 2 for cid in set(info))
+
+
+def test_cola_llena_descarta_sin_bloquear(capture):
+    setup, lines = capture
+    logger = setup(queue_size=1)
+    handler = logger.handlers[0]
+    handler.listener.stop()
+
+    for _ in range(5):
+        logger.info("mensaje")
+
+    assert log_stats()["tests.logs"] == {"dropped": 4, "queued": 1}
+    handler.listener.start()
+    assert len(lines()) == 1
+
+
+def _echo_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CorrelationIdMiddleware)
+
+    @app.get("/cid")
+    async def cid():
+        return {"cid": correlation_id.get()}
+
+    return app
+
+
+def test_middleware_genera_y_devuelve_correlation_id():
+    client = TestClient(_echo_app())
+
+    r = client.get("/cid")
+
+    assert r.json()["cid"] == r.headers["x-request-id"]
+    assert len(r.headers["x-request-id"]) == 16
+    assert correlation_id.get() is None
+
+
+@pytest.mark.parametrize("incoming, reused", [
+    ("n8n-exec-42", True),
+    ("tiene espacios", False),
+    ("x" * 100, False),
+])
+def test_middleware_reusa_x_request_id_valido(incoming, reused):
+    r = TestClient(_echo_app()).get("/cid", headers={"x-request-id": incoming})
+
+    assert (r.json()["cid"] == incoming) is reused
+    assert r.headers["x-request-id"] == r.json()["cid"]
@@ -0,0 +1,123 @@
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from app.media import MediaError, MediaInput, MediaProcessor, MediaUnsupported
+from app.whatsapp_client import MediaTooLargeError
+
+
+def fake_engine(path: str) -> str:
+    with open(path, "rb") as f:
+        return f" transcripción de {len(f.read())} bytes "
+
+
+class FakeWhatsApp:
+    def __init__(self, payload: bytes, file_size: int | None = None, too_large: bool = False):
+        self.payload = payload
+        self.file_size = len(payload) if file_size is None else file_size
+        self.too_large = too_large
+        self.downloaded_to = None
+
+    async def get_media_info(self, media_id: str) -> dict:
+        return {"url": f"https://media.example/{media_id}", "file_size": self.file_size}
+
+    async def download_media(self, url: str, dest, max_bytes: int) -> int:
+        if self.too_large:
+            raise MediaTooLargeError("too big")
+        self.downloaded_to = dest.name
+        dest.write(self.payload)
+        return len(self.payload)
+
+
+def _processor(whatsapp, **kwargs):
+    return MediaProcessor(
+        whatsapp,
+        transcriber="tests.test_media:fake_engine",
+        executor=ThreadPoolExecutor(max_workers=1),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_audio_se_transcribe_con_el_motor_configurado():
+    whatsapp = FakeWhatsApp(b"x" * 10)
+
+    result = await _processor(whatsapp).process(MediaInput(type="audio", media_id="m1"))
+
+    assert result.text == "[Nota de voz] transcripción de 10 bytes"
+    assert result.llm_content == result.text
+
+
+@pytest.mark.asyncio
+async def test_archivo_temporal_se_elimina():
+    import os
+    whatsapp = FakeWhatsApp(b"x")
+
+    await _processor(whatsapp).process(MediaInput(type="audio", media_id="m1"))
+
+    assert not os.path.exists(whatsapp.downloaded_to)
+
+
+@pytest.mark.asyncio
+async def test_imagen_se_reduce_y_se_envia_como_parte_multimodal():
+    buffer = io.BytesIO()
+    Image.new("RGB", (3000, 1500), "red").save(buffer, format="PNG")
+    whatsapp = FakeWhatsApp(buffer.getvalue())
+
+    result = await _processor(whatsapp, image_max_side=512).process(
+        MediaInput(type="image", media_id="m2", caption="¿lo tienen?")
+    )
+
+    assert result.text == "[Imagen] ¿lo tienen?"
+    text_part, image_part = result.llm_content
+    assert text_part == {"type": "text", "text": "¿lo tienen?"}
+    data = image_part["image_url"]["url"].split(",", 1)[1]
+    with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+        assert image.format == "JPEG"
+        assert image.size == (512, 256)
+
+
+@pytest.mark.asyncio
+async def test_archivo_declarado_demasiado_grande_no_se_descarga():
+    whatsapp = FakeWhatsApp(b"x", file_size=10_000)
+
+    with pytest.raises(MediaError):
+        await _processor(whatsapp, max_bytes=100).process(MediaInput(type="audio", media_id="m1"))
+
+    assert whatsapp.downloaded_to is None
+
+
+@pytest.mark.asyncio
+async def test_descarga_que_excede_limite_lanza_media_error():
+    whatsapp = FakeWhatsApp(b"x", too_large=True)
+
+    with pytest.raises(MediaError, match="too big"):
+        await _processor(whatsapp).process(MediaInput(type="audio", media_id="m1"))
+
+
+@pytest.mark.asyncio
+async def test_imagen_corrupta_lanza_media_error():
+    whatsapp = FakeWhatsApp(b"no soy una imagen")
+
+    with pytest.raises(MediaError, match="image processing failed"):
+        await _processor(whatsapp).process(MediaInput(type="image", media_id="m3"))
+
+
+@pytest.mark.asyncio
+async def test_tipo_no_soportado_lanza_media_error():
+    with pytest.raises(MediaError, match="unsupported"):
+        await _processor(FakeWhatsApp(b"")).process(MediaInput(type="video", media_id="m4"))
+
+
+@pytest.mark.asyncio
+async def test_audio_sin_transcriptor_no_se_descarga():
+    whatsapp = FakeWhatsApp(b"x" * 10)
+    processor = MediaProcessor(whatsapp, executor=ThreadPoolExecutor(max_workers=1))
+
+    with pytest.raises(MediaUnsupported, match="TRANSCRIBER"):
+        await processor.process(MediaInput(type="audio", media_id="m1"))
+
+    assert whatsapp.downloaded_to is None
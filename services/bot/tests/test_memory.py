@@ -2,7 +2,7 @@ import json
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from app.memory import ConversationMemory
+from app.memory import ConversationMemory, StaleFenceError
 
 
 @pytest.mark.asyncio
@@ -15,7 +15,36 @@ async def test_get_conversation_sin_datos_devuelve_lista_vacia(mocker):
     result = await memory.get_conversation("521111111111")
 
     assert result == []
-    redis_mock.get.assert_awaited_once_with("conv:521111111111")
+    # Sin conversación nueva se busca una vez la clave anterior a los hash tags
+    assert [c.args for c in redis_mock.get.await_args_list] == [("conv:{521111111111}",), ("conv:521111111111",)]
+
+
+@pytest.mark.asyncio
+async def test_conversacion_con_clave_vieja_se_migra_al_leerla():
+    """Tras el deploy con hash tags, la conversación guardada en conv:<id> no se pierde."""
+    stored = [{"role": "user", "content": "antes del deploy"}]
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock(side_effect=lambda key: json.dumps(stored).encode() if key == "conv:5211" else None)
+    redis_mock.eval = AsyncMock(return_value=1)
+    redis_mock.delete = AsyncMock()
+    memory = ConversationMemory(redis=redis_mock)
+
+    assert await memory.get_conversation("5211") == stored
+
+    script_call = redis_mock.eval.await_args
+    assert script_call.args[2:5] == ("conv:{5211}", "convver:{5211}", json.dumps(stored))
+    redis_mock.delete.assert_awaited_once_with("conv:5211")
+    assert memory.archive_stats() == {"enabled": False}
+
+
+@pytest.mark.asyncio
+async def test_claves_viejas_desactivadas_no_hacen_lecturas_extra():
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock(return_value=None)
+    memory = ConversationMemory(redis=redis_mock, legacy_keys=False)
+
+    assert await memory.get_conversation("5211") == []
+    redis_mock.get.assert_awaited_once_with("conv:{5211}")
 
 
 @pytest.mark.asyncio
@@ -55,3 +84,338 @@ async def test_get_conversation_json_no_lista_lanza_excepcion(mocker):
 
     with pytest.raises(TypeError, match="JSON list"):
         await memory.get_conversation("521111111111")
+
+
+@pytest.mark.asyncio
+async def test_append_message_con_fence_escribe_atomicamente(mocker):
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock(return_value=None)
+    redis_mock.eval = AsyncMock(return_value=1)
+    mocker.patch("app.memory.Redis.from_url", return_value=redis_mock)
+
+    memory = ConversationMemory("redis://localhost:6379/0")
+    await memory.append_message("521111111111", "user", "hola", fence=4)
+
+    call = redis_mock.eval.await_args
+    assert call.args[1:6] == (3, "conv:{521111111111}", "lockfence:{521111111111}", "convver:{521111111111}", 4)
+    assert json.loads(call.args[6]) == [{"role": "user", "content": "hola"}]
+    redis_mock.set.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_append_message_con_fence_viejo_lanza_excepcion(mocker):
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock(return_value=None)
+    redis_mock.eval = AsyncMock(return_value=0)
+    mocker.patch("app.memory.Redis.from_url", return_value=redis_mock)
+
+    memory = ConversationMemory("redis://localhost:6379/0")
+
+    with pytest.raises(StaleFenceError):
+        await memory.append_message("521111111111", "user", "hola", fence=3)
+
+
+@pytest.mark.asyncio
+async def test_max_messages_de_la_instancia_rige_escritura_cache_y_lectura():
+    """Un límite distinto de 20 se respeta igual en Redis, en la caché y al leer."""
+    stored = [{"role": "user", "content": f"m{i}"} for i in range(30)]
+    memory, redis_mock = _cached_memory(max_messages=30)
+    redis_mock.mget.return_value = [json.dumps(stored), b"1"]
+    redis_mock.eval.return_value = 2
+    redis_mock.get.side_effect = _version_only(b"2")
+
+    await memory.append_message("521111111111", "assistant", "nuevo", fence=5)
+
+    written = json.loads(redis_mock.eval.await_args.args[6])
+    assert len(written) == 30
+    assert (written[0]["content"], written[-1]["content"]) == ("m1", "nuevo")
+    assert await memory.get_conversation("521111111111") == written
+    assert len(await memory.get_conversation("521111111111", max_messages=10)) == 10
+
+
+def _version_only(version):
+    """GET que solo encuentra el contador de versión (ninguna conversación con clave vieja)."""
+    return lambda key: version if key.startswith("convver:") else None
+
+
+def _cached_memory(**kwargs):
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock()
+    redis_mock.mget = AsyncMock()
+    redis_mock.eval = AsyncMock()
+    return ConversationMemory(redis=redis_mock, cache_max_entries=10, **kwargs), redis_mock
+
+
+@pytest.mark.asyncio
+async def test_cache_sirve_conversacion_si_la_version_no_cambio():
+    memory, redis_mock = _cached_memory()
+    stored = [{"role": "user", "content": "hola"}]
+    redis_mock.mget.return_value = [json.dumps(stored).encode(), b"3"]
+    redis_mock.get.return_value = b"3"
+
+    assert await memory.get_conversation("521111111111") == stored
+    assert await memory.get_conversation("521111111111") == stored
+
+    redis_mock.mget.assert_awaited_once_with("conv:{521111111111}", "convver:{521111111111}")
+    # El segundo turno solo consulta la versión, no descarga el historial
+    redis_mock.get.assert_awaited_once_with("convver:{521111111111}")
+    assert memory.cache_stats()["hits"] == 1
+    assert memory.cache_stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_recarga_si_otra_replica_escribio():
+    memory, redis_mock = _cached_memory()
+    redis_mock.mget.side_effect = [
+        [json.dumps([{"role": "user", "content": "hola"}]).encode(), b"3"],
+        [json.dumps([{"role": "user", "content": "hola"}, {"role": "assistant", "content": "¡Hola!"}]).encode(), b"4"],
+    ]
+    redis_mock.get.return_value = b"4"
+
+    await memory.get_conversation("521111111111")
+    result = await memory.get_conversation("521111111111")
+
+    assert result[-1]["content"] == "¡Hola!"
+    assert memory.cache_stats()["stale"] == 1
+
+
+@pytest.mark.asyncio
+async def test_append_message_escribe_a_traves_del_cache():
+    memory, redis_mock = _cached_memory()
+    redis_mock.mget.return_value = [None, None]
+    redis_mock.eval.return_value = 1
+    redis_mock.get.side_effect = _version_only(b"1")
+
+    await memory.append_message("521111111111", "user", "hola", fence=2)
+    result = await memory.get_conversation("521111111111")
+
+    assert result == [{"role": "user", "content": "hola"}]
+    assert redis_mock.mget.await_count == 1
+    assert memory.cache_stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_no_comparte_la_lista_con_el_llamador():
+    memory, redis_mock = _cached_memory()
+    redis_mock.mget.return_value = [json.dumps([{"role": "user", "content": "hola"}]).encode(), b"1"]
+    redis_mock.get.return_value = b"1"
+
+    first = await memory.get_conversation("521111111111")
+    first.append({"role": "assistant", "content": "mutado"})
+
+    assert await memory.get_conversation("521111111111") == [{"role": "user", "content": "hola"}]
+
+
+@pytest.mark.asyncio
+async def test_fence_viejo_invalida_entrada_en_cache():
+    memory, redis_mock = _cached_memory()
+    redis_mock.mget.return_value = [json.dumps([{"role": "user", "content": "hola"}]).encode(), b"1"]
+    redis_mock.eval.return_value = 0
+
+    with pytest.raises(StaleFenceError):
+        await memory.append_message("521111111111", "user", "otra vez", fence=1)
+
+    assert memory.cache_stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_expulsa_lo_menos_usado_por_entradas_y_bytes():
+    memory, redis_mock = _cached_memory(cache_max_bytes=100)
+    memory._cache._max_entries = 2
+    redis_mock.eval.side_effect = [1, 1, 1, 1]
+    redis_mock.mget.return_value = [None, None]
+
+    for sender in ("a", "b", "c"):
+        await memory.append_message(sender, "user", "hola")
+    stats = memory.cache_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+    # Una conversación más grande que el presupuesto de bytes no se cachea
+    await memory.append_message("d", "user", "x" * 200)
+    assert memory._cache.get("d") is None
+    assert memory.cache_stats()["bytes"] <= 100
+
+
+@pytest.mark.asyncio
+async def test_cache_respeta_ttl():
+    memory, redis_mock = _cached_memory(cache_ttl=0)
+    redis_mock.mget.return_value = [json.dumps([]).encode(), b"1"]
+
+    await memory.get_conversation("521111111111")
+    await memory.get_conversation("521111111111")
+
+    assert redis_mock.mget.await_count == 2
+    redis_mock.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_clear_incrementa_version_y_vacia_cache():
+    memory, redis_mock = _cached_memory()
+    redis_mock.eval.return_value = 5
+    redis_mock.mget.return_value = [None, None]
+    await memory.append_message("521111111111", "user", "hola")
+
+    await memory.clear("521111111111")
+
+    assert redis_mock.eval.await_args.args[1:4] == (2, "conv:{521111111111}", "convver:{521111111111}")
+    assert memory.cache_stats()["entries"] == 0
+
+
+def _archived_memory(tmp_path, **kwargs):
+    from app.archive import ConversationArchive
+    archive = ConversationArchive(tmp_path)
+    redis_mock = MagicMock()
+    for name in ("get", "mget", "eval", "zadd", "zrem", "zrangebyscore"):
+        setattr(redis_mock, name, AsyncMock())
+    return ConversationMemory(redis=redis_mock, archive=archive, **kwargs), redis_mock, archive
+
+
+@pytest.mark.asyncio
+async def test_archive_idle_mueve_conversaciones_inactivas(tmp_path):
+    memory, redis_mock, archive = _archived_memory(tmp_path)
+    stored = [{"role": "user", "content": "hola"}]
+    redis_mock.zrangebyscore.return_value = [b"521111111111"]
+    redis_mock.mget.return_value = [json.dumps(stored).encode(), b"7"]
+    redis_mock.eval.side_effect = [1, 1]
+
+    moved = await memory.archive_idle(idle_seconds=3600)
+
+    assert moved == 1
+    assert archive.load("521111111111") == stored
+    evict_call, zrem_call = redis_mock.eval.await_args_list
+    # Solo se borra de Redis si la versión sigue siendo la leída
+    assert evict_call.args[1:5] == (2, "conv:{521111111111}", "convver:{521111111111}", b"7")
+    assert zrem_call.args[-1] == "521111111111"
+    assert memory.archive_stats()["archived"] == 1
+
+
+@pytest.mark.asyncio
+async def test_archive_idle_no_borra_si_hubo_escritura_concurrente(tmp_path):
+    memory, redis_mock, archive = _archived_memory(tmp_path)
+    redis_mock.zrangebyscore.return_value = [b"521111111111"]
+    redis_mock.mget.return_value = [json.dumps([{"role": "user", "content": "hola"}]).encode(), b"7"]
+    redis_mock.eval.return_value = 0
+
+    moved = await memory.archive_idle(idle_seconds=3600)
+
+    assert moved == 0
+    # Solo el script de desalojo: el remitente sigue en el set de inactivos
+    assert redis_mock.eval.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_conversation_rehidrata_desde_el_archivo(tmp_path):
+    memory, redis_mock, archive = _archived_memory(tmp_path)
+    stored = [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "¡Hola!"}]
+    archive.store_many([("521111111111", stored)])
+    redis_mock.get.return_value = None
+    redis_mock.eval.return_value = 8
+
+    result = await memory.get_conversation("521111111111")
+
+    assert result == stored
+    call = redis_mock.eval.await_args
+    assert call.args[1:4] == (2, "conv:{521111111111}", "convver:{521111111111}")
+    assert json.loads(call.args[4]) == stored
+    redis_mock.zadd.assert_awaited_once()
+    assert memory.archive_stats()["rehydrated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rehidratacion_con_cache_deja_la_conversacion_caliente(tmp_path):
+    memory, redis_mock, archive = _archived_memory(tmp_path, cache_max_entries=10)
+    stored = [{"role": "user", "content": "hola"}]
+    archive.store_many([("521111111111", stored)])
+    redis_mock.mget.return_value = [None, b"3"]
+    redis_mock.eval.return_value = 4
+    redis_mock.get.side_effect = _version_only(b"4")
+
+    assert await memory.get_conversation("521111111111") == stored
+    assert await memory.get_conversation("521111111111") == stored
+
+    assert redis_mock.mget.await_count == 1
+    assert memory.cache_stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_clear_borra_tambien_del_archivo(tmp_path):
+    memory, redis_mock, archive = _archived_memory(tmp_path)
+    archive.store_many([("521111111111", [{"role": "user", "content": "hola"}])])
+
+    await memory.clear("521111111111")
+
+    assert archive.load("521111111111") is None
+    redis_mock.zrem.assert_awaited_once_with("conv:idle", "521111111111")
+
+
+def _degraded_memory(**kwargs):
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from app.fallback import RedisHealth
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock()
+    redis_mock.mget = AsyncMock()
+    redis_mock.eval = AsyncMock()
+    health = RedisHealth(redis_mock)
+    memory = ConversationMemory(redis=redis_mock, cache_max_entries=10, health=health, **kwargs)
+    return memory, redis_mock, health, RedisConnectionError("connection refused")
+
+
+@pytest.mark.asyncio
+async def test_redis_caido_atiende_desde_el_store_local_partiendo_del_cache():
+    memory, redis_mock, health, down = _degraded_memory()
+    redis_mock.mget.return_value = [json.dumps([{"role": "user", "content": "antes"}]).encode(), b"1"]
+    await memory.get_conversation("521111111111")
+
+    redis_mock.get.side_effect = down
+    redis_mock.mget.side_effect = down
+    redis_mock.eval.side_effect = down
+    history = await memory.get_conversation("521111111111")
+    await memory.append_message("521111111111", "user", "durante", fence=None)
+    await memory.append_message("521111111111", "assistant", "respuesta", fence=None)
+
+    assert history == [{"role": "user", "content": "antes"}]
+    assert not health.available
+    contents = [m["content"] for m in await memory.get_conversation("521111111111")]
+    assert contents == ["antes", "durante", "respuesta"]
+    assert memory.pending_write_back() == ["521111111111"]
+    stats = memory.fallback_stats()
+    assert stats["active"] is True and stats["writes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_write_back_agrega_los_turnos_pendientes_a_redis():
+    memory, redis_mock, health, down = _degraded_memory()
+    health.report_failure(down)
+    await memory.append_message("521111111111", "user", "durante", fence=None)
+
+    # Redis vuelve; mientras haya pendientes la conversación se sigue leyendo localmente
+    redis_mock.ping = AsyncMock(return_value=True)
+    await health.check()
+    assert health.available
+    assert [m["content"] for m in await memory.get_conversation("521111111111")] == ["durante"]
+    redis_mock.mget.assert_not_awaited()
+
+    redis_mock.mget.return_value = [json.dumps([{"role": "user", "content": "antes"}]).encode(), b"4"]
+    redis_mock.eval.return_value = 5
+    written = await memory.write_back("521111111111", fence=9)
+
+    assert written == 1
+    script_args = redis_mock.eval.await_args.args
+    assert script_args[5] == 9
+    assert json.loads(script_args[6]) == [
+        {"role": "user", "content": "antes"}, {"role": "user", "content": "durante"},
+    ]
+    assert memory.pending_write_back() == []
+    assert memory.fallback_stats()["written_back"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sin_monitor_el_error_de_redis_se_propaga():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    memory, redis_mock = _cached_memory()
+    redis_mock.mget.side_effect = RedisConnectionError("connection refused")
+
+    with pytest.raises(RedisConnectionError):
+        await memory.get_conversation("521111111111")
+    assert memory.fallback_stats() == {"enabled": False}
@@ -0,0 +1,82 @@
+"""
+Tests del modo directo de Meta (firma, parseo de eventos, deduplicación) — app/meta_webhook.py
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.meta_webhook import MessageDeduplicator, parse_events, sign, verify_signature
+from tests.conftest import META_STATUS_PAYLOAD
+
+BODY = b'{"object":"whatsapp_business_account","entry":[]}'
+
+
+def test_firma_valida_se_acepta():
+    assert verify_signature("app-secret", BODY, sign("app-secret", BODY))
+
+
+@pytest.mark.parametrize("signature", [
+    None,
+    "",
+    "sha1=abc",
+    "sha256=" + "0" * 64,
+])
+def test_firma_ausente_o_incorrecta_se_rechaza(signature):
+    assert not verify_signature("app-secret", BODY, signature)
+
+
+def test_firma_de_otro_body_se_rechaza():
+    """La firma cubre el body crudo: cualquier byte distinto la invalida."""
+    assert not verify_signature("app-secret", BODY + b" ", sign("app-secret", BODY))
+    assert not verify_signature("otro-secret", BODY, sign("app-secret", BODY))
+
+
+def test_parse_events_aplana_entradas_cambios_y_mensajes():
+    body = {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {"changes": [{"value": {"messages": [
+                {"id": "wamid.1", "from": "5211", "type": "text", "text": {"body": "hola"}},
+                {"id": "wamid.2", "from": "5211", "type": "audio", "audio": {"id": "media-1", "mime_type": "audio/ogg"}},
+            ]}}]},
+            {"changes": [{"value": {"messages": [
+                {"id": "wamid.3", "from": "5222", "type": "location", "location": {}},
+                {"id": "wamid.4", "type": "text"},  # sin remitente: se descarta
+            ]}}]},
+        ],
+    }
+
+    messages, statuses = parse_events(body)
+
+    assert [(m.message_id, m.sender, m.type) for m in messages] == [
+        ("wamid.1", "5211", "text"), ("wamid.2", "5211", "audio"), ("wamid.3", "5222", "location"),
+    ]
+    assert messages[0].text == "hola"
+    assert messages[1].media.media_id == "media-1"
+    assert messages[2].media is None
+    assert statuses == []
+
+
+def test_parse_events_lee_statuses():
+    messages, statuses = parse_events(META_STATUS_PAYLOAD)
+
+    assert messages == []
+    assert [(s.message_id, s.status, s.recipient) for s in statuses] == [("wamid.test", "delivered", "5215627698201")]
+
+
+@pytest.mark.asyncio
+async def test_dedup_acepta_solo_la_primera_entrega():
+    redis = MagicMock()
+    redis.set = AsyncMock(side_effect=[True, None])
+    dedup = MessageDeduplicator(redis, ttl_seconds=60)
+
+    assert await dedup.first_delivery("wamid.1") is True
+    assert await dedup.first_delivery("wamid.1") is False
+    redis.set.assert_awaited_with("wamid:wamid.1", 1, nx=True, ex=60)
+
+
+@pytest.mark.asyncio
+async def test_dedup_deja_pasar_si_redis_falla():
+    redis = MagicMock()
+    redis.set = AsyncMock(side_effect=ConnectionError("redis caído"))
+
+    assert await MessageDeduplicator(redis).first_delivery("wamid.1") is True
@@ -1,7 +1,10 @@
+import json
+
 import httpx
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
+from app.llm import BATCH_COMPLETED, BATCH_FAILED, BATCH_PENDING, BATCH_RUNNING, BatchRequest
 from app.openai_client import OpenAIClient
 
 
@@ -14,11 +17,8 @@ async def test_chat_envia_payload_y_headers_correctos(mocker):
     }
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
 
     client = OpenAIClient(api_key="sk-test", model="gpt-4o")
     messages = [{"role": "user", "content": "hola"}]
@@ -41,11 +41,8 @@ async def test_chat_respuesta_inesperada_devuelve_vacio(mocker):
     response_mock.json.return_value = {"unexpected": True}
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
 
     client = OpenAIClient(api_key="sk-test", model="gpt-4o")
     result = await client.chat([{"role": "user", "content": "hola"}])
@@ -62,11 +59,8 @@ async def test_chat_content_vacio_devuelve_vacio(mocker):
     }
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
 
     client = OpenAIClient(api_key="sk-test", model="gpt-4o")
     result = await client.chat([{"role": "user", "content": "hola"}])
@@ -85,13 +79,205 @@ async def test_chat_error_http_se_propaga(mocker):
     response_mock.json.return_value = {}
 
     post_mock = AsyncMock(return_value=response_mock)
-    client_in_context = MagicMock(post=post_mock)
-    async_client_cm = MagicMock()
-    async_client_cm.__aenter__ = AsyncMock(return_value=client_in_context)
-    async_client_cm.__aexit__ = AsyncMock(return_value=None)
-    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=async_client_cm)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
 
     client = OpenAIClient(api_key="sk-test", model="gpt-4o")
 
     with pytest.raises(httpx.HTTPStatusError):
         await client.chat([{"role": "user", "content": "hola"}])
+
+
+@pytest.mark.asyncio
+async def test_chat_permite_sobrescribir_modelo_y_max_tokens(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "choices": [{"message": {"content": "ok"}}]
+    }
+
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+    await client.chat([{"role": "user", "content": "hola"}], model="gpt-4o-mini", max_tokens=200)
+
+    payload = post_mock.await_args.kwargs["json"]
+    assert payload["model"] == "gpt-4o-mini"
+    assert payload["max_tokens"] == 200
+
+
+@pytest.mark.asyncio
+async def test_complete_devuelve_uso_de_tokens_y_reutiliza_el_cliente_http(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "model": "gpt-4o-2024-08-06",
+        "choices": [{"message": {"content": "hola"}}],
+        "usage": {"prompt_tokens": 42, "completion_tokens": 7},
+    }
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    http_client.aclose = AsyncMock()
+    async_client = mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o", base_url="http://127.0.0.1:8089/v1")
+    completion = await client.complete([{"role": "user", "content": "hola"}])
+    await client.chat([{"role": "user", "content": "hola"}])
+    await client.aclose()
+
+    assert completion.text == "hola"
+    assert completion.model == "gpt-4o-2024-08-06"
+    assert (completion.prompt_tokens, completion.completion_tokens) == (42, 7)
+    assert post_mock.await_args.args[0] == "http://127.0.0.1:8089/v1/chat/completions"
+    assert async_client.call_count == 1
+    http_client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_complete_envia_temperatura_y_stop_y_lee_finish_reason(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {
+        "choices": [{"message": {"content": "Claro, el precio es"}, "finish_reason": "length"}],
+    }
+    post_mock = AsyncMock(return_value=response_mock)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+    completion = await client.complete(
+        [{"role": "user", "content": "hola"}], max_tokens=60, temperature=0.7, stop=("a", "b", "c", "d", "e")
+    )
+
+    payload = post_mock.await_args.kwargs["json"]
+    assert (payload["max_tokens"], payload["temperature"]) == (60, 0.7)
+    assert payload["stop"] == ["a", "b", "c", "d"]
+    assert completion.finish_reason == "length"
+
+
+@pytest.mark.asyncio
+async def test_chat_sin_parametros_usa_valores_por_defecto(mocker):
+    response_mock = MagicMock()
+    response_mock.raise_for_status = MagicMock()
+    response_mock.json.return_value = {"choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}]}
+    post_mock = AsyncMock(return_value=response_mock)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=MagicMock(post=post_mock, is_closed=False))
+
+    await OpenAIClient(api_key="sk-test").chat([{"role": "user", "content": "hola"}])
+
+    payload = post_mock.await_args.kwargs["json"]
+    assert (payload["max_tokens"], payload["temperature"]) == (800, 0.2)
+    assert "stop" not in payload
+
+
+def _json_response(data=None, text=""):
+    response = MagicMock()
+    response.raise_for_status = MagicMock()
+    response.json.return_value = data
+    response.text = text
+    return response
+
+
+@pytest.mark.asyncio
+async def test_submit_batch_sube_jsonl_y_crea_el_batch(mocker):
+    post_mock = AsyncMock(side_effect=[_json_response({"id": "file-1"}), _json_response({"id": "batch_1"})])
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+    batch_id = await client.submit_batch([
+        BatchRequest("a", [{"role": "user", "content": "hola"}]),
+        BatchRequest("b", [{"role": "user", "content": "adiós"}], max_tokens=50),
+    ])
+
+    assert batch_id == "batch_1"
+    upload, create = post_mock.await_args_list
+    assert upload.args[0] == "https://api.openai.com/v1/files"
+    assert upload.kwargs["data"] == {"purpose": "batch"}
+    lines = [json.loads(line) for line in upload.kwargs["files"]["file"][1].decode().splitlines()]
+    assert [line["custom_id"] for line in lines] == ["a", "b"]
+    assert lines[1]["url"] == "/v1/chat/completions"
+    assert lines[1]["body"]["model"] == "gpt-4o"
+    assert lines[1]["body"]["max_tokens"] == 50
+    assert create.kwargs["json"] == {
+        "input_file_id": "file-1", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+        "metadata": {"model": "gpt-4o"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_submit_batch_rechaza_modelos_mezclados(mocker):
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=MagicMock(is_closed=False))
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+
+    with pytest.raises(ValueError):
+        await client.submit_batch([BatchRequest("a", [], model="gpt-4o"), BatchRequest("b", [], model="gpt-4o-mini")])
+
+
+@pytest.mark.asyncio
+async def test_batch_results_lee_salida_y_errores(mocker):
+    output = json.dumps({
+        "custom_id": "a",
+        "response": {"status_code": 200, "body": {
+            "model": "gpt-4o",
+            "choices": [{"message": {"content": "hola"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+        }},
+        "error": None,
+    })
+    errors = json.dumps({"custom_id": "b", "response": {"status_code": 400, "body": {}}, "error": None})
+    get_mock = AsyncMock(side_effect=[
+        _json_response({"status": "completed", "output_file_id": "file-out", "error_file_id": "file-err"}),
+        _json_response(text=output),
+        _json_response(text=errors),
+    ])
+    http_client = MagicMock(get=get_mock, is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+    ok, failed = await client.batch_results("batch_1")
+
+    assert ok.custom_id == "a"
+    assert ok.completion.text == "hola"
+    assert ok.completion.prompt_tokens == 10
+    assert failed.custom_id == "b"
+    assert failed.completion is None
+    assert failed.error == "HTTP 400"
+
+
+@pytest.mark.asyncio
+async def test_batch_results_usa_el_modelo_del_batch_si_la_respuesta_no_lo_trae(mocker):
+    """Un batch para un modelo distinto del default no se atribuye al modelo del cliente."""
+    output = json.dumps({
+        "custom_id": "a",
+        "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "hola"}}], "usage": {}}},
+    })
+    get_mock = AsyncMock(side_effect=[
+        _json_response({"status": "completed", "output_file_id": "file-out", "metadata": {"model": "gpt-4o-mini"}}),
+        _json_response(text=output),
+    ])
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=MagicMock(get=get_mock, is_closed=False))
+
+    # Otro proceso (p. ej. un replay con --resume) lee el modelo desde la metadata del batch
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+    (result,) = await client.batch_results("batch_1")
+
+    assert result.completion.model == "gpt-4o-mini"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, expected", [
+    ("validating", BATCH_PENDING),
+    ("in_progress", BATCH_RUNNING),
+    ("completed", BATCH_COMPLETED),
+    ("expired", BATCH_FAILED),
+])
+async def test_batch_status_normaliza_estados(mocker, status, expected):
+    http_client = MagicMock(get=AsyncMock(return_value=_json_response({"status": status})), is_closed=False)
+    mocker.patch("app.openai_client.httpx.AsyncClient", return_value=http_client)
+
+    client = OpenAIClient(api_key="sk-test", model="gpt-4o")
+
+    assert await client.batch_status("batch_1") == expected
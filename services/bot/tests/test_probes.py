@@ -0,0 +1,71 @@
+"""
+Tests de los chequeos de dependencias en segundo plano para /readyz — app/probes.py
+"""
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock
+
+from app.probes import DependencyProbe, parse_required
+
+
+@pytest.mark.asyncio
+async def test_resultados_se_guardan_por_chequeo():
+    probe = DependencyProbe()
+    probe.add("redis", AsyncMock(return_value="ok"))
+    probe.add("llm", AsyncMock(return_value="degraded"))
+    probe.add("whatsapp", AsyncMock(side_effect=RuntimeError("401")))
+
+    for name in ("redis", "llm", "whatsapp"):
+        await probe.run(name)
+
+    results = probe.results()
+    assert results["redis"]["status"] == "ok"
+    assert results["llm"]["status"] == "degraded"
+    assert results["whatsapp"] == {**results["whatsapp"], "status": "failed", "error": "RuntimeError"}
+    assert results["redis"]["latency_ms"] is not None and results["redis"]["age_seconds"] == 0.0
+    # Degradado no bloquea; fallido sí
+    assert probe.blocking() == ["whatsapp"]
+
+
+@pytest.mark.asyncio
+async def test_chequeo_colgado_falla_por_timeout():
+    async def hung():
+        await asyncio.sleep(10)
+
+    probe = DependencyProbe(timeout=0.01)
+    probe.add("redis", hung)
+
+    assert await probe.run("redis") == "failed"
+    assert probe.results()["redis"]["error"] == "timeout after 0.01s"
+
+
+def test_chequeo_pendiente_bloquea_solo_si_es_requerido():
+    probe = DependencyProbe()
+    probe.add("redis", AsyncMock(), required=True)
+    probe.add("llm", AsyncMock(), required=False)
+
+    assert probe.blocking() == ["redis"]
+    assert probe.results()["llm"]["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_chequeos_corren_en_segundo_plano_con_su_intervalo():
+    fast, slow = AsyncMock(return_value=None), AsyncMock(return_value="ok")
+    probe = DependencyProbe()
+    probe.add("redis", fast, interval=0.01)
+    probe.add("llm", slow, interval=10)
+
+    probe.start()
+    await asyncio.sleep(0.05)
+    await probe.stop()
+
+    assert fast.await_count >= 3
+    assert slow.await_count == 1
+    assert probe.blocking() == []
+
+
+def test_parse_required_rechaza_nombres_desconocidos():
+    assert parse_required(" redis, llm ,", ("redis", "llm", "whatsapp")) == {"redis", "llm"}
+    with pytest.raises(ValueError, match="redsi"):
+        parse_required("redsi", ("redis", "llm", "whatsapp"))
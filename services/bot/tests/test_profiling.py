@@ -0,0 +1,155 @@
+"""
+Tests del diagnóstico de latencia (requests lentas, lag del loop, profiler) — app/profiling.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.logs import correlation_id
+from app.profiling import LoopLagMonitor, SamplingProfiler, SlowRequestRecorder, record_stage, stage
+
+
+def test_request_lenta_guarda_sus_etapas():
+    recorder = SlowRequestRecorder(threshold_ms=5)
+
+    token = correlation_id.set("req-1")
+    try:
+        with recorder.track("whatsapp_webhook"):
+            with stage("llm"):
+                time.sleep(0.01)
+            with stage("llm"):
+                pass
+            started = time.perf_counter()
+            record_stage("memory_write", started)
+    finally:
+        correlation_id.reset(token)
+
+    [record] = recorder.recent()
+    assert record["name"] == "whatsapp_webhook"
+    assert record["correlation_id"] == "req-1"
+    assert list(record["stages"]) == ["llm", "memory_write"]
+    assert record["stages"]["llm"] >= 10
+    assert record["total_ms"] >= record["stages"]["llm"]
+    assert record["outcome"] == "ok"
+    assert recorder.stats() == {"threshold_ms": 5, "tracked": 1, "slow": 1, "buffered": 1}
+
+
+def test_request_rapida_no_se_guarda():
+    recorder = SlowRequestRecorder(threshold_ms=1000)
+
+    with recorder.track("whatsapp_webhook"):
+        with stage("parse"):
+            pass
+
+    assert recorder.recent() == []
+    assert recorder.stats()["tracked"] == 1
+
+
+def test_buffer_circular_conserva_las_mas_recientes():
+    recorder = SlowRequestRecorder(threshold_ms=0.0001, capacity=3)
+
+    for i in range(5):
+        with recorder.track(f"req-{i}"):
+            time.sleep(0.001)
+
+    assert [r["name"] for r in recorder.recent()] == ["req-4", "req-3", "req-2"]
+    assert [r["name"] for r in recorder.recent(limit=1)] == ["req-4"]
+    assert recorder.stats()["slow"] == 5
+
+
+def test_excepcion_se_registra_y_se_propaga():
+    recorder = SlowRequestRecorder(threshold_ms=0.0001)
+
+    with pytest.raises(ValueError):
+        with recorder.track("whatsapp_webhook"):
+            time.sleep(0.001)
+            raise ValueError("boom")
+
+    assert recorder.recent()[0]["outcome"] == "ValueError"
+
+
+def test_track_anidado_suma_etapas_a_la_request_externa():
+    recorder = SlowRequestRecorder(threshold_ms=0.0001)
+
+    with recorder.track("whatsapp_webhook"):
+        with recorder.track("meta_message"):
+            with stage("llm"):
+                time.sleep(0.001)
+
+    [record] = recorder.recent()
+    assert record["name"] == "whatsapp_webhook"
+    assert list(record["stages"]) == ["llm"]
+
+
+def test_umbral_cero_desactiva_y_stage_fuera_de_request_no_hace_nada():
+    recorder = SlowRequestRecorder(threshold_ms=0)
+
+    with recorder.track("whatsapp_webhook"):
+        with stage("llm"):
+            time.sleep(0.001)
+    with stage("llm"):
+        pass
+
+    assert recorder.recent() == []
+    assert recorder.stats()["tracked"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lag_del_loop_se_mide_y_se_asocia_a_la_request():
+    """Un bloqueo síncrono en el loop aparece como lag en la request que lo sufrió."""
+    monitor = LoopLagMonitor(interval=0.01)
+    recorder = SlowRequestRecorder(threshold_ms=0.0001, lag_monitor=monitor)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.03)
+        with recorder.track("whatsapp_webhook"):
+            time.sleep(0.05)  # bloquea el loop
+            await asyncio.sleep(0.03)
+    finally:
+        await monitor.stop()
+
+    assert recorder.recent()[0]["loop_lag_max_ms"] >= 30
+    stats = monitor.stats()
+    assert stats["max_ms"] >= 30
+    assert stats["enabled"] is False and stats["samples"] > 2
+
+
+def test_monitor_sin_muestras():
+    assert LoopLagMonitor().stats() == {"enabled": False, "samples": 0}
+    assert LoopLagMonitor().max_lag_between(0, time.perf_counter()) is None
+
+
+def _busy_function(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(200))
+
+
+@pytest.mark.asyncio
+async def test_profiler_devuelve_stacks_colapsados_del_loop():
+    profiler = SamplingProfiler(interval=0.001)
+
+    async def busy_loop():
+        await asyncio.sleep(0.01)
+        _busy_function(0.1)
+
+    (collapsed, samples), _ = await asyncio.gather(profiler.profile(0.15), busy_loop())
+
+    assert samples > 10
+    lines = collapsed.splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1 and ";" in stack
+    assert any("_busy_function (test_profiling.py:" in line for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_profiler_rechaza_un_segundo_perfil_simultaneo():
+    profiler = SamplingProfiler(interval=0.001)
+
+    first = asyncio.create_task(profiler.profile(0.1))
+    await asyncio.sleep(0.02)
+    with pytest.raises(RuntimeError):
+        await profiler.profile(0.1)
+    await first
+    assert not profiler.running
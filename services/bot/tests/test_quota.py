@@ -0,0 +1,141 @@
+import calendar
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.quota import ALLOW, DOWNGRADE, REJECT, TokenQuota
+
+# 2026-03-15 12:00 UTC
+NOW = calendar.timegm((2026, 3, 15, 12, 0, 0))
+
+
+def _redis(tokens=None, cost=None):
+    redis = MagicMock()
+    redis.hmget = AsyncMock(return_value=[tokens, cost])
+    redis.eval = AsyncMock(return_value=1)
+    redis.hgetall = AsyncMock(return_value={})
+    return redis
+
+
+@pytest.mark.asyncio
+async def test_sin_presupuesto_no_consulta_redis():
+    redis = _redis()
+    quota = TokenQuota(redis)
+
+    assert (await quota.check("5211", now=NOW)).action == ALLOW
+    redis.hmget.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tokens, expected", [(None, ALLOW), (b"7999", ALLOW), (b"8000", DOWNGRADE), (b"10000", REJECT)])
+async def test_check_por_tokens_del_dia(tokens, expected):
+    redis = _redis(tokens=tokens)
+    quota = TokenQuota(redis, daily_tokens=10_000, downgrade_ratio=0.8)
+
+    decision = await quota.check("5211", now=NOW)
+
+    assert decision.action == expected
+    redis.hmget.assert_awaited_once_with("quota:{5211}:20260315", "tokens", "cost")
+
+
+@pytest.mark.asyncio
+async def test_check_por_costo_en_microdolares():
+    # 0.50 USD usados de 0.50 USD diarios
+    quota = TokenQuota(_redis(tokens=b"10", cost=b"500000"), daily_tokens=1_000_000, daily_cost=0.5)
+
+    decision = await quota.check("5211", now=NOW)
+
+    assert decision.action == REJECT
+    assert decision.cost_used == 0.5
+
+
+@pytest.mark.asyncio
+async def test_modo_downgrade_nunca_rechaza():
+    quota = TokenQuota(_redis(tokens=b"50000"), daily_tokens=10_000, on_exceeded="downgrade")
+
+    assert (await quota.check("5211", now=NOW)).action == DOWNGRADE
+
+
+@pytest.mark.asyncio
+async def test_error_de_redis_permite_el_mensaje():
+    redis = _redis()
+    redis.hmget = AsyncMock(side_effect=ConnectionError("down"))
+    quota = TokenQuota(redis, daily_tokens=10_000)
+
+    assert (await quota.check("5211", now=NOW)).action == ALLOW
+
+
+@pytest.mark.asyncio
+async def test_record_suma_tokens_y_costo_al_remitente_y_al_modelo():
+    redis = _redis()
+    quota = TokenQuota(redis, daily_tokens=10_000)
+
+    await quota.record("5211", "gpt-4o", 1000, 100, now=NOW)
+
+    sender_call, spend_call = redis.eval.await_args_list
+    # 1000 * 2.50 + 100 * 10.00 por millón = 0.0035 USD = 3500 µUSD
+    assert sender_call.args[1:6] == (1, "quota:{5211}:20260315", 1100, 3500, 2 * 86400)
+    assert spend_call.args[1:6] == (1, "quota:spend:20260315", "gpt-4o", 1000, 100)
+
+
+@pytest.mark.asyncio
+async def test_record_cobra_modelos_con_version_fechada():
+    """La API devuelve el nombre fechado ("gpt-4o-2024-08-06"); se cobra con el precio del modelo base."""
+    redis = _redis()
+    quota = TokenQuota(redis, daily_cost=1.0)
+
+    await quota.record("5211", "gpt-4o-2024-08-06", 1000, 100, now=NOW)
+
+    sender_call, _ = redis.eval.await_args_list
+    assert sender_call.args[4] == 3500
+    # El prefijo más largo gana: mini no se cobra como gpt-4o
+    assert quota.cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == 0.15
+    assert quota.cost("gemini-2.0-flash-001", 1_000_000, 0) == 0.10
+    assert quota.cost("gpt-4o2", 1_000_000, 0) is None
+
+
+@pytest.mark.asyncio
+async def test_record_sin_presupuesto_solo_acumula_gasto():
+    redis = _redis()
+    quota = TokenQuota(redis)
+
+    await quota.record("5211", "modelo-sin-precio", 10, 2, now=NOW)
+
+    (call,) = redis.eval.await_args_list
+    assert call.args[2] == "quota:spend:20260315"
+
+
+@pytest.mark.asyncio
+async def test_record_no_propaga_errores_de_redis():
+    redis = _redis()
+    redis.eval = AsyncMock(side_effect=ConnectionError("down"))
+    quota = TokenQuota(redis, daily_tokens=10_000)
+
+    await quota.record("5211", "gpt-4o", 10, 2, now=NOW)
+
+
+@pytest.mark.asyncio
+async def test_spend_agrega_por_modelo_con_costo_estimado():
+    redis = _redis()
+    redis.hgetall = AsyncMock(return_value={
+        b"gpt-4o|requests": b"2",
+        b"gpt-4o|prompt_tokens": b"1000000",
+        b"gpt-4o|completion_tokens": b"100000",
+        b"otro|requests": b"1",
+        b"otro|prompt_tokens": b"5",
+        b"otro|completion_tokens": b"1",
+    })
+    quota = TokenQuota(redis, prices={"gpt-4o": (2.0, 8.0)})
+
+    spend = await quota.spend("20260315")
+
+    redis.hgetall.assert_awaited_once_with("quota:spend:20260315")
+    assert spend["models"]["gpt-4o"] == {
+        "requests": 2, "prompt_tokens": 1_000_000, "completion_tokens": 100_000, "cost_usd": 2.8
+    }
+    assert spend["models"]["otro"]["cost_usd"] is None
+    assert spend["total_cost_usd"] == 2.8
+
+
+def test_on_exceeded_invalido_lanza_error():
+    with pytest.raises(ValueError):
+        TokenQuota(_redis(), on_exceeded="ignore")
@@ -17,8 +17,8 @@ async def test_check_rate_limit_primer_request_setea_ttl(mocker):
     assert is_allowed is True
     assert current_count == 1
     assert limit == 10
-    redis_mock.incr.assert_awaited_once_with("ratelimit:521111111111")
-    redis_mock.expire.assert_awaited_once_with("ratelimit:521111111111", 60)
+    redis_mock.incr.assert_awaited_once_with("ratelimit:{521111111111}")
+    redis_mock.expire.assert_awaited_once_with("ratelimit:{521111111111}", 60)
 
 
 @pytest.mark.asyncio
@@ -66,3 +66,21 @@ async def test_check_rate_limit_falla_redis_fail_open(mocker):
     assert current_count == 0
     assert limit == 10
     redis_mock.expire.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_redis_caido_usa_limite_local():
+    """Con monitor de salud, una caída de Redis no deja pasar todo: cuenta un limitador local."""
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from app.fallback import RedisHealth
+    redis_mock = MagicMock()
+    redis_mock.incr = AsyncMock(side_effect=RedisConnectionError("connection refused"))
+    health = RedisHealth(redis_mock)
+    limiter = RateLimiter(redis=redis_mock, max_requests=2, window_seconds=60, health=health)
+
+    results = [await limiter.check_rate_limit("521111111111") for _ in range(3)]
+
+    assert [allowed for allowed, _, _ in results] == [True, True, False]
+    assert not health.available
+    # Ya marcado como caído, no se vuelve a intentar Redis
+    assert redis_mock.incr.await_count == 1
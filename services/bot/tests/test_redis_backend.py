@@ -0,0 +1,162 @@
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.memory import ConversationMemory, version_key
+from app.rate_limiter import RateLimiter
+from app.redis_backend import ShardedRedis, create_redis, hash_tag, sender_key
+from app.sender_lock import SenderLock, fence_key, lock_key
+
+
+def _node():
+    client = MagicMock()
+    for name in ("get", "set", "incr", "expire", "eval", "delete", "ping", "aclose"):
+        setattr(client, name, AsyncMock())
+    return client
+
+
+def _sharded(count=3):
+    nodes = {f"redis://redis-{i}:6379/0": _node() for i in range(count)}
+    return ShardedRedis(nodes), nodes
+
+
+def test_claves_de_un_remitente_comparten_hash_tag():
+    keys = [sender_key("conv", "5211"), sender_key("ratelimit", "5211"), lock_key("5211"), fence_key("5211")]
+    assert keys == ["conv:{5211}", "ratelimit:{5211}", "lock:{5211}", "lockfence:{5211}"]
+    assert {hash_tag(key) for key in keys} == {"5211"}
+
+
+def test_hash_tag_sin_llaves_usa_la_clave_completa():
+    assert hash_tag("stats:global") == "stats:global"
+    assert hash_tag("conv:{}") == "conv:{}"
+
+
+def test_todas_las_claves_de_un_remitente_van_al_mismo_nodo():
+    sharded, _ = _sharded()
+    for sender in (f"52155{i:07d}" for i in range(200)):
+        nodes = {sharded.node_for(sender_key(prefix, sender)) for prefix in ("conv", "ratelimit", "lock", "lockfence")}
+        assert len(nodes) == 1
+
+
+def test_reparto_entre_nodos_es_balanceado():
+    sharded, nodes = _sharded()
+    counts = dict.fromkeys(nodes, 0)
+    for i in range(3000):
+        counts[sharded.node_for(sender_key("conv", f"52155{i:07d}"))] += 1
+    assert min(counts.values()) > 700
+
+
+def test_agregar_un_nodo_mueve_solo_una_fraccion_de_remitentes():
+    before, nodes = _sharded(3)
+    after = ShardedRedis({**nodes, "redis://redis-3:6379/0": _node()})
+    senders = [sender_key("conv", f"52155{i:07d}") for i in range(3000)]
+    moved = sum(before.node_for(key) != after.node_for(key) for key in senders)
+    # Ideal: 1/4 of the senders move to the new node, and only to it
+    assert 450 < moved < 1100
+    assert all(after.node_for(key) == "redis://redis-3:6379/0" for key in senders if before.node_for(key) != after.node_for(key))
+
+
+@pytest.mark.asyncio
+async def test_comandos_y_eval_se_enrutan_por_clave():
+    sharded, nodes = _sharded()
+    key = sender_key("conv", "521111111111")
+    owner = nodes[sharded.node_for(key)]
+
+    await sharded.get(key)
+    await sharded.set(key, "[]", ex=60)
+    await sharded.eval("return 1", 2, key, fence_key("521111111111"), 4)
+
+    owner.get.assert_awaited_once_with(key)
+    owner.set.assert_awaited_once_with(key, "[]", ex=60)
+    owner.eval.assert_awaited_once_with("return 1", 2, key, "lockfence:{521111111111}", 4)
+    for client in nodes.values():
+        if client is not owner:
+            client.get.assert_not_awaited()
+            client.eval.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_eval_sin_claves_es_rechazado():
+    sharded, _ = _sharded()
+    with pytest.raises(ValueError):
+        await sharded.eval("return 1", 0)
+
+
+@pytest.mark.asyncio
+async def test_delete_agrupa_claves_por_nodo():
+    sharded, nodes = _sharded()
+    for client in nodes.values():
+        client.delete.return_value = 1
+    keys = [sender_key("conv", f"52155{i:07d}") for i in range(30)]
+
+    deleted = await sharded.delete(*keys)
+
+    calls = [call for client in nodes.values() for call in client.delete.await_args_list]
+    assert sorted(key for call in calls for key in call.args) == sorted(keys)
+    assert deleted == len(calls)
+
+
+@pytest.mark.asyncio
+async def test_ping_requiere_todos_los_nodos():
+    sharded, nodes = _sharded()
+    for client in nodes.values():
+        client.ping.return_value = True
+    assert await sharded.ping() is True
+
+    next(iter(nodes.values())).ping.return_value = False
+    assert await sharded.ping() is False
+
+
+@pytest.mark.asyncio
+async def test_aclose_cierra_todos_los_nodos():
+    sharded, nodes = _sharded()
+    await sharded.aclose()
+    for client in nodes.values():
+        client.aclose.assert_awaited_once()
+
+
+def test_create_redis_elige_backend_segun_url(mocker):
+    from_url = mocker.patch("app.redis_backend.Redis.from_url", side_effect=lambda url, **_: MagicMock(url=url))
+    cluster_from_url = mocker.patch("app.redis_backend.RedisCluster.from_url")
+
+    single = create_redis("redis://redis:6379/0")
+    assert single.url == "redis://redis:6379/0"
+
+    sharded = create_redis("redis://a:6379/0, redis://b:6379/0")
+    assert isinstance(sharded, ShardedRedis)
+    assert sharded.nodes == ["redis://a:6379/0", "redis://b:6379/0"]
+    assert from_url.call_count == 3
+
+    create_redis("redis://seed:7000/0", cluster=True)
+    cluster_from_url.assert_called_once_with("redis://seed:7000/0")
+
+    with pytest.raises(ValueError):
+        create_redis("redis://a:7000,redis://b:7000", cluster=True)
+
+
+SHARD_URLS = os.getenv("REDIS_SHARD_URLS")
+
+
+@pytest.mark.skipif(not SHARD_URLS, reason="REDIS_SHARD_URLS no definido (ej. redis://localhost:6379/0,redis://localhost:6380/0)")
+@pytest.mark.asyncio
+async def test_integracion_memoria_lock_y_rate_limit_sobre_varios_redis():
+    """Ejecutar con varias instancias locales de Redis para validar el reparto real."""
+    client = create_redis(SHARD_URLS)
+    memory = ConversationMemory(redis=client)
+    limiter = RateLimiter(redis=client, max_requests=5, window_seconds=60)
+    lock = SenderLock(redis=client)
+    senders = [f"5299{i:08d}" for i in range(50)]
+    try:
+        for sender in senders:
+            async with lock.hold(sender) as fence:
+                await memory.append_message(sender, "user", "hola", fence=fence)
+            assert (await limiter.check_rate_limit(sender))[0] is True
+        for sender in senders:
+            assert await memory.get_conversation(sender) == [{"role": "user", "content": "hola"}]
+        assert await memory.ping() is True
+    finally:
+        for sender in senders:
+            await memory.clear(sender)
+            await limiter.reset(sender)
+            await client.delete(fence_key(sender), version_key(sender))
+        await client.aclose()
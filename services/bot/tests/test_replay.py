@@ -0,0 +1,199 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.batch import BatchCollector
+from app.llm import BatchResult, ChatCompletion
+from app.replay import _parse_args, build_router, iter_jsonl, iter_turns, load_checkpoint, replay
+from app.router import ModelRouter, ModelTier
+
+CONVERSATION = [
+    {"role": "user", "content": "hola"},
+    {"role": "assistant", "content": "¡Hola! ¿En qué te ayudo?"},
+    {"role": "user", "content": "quiero una cotización de 10 laptops"},
+    {"role": "assistant", "content": "Claro, ¿qué modelo?"},
+]
+
+
+def _router(enabled=False):
+    return ModelRouter(ModelTier("fast", "modelo-rapido", 200), ModelTier("full", "modelo-completo", 800), enabled=enabled)
+
+
+def _llm(**kwargs):
+    client = MagicMock()
+    client.complete = AsyncMock(
+        return_value=ChatCompletion(text="respuesta nueva", model="modelo-completo", prompt_tokens=120, completion_tokens=15),
+        **kwargs,
+    )
+    return client
+
+
+async def _source(*conversations):
+    for conversation_id, messages in conversations:
+        yield conversation_id, messages
+
+
+def _rows(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_iter_turns_ultimo_turno_con_historial_previo():
+    (item,) = iter_turns("5211", CONVERSATION)
+
+    assert item.turn == 2
+    assert item.user_text == "quiero una cotización de 10 laptops"
+    assert item.history == CONVERSATION[:2]
+    assert item.reference == "Claro, ¿qué modelo?"
+
+
+def test_iter_turns_todos_los_turnos_y_ventana_de_historial():
+    items = list(iter_turns("5211", CONVERSATION, turns="all", max_history=1))
+
+    assert [item.turn for item in items] == [0, 2]
+    assert items[0].history == []
+    assert items[1].history == [CONVERSATION[1]]
+
+
+@pytest.mark.asyncio
+async def test_replay_usa_el_mismo_payload_que_el_webhook(tmp_path):
+    llm = _llm()
+    output = tmp_path / "out.jsonl"
+
+    summary = await replay(_source(("5211", CONVERSATION)), llm, output, _router(), system_prompt="Eres un vendedor.")
+
+    messages = llm.complete.await_args.args[0]
+    assert messages[0] == {"role": "system", "content": "Eres un vendedor."}
+    assert messages[1:] == CONVERSATION[:3]
+    assert llm.complete.await_args.kwargs == {
+        "model": "modelo-completo", "max_tokens": 800, "temperature": None, "stop": ()
+    }
+    (row,) = _rows(output)
+    assert row["response"] == "respuesta nueva"
+    assert row["reference"] == "Claro, ¿qué modelo?"
+    assert (row["prompt_tokens"], row["completion_tokens"]) == (120, 15)
+    assert row["latency_ms"] is not None
+    assert summary["calls"] == 1
+    assert summary["prompt_tokens"] == 120
+
+
+@pytest.mark.asyncio
+async def test_replay_con_tiering_envia_small_talk_al_modelo_rapido(tmp_path):
+    llm = _llm()
+    conversation = [{"role": "user", "content": "gracias"}]
+
+    summary = await replay(_source(("5211", conversation)), llm, tmp_path / "out.jsonl", _router(enabled=True))
+
+    assert llm.complete.await_args.kwargs == {
+        "model": "modelo-rapido", "max_tokens": 200, "temperature": None, "stop": ()
+    }
+    assert summary["routing"]["reasons"] == {"fast:small_talk": 1}
+
+
+@pytest.mark.asyncio
+async def test_replay_registra_errores_sin_detenerse(tmp_path):
+    llm = _llm(side_effect=[RuntimeError("timeout"), ChatCompletion("ok", "modelo-completo", 10, 2)])
+    output = tmp_path / "out.jsonl"
+
+    summary = await replay(
+        _source(("a", CONVERSATION), ("b", CONVERSATION)), llm, output, _router(), concurrency=1
+    )
+
+    rows = _rows(output)
+    assert [row["error"] for row in rows] == ["RuntimeError: timeout", None]
+    assert summary["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resume_salta_turnos_completados_y_reintenta_fallidos(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(
+        json.dumps({"conversation_id": "a", "turn": 2, "error": None}) + "\n"
+        + json.dumps({"conversation_id": "b", "turn": 2, "error": "RuntimeError: timeout"}) + "\n"
+        + '{"conversation_id": "c", "tu',  # línea cortada por una interrupción
+        encoding="utf-8",
+    )
+    llm = _llm()
+
+    summary = await replay(
+        _source(("a", CONVERSATION), ("b", CONVERSATION), ("c", CONVERSATION)), llm, output, _router(), resume=True
+    )
+
+    assert summary["skipped"] == 1
+    assert summary["calls"] == 2
+    assert load_checkpoint(output) == {"a#2", "b#2", "c#2"}
+
+
+@pytest.mark.asyncio
+async def test_replay_respeta_el_limite_de_concurrencia(tmp_path):
+    in_flight = peak = 0
+
+    async def complete(messages, model, max_tokens, temperature, stop):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return ChatCompletion("ok", model, 1, 1)
+
+    llm = MagicMock()
+    llm.complete = complete
+    conversations = [(str(i), CONVERSATION) for i in range(20)]
+
+    summary = await replay(_source(*conversations), llm, tmp_path / "out.jsonl", _router(), concurrency=4)
+
+    assert summary["calls"] == 20
+    assert peak == 4
+
+
+@pytest.mark.asyncio
+async def test_iter_jsonl_lee_conversaciones_exportadas(tmp_path):
+    path = tmp_path / "conv.jsonl"
+    path.write_text(json.dumps({"id": "5211", "messages": CONVERSATION}) + "\n\n", encoding="utf-8")
+
+    assert [item async for item in iter_jsonl(path)] == [("5211", CONVERSATION)]
+
+
+@pytest.mark.asyncio
+async def test_replay_en_modo_batch_envia_todo_por_el_colector(tmp_path):
+    llm = _llm()
+    submitted = []
+
+    async def submit_batch(requests):
+        submitted.extend(requests)
+        return "batch-1"
+
+    llm.submit_batch = AsyncMock(side_effect=submit_batch)
+    llm.batch_status = AsyncMock(return_value="completed")
+    llm.batch_results = AsyncMock(side_effect=lambda batch_id: [
+        BatchResult(r.custom_id, completion=ChatCompletion("por lote", r.model, 50, 5)) for r in submitted
+    ])
+    collector = BatchCollector(llm, poll_interval=0)
+    output = tmp_path / "out.jsonl"
+
+    summary = await replay(
+        _source(*[(str(i), CONVERSATION) for i in range(5)]), llm, output, _router(), collector=collector
+    )
+
+    llm.complete.assert_not_awaited()
+    llm.submit_batch.assert_awaited_once()
+    assert {r.model for r in submitted} == {"modelo-completo"}
+    assert summary["calls"] == 5
+    assert summary["errors"] == 0
+    assert {row["response"] for row in _rows(output)} == {"por lote"}
+
+
+def test_tiers_del_replay_usan_la_misma_generacion_que_el_webhook(tmp_path, monkeypatch):
+    """Temperaturas y stop sequences salen de las mismas variables de entorno que usa main.py."""
+    monkeypatch.setenv("FULL_TEMPERATURE", "0.7")
+    monkeypatch.setenv("FAST_TEMPERATURE", "0.1")
+    monkeypatch.setenv("LLM_STOP_SEQUENCES", '["\\n\\n\\n"]')
+    args = _parse_args([
+        "--input", str(tmp_path / "in.jsonl"), "--output", str(tmp_path / "out.jsonl"),
+        "--fast-model", "modelo-rapido", "--generation", str(tmp_path / "sin-overrides.json"),
+    ])
+
+    router = build_router(args, "modelo-completo")
+
+    assert router.full == ModelTier("full", "modelo-completo", 800, 0.7, ("\n\n\n",))
+    assert router.fast == ModelTier("fast", "modelo-rapido", 200, 0.1, ("\n\n\n",))
@@ -0,0 +1,137 @@
+"""
+Tests del clasificador local de tiers de modelo — app/router.py
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from app.router import ModelRouter, ModelTier, load_generation_overrides
+
+FAST = ModelTier("fast", "modelo-rapido", 200)
+FULL = ModelTier("full", "modelo-completo", 800)
+
+
+def _router(**kwargs):
+    return ModelRouter(fast=FAST, full=FULL, **kwargs)
+
+
+def test_saludo_corto_es_tier_rapido():
+    decision = _router().classify("¡Hola! Buenos días", [])
+    assert decision.tier is FAST
+    assert decision.reason == "small_talk"
+
+
+def test_agradecimiento_con_acentos_es_tier_rapido():
+    assert _router().classify("Muchas gracias, perfecto", []).tier is FAST
+
+
+def test_palabra_clave_comercial_es_tier_completo():
+    decision = _router().classify("cotización", [])
+    assert decision.tier is FULL
+    assert decision.reason == "complex_keyword"
+
+
+def test_mensaje_largo_es_tier_completo():
+    text = "necesito ayuda para elegir entre varias opciones para mi oficina nueva"
+    assert _router().classify(text, []).reason == "long_message"
+
+
+def test_mensaje_desconocido_usa_tier_completo_por_defecto():
+    assert _router().classify("quiero comprar laptops", []).tier is FULL
+
+
+def test_afirmacion_a_pregunta_del_asistente_es_tier_completo():
+    history = [
+        {"role": "user", "content": "info de servidores"},
+        {"role": "assistant", "content": "Tenemos 3 modelos. ¿Deseas que te envíe una cotización?"},
+    ]
+    decision = _router().classify("sí, por favor", history)
+    assert decision.tier is FULL
+    assert decision.reason == "answers_assistant_question"
+
+
+def test_ok_sin_pregunta_previa_es_tier_rapido():
+    history = [{"role": "assistant", "content": "Listo, te envié la cotización."}]
+    assert _router().classify("ok", history).tier is FAST
+
+
+def test_tiering_deshabilitado_siempre_es_completo():
+    decision = _router(enabled=False).classify("hola", [])
+    assert decision.tier is FULL
+    assert decision.reason == "tiering_disabled"
+
+
+def test_stats_acumula_decisiones_y_latencia():
+    router = _router()
+    decision = router.route("hola", [])
+    router.record_latency(decision.tier, 0.25)
+    router.route("precio del plan", [])
+
+    stats = router.stats()
+
+    assert stats["tiers"]["fast"]["requests"] == 1
+    assert stats["tiers"]["fast"]["avg_latency_ms"] == 250.0
+    assert stats["tiers"]["full"]["requests"] == 1
+    assert stats["tiers"]["full"]["avg_latency_ms"] is None
+    assert stats["reasons"] == {"fast:small_talk": 1, "full:complex_keyword": 1}
+
+
+def test_downgrade_por_cuota_fuerza_tier_rapido_aun_sin_tiering():
+    router = _router(enabled=False)
+
+    decision = router.route("necesito una cotización de 20 laptops", [], downgrade=True)
+
+    assert decision.tier is FAST
+    assert decision.reason == "quota"
+    assert router.stats()["reasons"] == {"fast:quota": 1}
+
+
+def test_override_por_razon_ajusta_parametros_de_generacion():
+    router = _router(overrides={"small_talk": {"max_tokens": 80, "temperature": 0.5, "stop": ("\n\n",)}})
+
+    small_talk = router.route("gracias", [])
+    quote = router.route("necesito una cotización", [])
+
+    assert (small_talk.tier.model, small_talk.tier.max_tokens) == ("modelo-rapido", 80)
+    assert (small_talk.tier.temperature, small_talk.tier.stop) == (0.5, ("\n\n",))
+    assert quote.tier is FULL
+    router.record_latency(small_talk.tier, 0.1)
+    assert router.stats()["tiers"]["fast"]["requests"] == 1
+
+
+def test_load_generation_overrides_lee_archivo_y_convierte_stop(tmp_path):
+    path = tmp_path / "generation.json"
+    path.write_text(json.dumps({"reasons": {"small_talk": {"max_tokens": 120, "stop": ["FIN"]}}}))
+
+    assert load_generation_overrides(path) == {"small_talk": {"max_tokens": 120, "stop": ("FIN",)}}
+    assert load_generation_overrides(tmp_path / "no-existe.json") == {}
+
+
+def test_load_generation_overrides_rechaza_parametros_desconocidos(tmp_path):
+    path = tmp_path / "generation.json"
+    path.write_text(json.dumps({"reasons": {"default": {"model": "otro"}}}))
+
+    with pytest.raises(ValueError, match="model"):
+        load_generation_overrides(path)
+
+
+def test_load_generation_overrides_rechaza_demasiadas_secuencias_stop(tmp_path):
+    """Los clientes recortarían en silencio las secuencias que pasan del límite."""
+    path = tmp_path / "generation.json"
+    path.write_text(json.dumps({"reasons": {"small_talk": {"stop": ["a", "b", "c", "d", "e"]}}}))
+
+    with pytest.raises(ValueError, match="small_talk.*5 stop sequences"):
+        load_generation_overrides(path)
+
+
+def test_generation_incluido_no_pisa_max_tokens_del_tier_completo():
+    """El archivo incluido deja que FULL_MAX_TOKENS rija los turnos del tier completo."""
+    path = Path(__file__).parent.parent / "prompts" / "generation.json"
+    router = _router(overrides=load_generation_overrides(path))
+
+    decision = router.route("quiero saber más de ustedes", [])
+    answer = router.route("sí", [{"role": "assistant", "content": "¿Te envío la cotización?"}])
+
+    assert (decision.reason, decision.tier) == ("default", FULL)
+    assert (answer.reason, answer.tier) == ("answers_assistant_question", FULL)
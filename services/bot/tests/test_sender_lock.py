@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.sender_lock import LockTimeout, SenderLock
+
+
+@pytest.mark.asyncio
+async def test_hold_entrega_token_y_libera_con_el_mismo_owner():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(side_effect=[7, 1])
+    lock = SenderLock(redis=redis_mock)
+
+    async with lock.hold("521111111111") as token:
+        assert token == 7
+
+    acquire_call, release_call = redis_mock.eval.await_args_list
+    assert acquire_call.args[2:4] == ("lock:{521111111111}", "lockfence:{521111111111}")
+    assert release_call.args[2] == "lock:{521111111111}"
+    # El release solo borra si el valor sigue siendo nuestro owner id
+    assert release_call.args[3] == acquire_call.args[4]
+    assert lock._local == {}
+
+
+@pytest.mark.asyncio
+async def test_hold_reintenta_mientras_el_lock_esta_ocupado():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(side_effect=[0, 0, 3, 1])
+    lock = SenderLock(redis=redis_mock, retry_interval=0.001)
+
+    async with lock.hold("521111111111") as token:
+        assert token == 3
+
+    assert redis_mock.eval.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_hold_lanza_timeout_si_nunca_obtiene_el_lock():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(return_value=0)
+    lock = SenderLock(redis=redis_mock, acquire_timeout=0.05, retry_interval=0.01)
+
+    with pytest.raises(LockTimeout):
+        async with lock.hold("521111111111"):
+            pass
+
+    assert lock._local == {}
+
+
+@pytest.mark.asyncio
+async def test_mismo_remitente_se_serializa_en_la_replica():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(return_value=1)
+    lock = SenderLock(redis=redis_mock)
+    active = []
+    overlaps = []
+
+    async def turn():
+        async with lock.hold("521111111111"):
+            overlaps.append(len(active))
+            active.append(1)
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    await asyncio.gather(turn(), turn(), turn())
+
+    assert overlaps == [0, 0, 0]
+
+
+@pytest.mark.asyncio
+async def test_remitentes_distintos_corren_en_paralelo():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(return_value=1)
+    lock = SenderLock(redis=redis_mock)
+    active = []
+    peak = []
+
+    async def turn(sender):
+        async with lock.hold(sender):
+            active.append(sender)
+            await asyncio.sleep(0.01)
+            peak.append(len(active))
+            active.remove(sender)
+
+    await asyncio.gather(turn("a"), turn("b"), turn("c"))
+
+    assert max(peak) == 3
+
+
+@pytest.mark.asyncio
+async def test_error_en_release_no_oculta_el_resultado():
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(side_effect=[1, RuntimeError("redis down")])
+    lock = SenderLock(redis=redis_mock)
+
+    async with lock.hold("521111111111") as token:
+        assert token == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_caido_serializa_solo_con_el_lock_local():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from app.fallback import RedisHealth
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(side_effect=RedisConnectionError("connection refused"))
+    health = RedisHealth(redis_mock)
+    lock = SenderLock(redis=redis_mock, health=health)
+    order = []
+
+    async def turn(name):
+        async with lock.hold("521111111111") as token:
+            order.append((name, token))
+            await asyncio.sleep(0.01)
+            order.append((name, "fin"))
+
+    await asyncio.gather(turn("a"), turn("b"))
+
+    assert order == [("a", None), ("a", "fin"), ("b", None), ("b", "fin")]
+    assert not health.available
+    # Sin token no hay release en Redis; el segundo turno ni siquiera lo intenta
+    assert redis_mock.eval.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_sin_monitor_el_error_de_conexion_se_propaga():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    redis_mock = MagicMock()
+    redis_mock.eval = AsyncMock(side_effect=RedisConnectionError("connection refused"))
+    lock = SenderLock(redis=redis_mock)
+
+    with pytest.raises(RedisConnectionError):
+        async with lock.hold("521111111111"):
+            pass
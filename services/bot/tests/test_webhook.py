@@ -1,8 +1,10 @@
 """
 Tests del endpoint GET /webhook/whatsapp — verificación de Meta.
 """
+import json
+
 import pytest
-from tests.conftest import META_PAYLOAD
+from tests.conftest import META_PAYLOAD, META_STATUS_PAYLOAD
 
 
 class TestWebhookVerification:
@@ -65,7 +67,7 @@ class TestWebhookMensajeEntrante:
             json={"from": "521111111111", "text": "hola"},
             headers={"x-bot-secret": "test-secret"}
         )
-        llm_client.chat.assert_awaited_once()
+        llm_client.complete.assert_awaited_once()
 
     def test_mensaje_interno_envia_por_whatsapp(self, app_client, mocker):
         """Verifica que se intenta enviar la respuesta por WhatsApp."""
@@ -108,6 +110,142 @@ class TestWebhookMensajeEntrante:
         assert r.status_code == 200
         assert r.json()["delivered"] is True
 
+    def test_texto_largo_se_recorta_antes_de_memoria_y_llm(self, app_client, mocker):
+        """Un texto pegado enorme llega recortado a MAX_INPUT_CHARS."""
+        from app.main import memory
+        mocker.patch("app.main.MAX_INPUT_CHARS", 50)
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "cotización " * 10_000},
+            headers={"x-bot-secret": "test-secret"}
+        )
+        stored = memory.append_message.await_args_list[0].args[2]
+        assert len(stored) <= 50
+        assert stored.startswith("cotización")
+
+    def test_x_request_id_se_propaga_y_se_devuelve(self, app_client):
+        """El id de n8n llega a los logs del turno (contexto) y vuelve en la respuesta."""
+        from app.logs import correlation_id
+        from app.main import llm_client
+        seen = []
+        completion = llm_client.complete.return_value
+        llm_client.complete.side_effect = lambda *a, **k: seen.append(correlation_id.get()) or completion
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret", "x-request-id": "n8n-exec-42"}
+        )
+
+        assert r.headers["x-request-id"] == "n8n-exec-42"
+        assert seen == ["n8n-exec-42"]
+
+
+class TestMetaDirecto:
+
+    @pytest.fixture()
+    def direct(self, mocker):
+        mocker.patch("app.main.META_APP_SECRET", "app-secret")
+
+    @staticmethod
+    def _post(app_client, payload, secret="app-secret"):
+        from app.meta_webhook import sign
+        raw = json.dumps(payload).encode()
+        return app_client.post(
+            "/webhook/whatsapp",
+            content=raw,
+            headers={"Content-Type": "application/json", "X-Hub-Signature-256": sign(secret, raw)},
+        )
+
+    def test_payload_firmado_se_acepta_sin_bot_secret(self, app_client, direct):
+        """Con META_APP_SECRET, Meta entra directo con su firma aunque el modo interno esté activo."""
+        from app.main import llm_client, whatsapp_client
+
+        r = self._post(app_client, META_PAYLOAD)
+
+        assert r.status_code == 200
+        assert r.json() == {"delivered": False, "detail": "accepted 1 message(s)"}
+        llm_client.complete.assert_awaited_once()
+        whatsapp_client.send_text_message.assert_awaited_once_with("5215627698201", "Respuesta de prueba del bot.")
+
+    def test_firma_invalida_devuelve_401(self, app_client, direct):
+        from app.main import llm_client
+
+        r = self._post(app_client, META_PAYLOAD, secret="otro-secret")
+
+        assert r.status_code == 401
+        llm_client.complete.assert_not_awaited()
+
+    def test_sin_meta_app_secret_la_firma_no_autentica(self, app_client):
+        """Sin META_APP_SECRET configurado se exige x-bot-secret como antes."""
+        assert self._post(app_client, META_PAYLOAD).status_code == 401
+
+    def test_varios_mensajes_se_procesan_en_orden_por_remitente(self, app_client, direct):
+        from app.main import memory
+        payload = {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {"messages": [
+            {"id": "wamid.1", "from": "5211", "type": "text", "text": {"body": "primero"}},
+            {"id": "wamid.2", "from": "5222", "type": "text", "text": {"body": "otro remitente"}},
+            {"id": "wamid.3", "from": "5211", "type": "text", "text": {"body": "segundo"}},
+        ]}}]}]}
+
+        r = self._post(app_client, payload)
+
+        assert r.json()["detail"] == "accepted 3 message(s)"
+        user_turns = [c.args[:3] for c in memory.append_message.await_args_list if c.args[1] == "user"]
+        assert [t for t in user_turns if t[0] == "5211"] == [("5211", "user", "primero"), ("5211", "user", "segundo")]
+        assert ("5222", "user", "otro remitente") in user_turns
+
+    def test_cada_mensaje_tiene_su_correlation_id(self, app_client, direct):
+        from app.logs import correlation_id
+        from app.main import llm_client
+        seen = []
+        completion = llm_client.complete.return_value
+        llm_client.complete.side_effect = lambda *a, **k: seen.append(correlation_id.get()) or completion
+        payload = {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {"messages": [
+            {"id": "wamid.AAAA1111", "from": "5211", "type": "text", "text": {"body": "primero"}},
+            {"id": "wamid.BBBB2222", "from": "5222", "type": "text", "text": {"body": "segundo"}},
+        ]}}]}]}
+
+        r = self._post(app_client, payload)
+
+        delivery = r.headers["x-request-id"]
+        assert sorted(seen) == [f"{delivery}.AAAA1111", f"{delivery}.BBBB2222"]
+
+    def test_status_se_cuenta_sin_llamar_al_llm(self, app_client, direct):
+        from app.main import llm_client
+
+        r = self._post(app_client, META_STATUS_PAYLOAD)
+        stats = app_client.get("/stats", headers={"x-bot-secret": "test-secret"}).json()
+
+        assert r.json() == {"delivered": False, "detail": "not a message event"}
+        llm_client.complete.assert_not_awaited()
+        assert stats["webhook"]["status:delivered"] >= 1
+
+    def test_reentrega_del_mismo_mensaje_se_ignora(self, app_client, direct, mocker):
+        """Meta reenvía un wamid si no recibió el 200 a tiempo: solo se responde una vez."""
+        from app.main import llm_client
+        from app.meta_webhook import MessageDeduplicator
+        from unittest.mock import AsyncMock, MagicMock
+        redis = MagicMock()
+        redis.set = AsyncMock(side_effect=[True, None])
+        mocker.patch("app.main.meta_dedup", MessageDeduplicator(redis))
+        payload = json.loads(json.dumps(META_PAYLOAD))
+        payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"] = "wamid.repetido"
+
+        self._post(app_client, payload)
+        r = self._post(app_client, payload)
+
+        assert r.json() == {"delivered": False, "detail": "not a message event"}
+        llm_client.complete.assert_awaited_once()
+
+    def test_payload_meta_reenviado_con_bot_secret_devuelve_resultado(self, app_client, mocker):
+        """Con ALLOW_DIRECT_META_WEBHOOK, un payload de Meta con x-bot-secret se procesa en línea."""
+        mocker.patch("app.main.ALLOW_DIRECT_META_WEBHOOK", True)
+
+        r = app_client.post("/webhook/whatsapp", json=META_PAYLOAD, headers={"x-bot-secret": "test-secret"})
+
+        assert r.json() == {"delivered": True, "detail": None}
+
 
 class TestRateLimiting:
 
@@ -140,7 +278,620 @@ class TestRateLimiting:
 
         assert r.status_code == 200
         assert r.json()["delivered"] is False
-        llm_client.chat.assert_not_awaited()
+        llm_client.complete.assert_not_awaited()
+
+
+class TestSenderSerialization:
+
+    def test_turno_se_procesa_con_lock_del_remitente(self, app_client):
+        """El turno corre dentro del lock del remitente y escribe con su token de fencing."""
+        from app.main import sender_lock, memory
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        sender_lock.hold.assert_called_once_with("521111111111")
+        for call in memory.append_message.await_args_list:
+            assert call.kwargs["fence"] == 1
+
+    def test_timeout_del_lock_no_llama_llm(self, app_client):
+        """Si el lock del remitente no se obtiene a tiempo, no se procesa el turno."""
+        from app.main import sender_lock, llm_client
+        from app.sender_lock import LockTimeout
+        from unittest.mock import AsyncMock
+        sender_lock.hold.return_value.__aenter__ = AsyncMock(side_effect=LockTimeout("busy"))
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json() == {"delivered": False, "detail": "sender busy"}
+        llm_client.complete.assert_not_awaited()
+
+
+class TestLoadShedding:
+
+    def test_sobrecarga_responde_ocupados_sin_llamar_llm(self, app_client):
+        """Si no hay slot disponible se envía "estamos ocupados" y no se llama al LLM."""
+        from app.main import concurrency_limiter, llm_client, whatsapp_client
+        from unittest.mock import AsyncMock
+        concurrency_limiter.acquire = AsyncMock(return_value=False)
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json() == {"delivered": False, "detail": "server busy"}
+        llm_client.complete.assert_not_awaited()
+        assert "ocupados" in whatsapp_client.send_text_message.await_args.args[1]
+
+    def test_conversacion_en_curso_pide_slot_prioritario(self, app_client):
+        """Remitentes con historial previo entran con prioridad."""
+        from app.main import concurrency_limiter, memory
+        from unittest.mock import AsyncMock
+        memory.get_conversation = AsyncMock(return_value=[{"role": "user", "content": "hola"}])
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "precio?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        concurrency_limiter.acquire.assert_awaited_once_with(priority=True)
+
+    def test_slot_se_libera_con_latencia_del_llm(self, app_client):
+        """El slot se devuelve con la latencia medida del LLM."""
+        from app.main import concurrency_limiter
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        concurrency_limiter.release.assert_called_once()
+        latency = concurrency_limiter.release.call_args.args[0]
+        assert latency is not None and latency >= 0
+        assert concurrency_limiter.release.call_args.kwargs["success"] is True
+
+    def test_error_del_llm_libera_slot_como_fallo(self, app_client):
+        """Un error del LLM devuelve el slot marcándolo como congestión."""
+        from app.main import concurrency_limiter, llm_client
+        from unittest.mock import AsyncMock
+        llm_client.complete = AsyncMock(side_effect=RuntimeError("timeout"))
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        concurrency_limiter.release.assert_called_once_with(None, success=False)
+
+
+class TestQuota:
+
+    def test_cuota_agotada_avisa_sin_llamar_llm(self, app_client):
+        """Sobre el presupuesto diario se avisa al usuario y no se gasta LLM ni slot."""
+        from app.main import quota, llm_client, whatsapp_client, concurrency_limiter, QUOTA_MESSAGE
+        from app.quota import QuotaDecision
+        from unittest.mock import AsyncMock
+        quota.check = AsyncMock(return_value=QuotaDecision("reject", 50_000, 0.4))
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "necesito una cotización"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json() == {"delivered": False, "detail": "quota exceeded"}
+        llm_client.complete.assert_not_awaited()
+        concurrency_limiter.acquire.assert_not_awaited()
+        whatsapp_client.send_text_message.assert_awaited_once_with("521111111111", QUOTA_MESSAGE)
+
+    def test_cerca_de_la_cuota_usa_el_modelo_rapido(self, app_client):
+        """Cerca del presupuesto una pregunta comercial se degrada al tier rápido."""
+        from app.main import quota, llm_client
+        from app.quota import QuotaDecision
+        from unittest.mock import AsyncMock
+        quota.check = AsyncMock(return_value=QuotaDecision("downgrade", 8_500, 0.1))
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "necesito una cotización de 20 laptops"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert llm_client.complete.await_args.kwargs["model"] == "gemini-2.0-flash-lite"
+
+    def test_uso_del_llm_se_registra(self, app_client):
+        """Los tokens reportados por el proveedor se suman a la cuota del remitente."""
+        from app.main import quota
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "necesito una cotización"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        quota.record.assert_awaited_once_with("521111111111", "gemini-2.0-flash", 120, 12)
+
+    def test_respuesta_predefinida_no_consume_cuota(self, app_client, mocker):
+        """Los intents se responden sin consultar ni registrar cuota."""
+        from app.main import quota, INTENTS_PATH
+        from app.intents import IntentMatcher
+        mocker.patch("app.main.intent_matcher", IntentMatcher.from_file(INTENTS_PATH))
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        quota.check.assert_not_awaited()
+        quota.record.assert_not_awaited()
+
+    def test_stats_incluye_gasto_por_modelo(self, app_client):
+        """/stats expone el gasto agregado por modelo."""
+        r = app_client.get("/stats", headers={"x-bot-secret": "test-secret"})
+
+        assert r.json()["spend"]["models"] == {}
+
+
+
+class TestCoalescing:
+
+    def test_respuesta_compartida_no_se_cobra_al_remitente(self, app_client, mocker):
+        """Si la respuesta vino de una llamada idéntica en vuelo, no se suma a la cuota."""
+        from app.main import quota, whatsapp_client
+        from app.llm import ChatCompletion
+        from unittest.mock import AsyncMock, MagicMock
+        flight = MagicMock()
+        flight.run = AsyncMock(return_value=(ChatCompletion("Promo compartida", "gemini-2.0-flash", 120, 12), True))
+        mocker.patch("app.main.single_flight", flight)
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "QUIERO LA PROMO"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json()["delivered"] is True
+        quota.record.assert_not_awaited()
+        whatsapp_client.send_text_message.assert_awaited_once_with("521111111111", "Promo compartida")
+
+    def test_stats_incluye_coalescing(self, app_client):
+        """/stats expone llamadas hechas y compartidas."""
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "QUIERO LA PROMO"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+        r = app_client.get("/stats", headers={"x-bot-secret": "test-secret"})
+
+        assert r.json()["coalescing"]["upstream_calls"] == 1
+
+
+class TestGeneration:
+
+    def test_respuesta_cortada_por_max_tokens_termina_en_oracion_completa(self, app_client):
+        """Si el modelo agotó max_tokens, se descarta la oración inconclusa antes de enviar y guardar."""
+        from app.main import llm_client, memory, whatsapp_client
+        from app.llm import ChatCompletion
+        llm_client.complete.return_value = ChatCompletion(
+            "Tenemos tres planes disponibles. El plan básico incluye soporte y el plan", "gemini-2.0-flash",
+            120, 40, finish_reason="length",
+        )
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¿Qué planes tienen?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        whatsapp_client.send_text_message.assert_awaited_once_with("521111111111", "Tenemos tres planes disponibles.")
+        memory.append_message.assert_any_await(
+            "521111111111", "assistant", "Tenemos tres planes disponibles.", fence=1
+        )
+
+    def test_respuesta_completa_no_se_recorta(self, app_client):
+        """Con finish_reason=stop el texto se envía tal cual."""
+        from app.main import llm_client, whatsapp_client
+        from app.llm import ChatCompletion
+        llm_client.complete.return_value = ChatCompletion(
+            "Claro, te comparto la lista de precios", "gemini-2.0-flash", 120, 9, finish_reason="stop"
+        )
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¿Qué planes tienen?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        whatsapp_client.send_text_message.assert_awaited_once_with(
+            "521111111111", "Claro, te comparto la lista de precios"
+        )
+
+class TestModelTiering:
+
+    def test_saludo_va_al_modelo_rapido(self, app_client):
+        """Un saludo corto se envía al tier rápido con su max_tokens."""
+        from app.main import llm_client
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola, buenas tardes"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        kwargs = llm_client.complete.await_args.kwargs
+        assert kwargs == {"model": "gemini-2.0-flash-lite", "max_tokens": 200, "temperature": None, "stop": ()}
+
+    def test_pregunta_comercial_va_al_modelo_completo(self, app_client):
+        """Una consulta de precios usa el modelo completo."""
+        from app.main import llm_client
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¿Cuál es el precio del plan empresarial?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        kwargs = llm_client.complete.await_args.kwargs
+        assert kwargs == {"model": "gemini-2.0-flash", "max_tokens": 800, "temperature": None, "stop": ()}
+
+    def test_stats_cuenta_decisiones_de_ruteo(self, app_client):
+        """/stats expone las decisiones contadas por tier."""
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "gracias"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        r = app_client.get("/stats", headers={"x-bot-secret": "test-secret"})
+
+        assert r.status_code == 200
+        routing = r.json()["routing"]
+        assert routing["tiers"]["fast"]["requests"] == 1
+        assert routing["reasons"] == {"fast:small_talk": 1}
+        assert r.json()["concurrency"]["limit"] == 16
+
+    def test_stats_requiere_secret(self, app_client):
+        """/stats no es público."""
+        r = app_client.get("/stats", headers={"x-bot-secret": "otro"})
+        assert r.status_code == 401
+
+
+class TestDiagnostico:
+
+    @pytest.fixture()
+    def recorder(self, mocker):
+        from app.profiling import SlowRequestRecorder
+        recorder = SlowRequestRecorder(threshold_ms=0.0001)
+        mocker.patch("app.main.slow_requests", recorder)
+        return recorder
+
+    def test_request_lenta_queda_con_desglose_por_etapa(self, app_client, recorder):
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¿Cuál es el precio del plan empresarial?"},
+            headers={"x-bot-secret": "test-secret", "x-request-id": "n8n-exec-7"}
+        )
+
+        slow = app_client.get("/admin/slow-requests", headers={"x-bot-secret": "test-secret"}).json()
+        [record] = slow["requests"]
+        assert record["correlation_id"] == "n8n-exec-7"
+        assert record["name"] == "whatsapp_webhook"
+        assert {"auth", "parse", "rate_limit", "sender_lock", "history", "llm", "whatsapp_send"} <= set(record["stages"])
+        assert r.json()["delivered"] is True
+
+    def test_mensaje_meta_en_segundo_plano_se_registra_aparte(self, app_client, recorder, mocker):
+        from app.meta_webhook import sign
+        mocker.patch("app.main.META_APP_SECRET", "app-secret")
+        raw = json.dumps(META_PAYLOAD).encode()
+
+        app_client.post(
+            "/webhook/whatsapp",
+            content=raw,
+            headers={"Content-Type": "application/json", "X-Hub-Signature-256": sign("app-secret", raw)},
+        )
+
+        names = [record["name"] for record in recorder.recent()]
+        assert names == ["meta_message", "whatsapp_webhook"]
+        assert "llm" in recorder.recent()[0]["stages"]
+
+    def test_profile_devuelve_stacks_colapsados(self, app_client):
+        r = app_client.post("/admin/profile", params={"seconds": 0.05}, headers={"x-bot-secret": "test-secret"})
+
+        assert r.status_code == 200
+        assert int(r.headers["x-profile-samples"]) > 0
+        assert r.headers["content-type"].startswith("text/plain")
+
+    def test_profile_limita_la_duracion(self, app_client):
+        from app.main import PROFILE_MAX_SECONDS
+        r = app_client.post(
+            "/admin/profile", params={"seconds": PROFILE_MAX_SECONDS + 1}, headers={"x-bot-secret": "test-secret"}
+        )
+        assert r.status_code == 422
+
+    @pytest.mark.parametrize("method, path", [("post", "/admin/profile"), ("get", "/admin/slow-requests")])
+    def test_endpoints_de_diagnostico_requieren_secret(self, app_client, method, path):
+        r = getattr(app_client, method)(path, headers={"x-bot-secret": "otro"})
+        assert r.status_code == 401
+
+
+class TestRedisCaido:
+
+    @pytest.fixture()
+    def redis_down(self, mocker):
+        """Memoria, rate limit y lock reales sobre un Redis que rechaza conexiones."""
+        from unittest.mock import AsyncMock, MagicMock
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        from app.fallback import RedisHealth
+        from app.memory import ConversationMemory
+        from app.rate_limiter import RateLimiter
+        from app.sender_lock import SenderLock
+        redis = MagicMock()
+        for command in ("get", "mget", "eval", "incr", "zadd"):
+            setattr(redis, command, AsyncMock(side_effect=RedisConnectionError("connection refused")))
+        health = RedisHealth(redis)
+        memory = ConversationMemory(redis=redis, health=health)
+        mocker.patch("app.main.redis_health", health)
+        mocker.patch("app.main.memory", memory)
+        mocker.patch("app.main.rate_limiter", RateLimiter(redis=redis, health=health))
+        mocker.patch("app.main.sender_lock", SenderLock(redis=redis, health=health))
+        return redis, health, memory
+
+    def test_el_bot_sigue_respondiendo_con_historial_local(self, app_client, redis_down):
+        from app.main import llm_client, whatsapp_client
+        _, health, memory = redis_down
+
+        for text in ("Hola, quiero cotizar", "¿Y el envío?"):
+            r = app_client.post(
+                "/webhook/whatsapp",
+                json={"from": "521111111111", "text": text},
+                headers={"x-bot-secret": "test-secret"}
+            )
+            assert r.json()["delivered"] is True
+
+        assert not health.available
+        assert whatsapp_client.send_text_message.await_count == 2
+        # El segundo turno ve el primero, guardado localmente
+        second_prompt = llm_client.complete.await_args.args[0]
+        assert {"role": "user", "content": "Hola, quiero cotizar"} in second_prompt
+        assert memory.pending_write_back() == ["521111111111"]
+        health_check = app_client.get("/health").json()
+        assert health_check["checks"]["redis_fallback"] == "active"
+
+    @pytest.mark.asyncio
+    async def test_al_recuperarse_redis_se_reescriben_los_turnos(self, redis_down):
+        from unittest.mock import AsyncMock
+        import app.main as main
+        redis, health, memory = redis_down
+        await memory.append_message("521111111111", "user", "durante la caída")
+
+        redis.ping = AsyncMock(return_value=True)
+        redis.get = AsyncMock(return_value=None)
+        redis.eval = AsyncMock(side_effect=[7, 1, 1])  # lock (fence 7), escritura, release
+        health.on_recovery(main._write_back_fallback)
+        await health.check()
+        await health.wait_recovered()
+
+        acquire, write, release = redis.eval.await_args_list
+        assert write.args[5] == 7
+        assert json.loads(write.args[6]) == [{"role": "user", "content": "durante la caída"}]
+        assert memory.pending_write_back() == []
+
+    def test_write_back_fallido_se_reintenta_en_el_siguiente_turno(self, app_client, redis_down):
+        """Si la reescritura falló al recuperarse Redis, el siguiente turno del remitente la reintenta."""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        import app.main as main
+        redis, health, memory = redis_down
+        asyncio.run(memory.append_message("521111111111", "user", "durante la caída"))
+
+        redis.ping = AsyncMock(return_value=True)
+        redis.get = AsyncMock(return_value=None)
+        redis.zadd = AsyncMock()
+        redis.incr = AsyncMock(return_value=1)
+        redis.expire = AsyncMock()
+        asyncio.run(health.check())
+        # lock (fence 7), escritura fallida, release
+        redis.eval = AsyncMock(side_effect=[7, RedisConnectionError("failover"), 1])
+        asyncio.run(main._write_back_fallback())
+        assert memory.pending_write_back() == ["521111111111"]
+
+        # lock (fence 8), write-back, mensaje del usuario, respuesta, release
+        redis.eval = AsyncMock(side_effect=[8, 1, 2, 3, 1])
+        redis.mget = AsyncMock(side_effect=lambda *keys: [
+            json.dumps([{"role": "user", "content": "durante la caída"}]).encode(), b"1"
+        ])
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¿Sigues ahí?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json()["delivered"] is True
+        assert memory.pending_write_back() == []
+        write_back = redis.eval.await_args_list[1]
+        assert write_back.args[5] == 8
+        assert json.loads(write_back.args[6]) == [{"role": "user", "content": "durante la caída"}]
+
+
+class TestCannedReplies:
+
+    @pytest.fixture()
+    def intents(self, mocker):
+        from app.intents import IntentMatcher
+        from app.main import INTENTS_PATH
+        matcher = IntentMatcher.from_file(INTENTS_PATH)
+        mocker.patch("app.main.intent_matcher", matcher)
+        return matcher
+
+    def test_saludo_se_responde_sin_llm(self, app_client, intents):
+        """Un "hola" se responde desde la plantilla y no llega al LLM."""
+        from app.main import llm_client, whatsapp_client, memory, concurrency_limiter
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "¡Hola!"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json()["delivered"] is True
+        llm_client.complete.assert_not_awaited()
+        concurrency_limiter.acquire.assert_not_awaited()
+        reply = whatsapp_client.send_text_message.await_args.args[1]
+        assert reply.startswith("¡Hola!")
+        roles = [call.args[1] for call in memory.append_message.await_args_list]
+        assert roles == ["user", "assistant"]
+        assert memory.append_message.await_args_list[1].args[2] == reply
+
+    def test_saludo_con_pregunta_va_al_llm(self, app_client, intents):
+        """Si el mensaje trae más que el intent, se usa el LLM."""
+        from app.main import llm_client
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "hola, quiero una cotización"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        llm_client.complete.assert_awaited_once()
+
+    def test_ok_tras_pregunta_del_asistente_va_al_llm(self, app_client, intents):
+        """ "ok" como respuesta a una pregunta del bot no recibe plantilla."""
+        from app.main import llm_client, memory
+        from unittest.mock import AsyncMock
+        memory.get_conversation = AsyncMock(return_value=[
+            {"role": "assistant", "content": "¿Deseas que te envíe una cotización?"}
+        ])
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "text": "ok"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        llm_client.complete.assert_awaited_once()
+
+
+class TestMediaMessages:
+
+    def test_nota_de_voz_se_transcribe_y_llega_al_llm(self, app_client):
+        """Un audio reenviado por n8n se transcribe y el texto se usa como turno."""
+        from app.main import media_processor, llm_client, memory
+        from app.media import MediaContent
+        media_processor.process.return_value = MediaContent(
+            text="[Nota de voz] necesito precios", llm_content="[Nota de voz] necesito precios"
+        )
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "audio", "media_id": "media-1", "mime_type": "audio/ogg"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json()["delivered"] is True
+        media_input = media_processor.process.await_args.args[0]
+        assert (media_input.type, media_input.media_id) == ("audio", "media-1")
+        messages = llm_client.complete.await_args.args[0]
+        assert messages[-1] == {"role": "user", "content": "[Nota de voz] necesito precios"}
+        assert memory.append_message.await_args_list[0].args[2] == "[Nota de voz] necesito precios"
+
+    def test_imagen_envia_partes_al_llm_y_texto_a_memoria(self, app_client):
+        """Las imágenes van como partes multimodales al LLM; en memoria queda solo el texto."""
+        from app.main import media_processor, llm_client, memory
+        from app.media import MediaContent
+        parts = [{"type": "text", "text": "¿tienen este?"}, {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AA=="}}]
+        media_processor.process.return_value = MediaContent(text="[Imagen] ¿tienen este?", llm_content=parts)
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "image", "media_id": "media-2", "caption": "¿tienen este?"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert llm_client.complete.await_args.args[0][-1]["content"] == parts
+        assert memory.append_message.await_args_list[0].args[2] == "[Imagen] ¿tienen este?"
+
+    def test_error_de_media_avisa_al_usuario(self, app_client):
+        """Si la media no se puede procesar se avisa al usuario y no se llama al LLM."""
+        from app.main import media_processor, llm_client, whatsapp_client
+        from app.media import MediaError
+        media_processor.process.side_effect = MediaError("too large")
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "audio", "media_id": "media-1"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json() == {"delivered": False, "detail": "media processing failed"}
+        llm_client.complete.assert_not_awaited()
+        whatsapp_client.send_text_message.assert_awaited_once()
+
+    def test_nota_de_voz_sin_transcriptor_avisa_que_no_se_soporta(self, app_client):
+        """Sin TRANSCRIBER configurado el usuario recibe un aviso específico para notas de voz."""
+        from app.main import media_processor, llm_client, whatsapp_client, VOICE_UNSUPPORTED_MESSAGE
+        from app.media import MediaUnsupported
+        media_processor.process.side_effect = MediaUnsupported("voice notes are disabled")
+
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "audio", "media_id": "media-1"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert r.json() == {"delivered": False, "detail": "media processing failed"}
+        llm_client.complete.assert_not_awaited()
+        whatsapp_client.send_text_message.assert_awaited_once_with("521111111111", VOICE_UNSUPPORTED_MESSAGE)
+
+    def test_media_se_procesa_antes_de_tomar_el_lock(self, app_client):
+        """La descarga y transcripción no corren dentro del lease del lock del remitente."""
+        from app.main import media_processor, sender_lock
+        from app.media import MediaContent
+        order = []
+        sender_lock.hold.side_effect = lambda sender: order.append("lock") or sender_lock.hold.return_value
+
+        async def process(media):
+            order.append("media")
+            return MediaContent(text="[Nota de voz] hola", llm_content="[Nota de voz] hola")
+        media_processor.process.side_effect = process
+
+        app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "audio", "media_id": "media-1"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+
+        assert order == ["media", "lock"]
+
+    def test_tipo_no_soportado_se_ignora(self, app_client):
+        """Tipos sin pipeline (p. ej. ubicación) se ignoran sin error."""
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "location"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+        assert r.json() == {"delivered": False, "detail": "unsupported type: location"}
+
+    def test_media_sin_media_id_es_invalido(self, app_client):
+        r = app_client.post(
+            "/webhook/whatsapp",
+            json={"from": "521111111111", "type": "audio"},
+            headers={"x-bot-secret": "test-secret"}
+        )
+        assert r.status_code == 422
 
 
 class TestErrorSanitization:
@@ -149,7 +900,7 @@ class TestErrorSanitization:
         """Errores de procesamiento no deben filtrar detalles sensibles al cliente."""
         from app.main import llm_client
         from unittest.mock import AsyncMock
-        llm_client.chat = AsyncMock(side_effect=RuntimeError("openai key sk-test filtrada"))
+        llm_client.complete = AsyncMock(side_effect=RuntimeError("openai key sk-test filtrada"))
 
         r = app_client.post(
             "/webhook/whatsapp",
@@ -161,10 +912,31 @@ class TestErrorSanitization:
         assert r.json()["detail"] == "processing failed"
 
 
+@pytest.fixture()
+def probe(mocker):
+    """Chequeos reales de main sobre un probe nuevo, sin ejecutar todavía."""
+    import app.main as main
+    from app.probes import DependencyProbe
+    probe = DependencyProbe(timeout=0.05)
+    probe.add("redis", main._check_redis)
+    probe.add("llm", main._check_llm, required=False)
+    probe.add("whatsapp", main._check_whatsapp)
+    mocker.patch("app.main.dependency_probe", probe)
+    mocker.patch("app.main.redis_health", None)
+    return probe
+
+
+def _run_checks(probe):
+    import asyncio
+    for name in ("redis", "llm", "whatsapp"):
+        asyncio.run(probe.run(name))
+
+
 class TestHealth:
 
-    def test_health_ok(self, app_client):
+    def test_health_ok(self, app_client, probe):
         """Health endpoint devuelve status ok cuando Redis funciona."""
+        _run_checks(probe)
         r = app_client.get("/health")
         assert r.status_code == 200
         data = r.json()
@@ -172,13 +944,171 @@ class TestHealth:
         assert data["checks"]["redis"] == "ok"
         assert data["checks"]["whatsapp_credentials"] == "ok"
 
-    def test_health_degraded_sin_redis(self, app_client, mocker):
+    def test_health_degraded_sin_redis(self, app_client, probe):
         """Health devuelve degraded cuando Redis no responde."""
         from app.main import memory
         from unittest.mock import AsyncMock
         memory.ping = AsyncMock(return_value=False)
+        _run_checks(probe)
 
         r = app_client.get("/health")
         assert r.status_code == 200
         assert r.json()["status"] == "degraded"
         assert r.json()["checks"]["redis"] == "failed"
+
+    def test_health_usa_el_resultado_cacheado(self, app_client, probe):
+        """Health no hace PING por request: sirve el último chequeo en segundo plano."""
+        from app.main import memory
+        assert app_client.get("/health").json()["checks"]["redis"] == "pending"
+        _run_checks(probe)
+
+        for _ in range(3):
+            r = app_client.get("/health")
+
+        assert r.json()["checks"]["redis"] == "ok"
+        assert memory.ping.await_count == 1
+
+
+class TestProbes:
+
+    def test_livez_no_toca_dependencias(self, app_client):
+        from app.main import memory
+        r = app_client.get("/livez")
+        assert r.status_code == 200
+        assert r.json() == {"status": "ok"}
+        memory.ping.assert_not_awaited()
+
+    def test_readyz_no_listo_hasta_el_primer_chequeo(self, app_client, probe):
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["reasons"] == ["redis", "whatsapp"]
+
+    def test_readyz_sirve_resultados_cacheados(self, app_client, probe):
+        from app.main import llm_client, memory, whatsapp_client
+        _run_checks(probe)
+
+        for _ in range(3):
+            r = app_client.get("/readyz")
+
+        assert r.status_code == 200
+        data = r.json()
+        assert data["status"] == "ready"
+        assert {name: check["status"] for name, check in data["checks"].items()} == {
+            "redis": "ok", "llm": "ok", "whatsapp": "ok",
+        }
+        assert data["load"]["queue_depth"] == 0
+        # Un solo chequeo por dependencia, no uno por request
+        assert memory.ping.await_count == 1
+        llm_client.list_models.assert_awaited_once()
+        whatsapp_client.check_credentials.assert_awaited_once()
+
+    def test_readyz_falla_con_credenciales_de_whatsapp_invalidas(self, app_client, probe):
+        from unittest.mock import AsyncMock
+        from app.main import whatsapp_client
+        whatsapp_client.check_credentials = AsyncMock(side_effect=RuntimeError("token expirado"))
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["reasons"] == ["whatsapp"]
+
+    def test_llm_caido_se_reporta_sin_sacar_de_rotacion(self, app_client, probe):
+        from unittest.mock import AsyncMock
+        from app.main import llm_client
+        llm_client.list_models = AsyncMock(side_effect=ConnectionError())
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 200
+        assert r.json()["checks"]["llm"]["status"] == "failed"
+
+    def test_redis_caido_con_fallback_queda_degradado_y_listo(self, app_client, probe, mocker):
+        from unittest.mock import MagicMock
+        from app.main import memory
+        memory.ping.return_value = False
+        mocker.patch("app.main.redis_health", MagicMock())
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 200
+        assert r.json()["checks"]["redis"]["status"] == "degraded"
+
+    def test_redis_caido_sin_fallback_saca_de_rotacion(self, app_client, probe):
+        from app.main import memory
+        memory.ping.return_value = False
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["reasons"] == ["redis"]
+
+    def test_redis_colgado_no_cuelga_el_chequeo(self, app_client, probe):
+        import asyncio
+        from app.main import memory
+
+        async def hung():
+            await asyncio.sleep(10)
+        memory.ping.side_effect = hung
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["checks"]["redis"]["error"].startswith("timeout")
+
+    def test_readyz_saturado_por_cola_del_llm(self, app_client, probe, mocker):
+        from app.main import concurrency_limiter
+        _run_checks(probe)
+        mocker.patch("app.main.READYZ_MAX_QUEUE_DEPTH", 4)
+        concurrency_limiter.queue_depth = 4
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["reasons"] == ["queue_depth"]
+
+    def test_readyz_saturado_por_lag_del_loop(self, app_client, probe, mocker):
+        from unittest.mock import MagicMock
+        _run_checks(probe)
+        mocker.patch("app.main.loop_lag", MagicMock(**{"max_lag_between.return_value": 900.0}))
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["reasons"] == ["loop_lag"]
+        assert r.json()["load"]["loop_lag_ms"] == 900.0
+
+    def test_whatsapp_invalido_no_saca_de_rotacion_por_defecto(self, app_client, probe, mocker):
+        from unittest.mock import AsyncMock
+        import app.main as main
+        probe.add("whatsapp", main._check_whatsapp, required="whatsapp" in main.READYZ_REQUIRED_CHECKS)
+        main.whatsapp_client.check_credentials = AsyncMock(side_effect=RuntimeError("timeout de Meta"))
+        _run_checks(probe)
+
+        r = app_client.get("/readyz")
+        assert r.status_code == 200
+        assert r.json()["checks"]["whatsapp"]["status"] == "failed"
+
+
+class TestLifespan:
+
+    def test_lifespan_comparte_un_solo_cliente_redis(self, mocker):
+        """Memory y rate limiter reutilizan el mismo pool de Redis creado al arrancar."""
+        from unittest.mock import AsyncMock, MagicMock
+        import app.main as main
+        from fastapi.testclient import TestClient
+
+        for name in ("SYSTEM_PROMPT", "redis_client", "memory", "rate_limiter", "whatsapp_client", "llm_client", "concurrency_limiter", "sender_lock", "model_router", "intent_matcher", "media_processor", "archive"):
+            mocker.patch.object(main, name, None)
+        redis_mock = MagicMock()
+        redis_mock.aclose = AsyncMock()
+        from_url = mocker.patch("app.main.Redis.from_url", return_value=redis_mock)
+        # Sin chequeos de dependencias: los clientes reales saldrían a la red
+        from app.probes import DependencyProbe
+        mocker.patch.object(main, "dependency_probe", DependencyProbe())
+
+        with TestClient(main.app):
+            assert from_url.call_count == 1
+            assert main.memory._redis is redis_mock
+            assert main.rate_limiter._redis is redis_mock
+            assert main.sender_lock._redis is redis_mock
+            assert type(main.llm_client).__name__ == "GeminiClient"
+
+        redis_mock.aclose.assert_awaited_once()
@@ -0,0 +1,49 @@
+"""
+Tests del envío de texto a WhatsApp — app/whatsapp_client.py
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.whatsapp_client import WHATSAPP_TEXT_LIMIT, WhatsAppClient, split_message
+
+
+def test_texto_corto_no_se_divide():
+    assert split_message("  Hola, ¿en qué te ayudo?  ") == ["Hola, ¿en qué te ayudo?"]
+
+
+def test_texto_largo_se_corta_en_un_salto_de_parrafo():
+    first, second = "Primera parte. " * 20, "Segunda parte. " * 20
+    parts = split_message(first + "\n\n" + second, limit=400)
+
+    assert parts == [first.strip(), second.strip()]
+
+
+def test_sin_parrafos_se_corta_al_final_de_una_oracion():
+    text = "Esta es una oración completa. " * 10
+
+    parts = split_message(text, limit=100)
+
+    assert all(len(part) <= 100 for part in parts)
+    assert all(part.endswith(".") for part in parts)
+    assert " ".join(parts) == text.strip()
+
+
+def test_texto_sin_espacios_se_corta_al_limite():
+    assert [len(part) for part in split_message("x" * 250, limit=100)] == [100, 100, 50]
+
+
+@pytest.mark.asyncio
+async def test_send_text_message_envia_cada_parte_en_orden(mocker):
+    response = MagicMock(is_success=True)
+    response.json.side_effect = [{"messages": [{"id": "wamid.1"}]}, {"messages": [{"id": "wamid.2"}]}]
+    post_mock = AsyncMock(return_value=response)
+    http_client = MagicMock(post=post_mock, is_closed=False)
+    async_client = mocker.patch("app.whatsapp_client.httpx.AsyncClient", return_value=http_client)
+
+    text = "a" * WHATSAPP_TEXT_LIMIT + "\n\n" + "Fin."
+    result = await WhatsAppClient(token="t", phone_id="123").send_text_message("5211", text)
+
+    bodies = [call.kwargs["json"]["text"]["body"] for call in post_mock.await_args_list]
+    assert bodies == ["a" * WHATSAPP_TEXT_LIMIT, "Fin."]
+    assert result["messages"] == [{"id": "wamid.1"}, {"id": "wamid.2"}]
+    assert async_client.call_count == 1
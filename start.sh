@@ -4,6 +4,9 @@ set -euo pipefail
 
 DOMAIN="${DOMAIN:-agonisingly-unapprehended-vernice.ngrok-free.dev}"
 N8N_PORT="${N8N_PORT:-5678}"
+BOT_PORT="${BOT_PORT:-8000}"
+# direct: Meta -> bot (requiere META_APP_SECRET en .env) | n8n: Meta -> n8n -> bot
+WEBHOOK_MODE="${WEBHOOK_MODE:-n8n}"
 NGROK_API_URL="${NGROK_API_URL:-http://127.0.0.1:4040/api/tunnels}"
 NGROK_READY_RETRIES="${NGROK_READY_RETRIES:-20}"
 NGROK_READY_INTERVAL="${NGROK_READY_INTERVAL:-1}"
@@ -28,13 +31,32 @@ require_cmd ngrok
 require_cmd curl
 require_cmd python3
 
-echo "▶ Iniciando contenedores..."
-docker compose -f "$DIR/docker-compose.yml" up -d
+case "$WEBHOOK_MODE" in
+	direct)
+		if ! grep -qE '^META_APP_SECRET=.+' "$DIR/.env" 2>/dev/null; then
+			echo "❌ WEBHOOK_MODE=direct requiere META_APP_SECRET en .env"
+			exit 1
+		fi
+		PUBLIC_PORT="$BOT_PORT"
+		COMPOSE_SERVICES=(redis bot)
+		;;
+	n8n)
+		PUBLIC_PORT="$N8N_PORT"
+		COMPOSE_SERVICES=()
+		;;
+	*)
+		echo "❌ WEBHOOK_MODE debe ser 'direct' o 'n8n' (recibido: $WEBHOOK_MODE)"
+		exit 1
+		;;
+esac
+
+echo "▶ Iniciando contenedores (modo $WEBHOOK_MODE)..."
+docker compose -f "$DIR/docker-compose.yml" up -d ${COMPOSE_SERVICES[@]+"${COMPOSE_SERVICES[@]}"}
 
 echo "▶ Iniciando ngrok en dominio fijo..."
 pkill -f "ngrok http" 2>/dev/null || true
 sleep 1
-nohup ngrok http "$N8N_PORT" --domain="$DOMAIN" --log=stdout > /tmp/ngrok.log 2>&1 &
+nohup ngrok http "$PUBLIC_PORT" --domain="$DOMAIN" --log=stdout > /tmp/ngrok.log 2>&1 &
 
 echo "▶ Esperando que ngrok quede operativo..."
 ACTIVE_BASE_URL=""
@@ -67,10 +89,16 @@ echo "▶ Verificando webhook al finalizar arranque..."
 echo ""
 echo "✅ Stack listo"
 echo ""
-echo "   Bot:      http://localhost:8000/health"
-echo "   n8n:      http://localhost:${N8N_PORT}"
+echo "   Bot:      http://localhost:${BOT_PORT}/health"
+if [ "$WEBHOOK_MODE" = "n8n" ]; then
+	echo "   n8n:      http://localhost:${N8N_PORT}"
+fi
 echo "   Webhook:  ${WEBHOOK_URL}"
 echo ""
-echo "   ℹ️  Topología: Meta -> n8n (público) -> bot (interno con x-bot-secret)"
+if [ "$WEBHOOK_MODE" = "direct" ]; then
+	echo "   ℹ️  Topología: Meta -> bot (público, firma X-Hub-Signature-256)"
+else
+	echo "   ℹ️  Topología: Meta -> n8n (público) -> bot (interno con x-bot-secret)"
+fi
 echo "   ⚠️  Si el token de WhatsApp expiró, actualiza WHATSAPP_TOKEN en .env"
 echo "      y luego corre:  docker compose up -d bot"